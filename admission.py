@@ -0,0 +1,176 @@
+import asyncio
+import importlib
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from config import (
+    ADMISSION_MAX_IN_FLIGHT,
+    ADMISSION_QUEUE_TIMEOUT_MS,
+    ADMISSION_RATE_LIMIT_BACKEND,
+    ADMISSION_USER_BURST,
+    ADMISSION_USER_RATE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage for per-key token buckets.
+
+    The default in-memory backend limits each worker process on its own. To
+    enforce one limit across processes or hosts, subclass this with a shared
+    store (e.g. Redis) and name it in ADMISSION_RATE_LIMIT_BACKEND.
+    """
+
+    @abstractmethod
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """
+        Takes one token from key's bucket, which refills at rate tokens per second up to burst.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until one will be available.
+        """
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Token buckets in a dict. Buckets that have refilled completely are pruned once max_keys is exceeded."""
+
+    def __init__(self, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, rate, burst)
+            return wait
+
+    def _prune(self, now: float, rate: float, burst: float):
+        # A full bucket behaves exactly like a missing one, so it can be dropped.
+        self._buckets = {
+            key: (tokens, updated_at) for key, (tokens, updated_at) in self._buckets.items()
+            if tokens + (now - updated_at) * rate < burst
+        }
+
+
+class AdmissionController:
+    """
+    Rejects excess load early instead of letting it queue up in front of Postgres.
+
+    - Each user gets a token bucket of `user_burst` requests refilled at
+      `user_rate` per second; requests over it get 429.
+    - At most `max_in_flight` requests hold a database connection at once per
+      process. A request waits up to `queue_timeout_ms` for a slot, then gets 503.
+
+    Both rejections carry a Retry-After header. Slots are awaited on the event
+    loop, before the request takes a threadpool thread, so max_in_flight must
+    stay below the threadpool size (40) for the 503 to fire before requests
+    queue for a thread instead.
+    """
+
+    def __init__(
+        self,
+        user_rate: float = ADMISSION_USER_RATE,
+        user_burst: float = ADMISSION_USER_BURST,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        queue_timeout_ms: float = ADMISSION_QUEUE_TIMEOUT_MS,
+        backend: Optional[RateLimitBackend] = None,
+    ):
+        self.user_rate = user_rate
+        self.user_burst = max(1.0, user_burst)
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue_timeout = max(0.0, queue_timeout_ms) / 1000
+        self.backend = backend or InMemoryRateLimitBackend()
+        self._slots = asyncio.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+        self._counts = {"admitted": 0, "queued": 0, "rate_limited": 0, "shed": 0}
+        self._in_flight = 0
+
+    def _count(self, name: str, delta: int = 1):
+        with self._lock:
+            self._counts[name] += delta
+
+    def check_user(self, user_id: int):
+        """Takes a token from user_id's bucket, raising 429 if it is empty."""
+        if self.user_rate <= 0:
+            return
+        wait = self.backend.take(f"user:{user_id}", self.user_rate, self.user_burst)
+        if wait > 0:
+            self._count("rate_limited")
+            logger.warning(f"Rate limit exceeded by user_id {user_id}; retry in {wait:.2f}s.")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests.",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+
+    async def acquire(self):
+        """Takes an in-flight slot, waiting at most queue_timeout_ms without blocking the event loop, or raises 503."""
+        if self._slots.locked():
+            self._count("queued")
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._count("shed")
+                logger.warning(f"Shedding request: {self.max_in_flight} requests already in flight.")
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Server is busy, try again shortly.",
+                    headers={"Retry-After": "1"}
+                )
+        else:
+            await self._slots.acquire()
+        with self._lock:
+            self._counts["admitted"] += 1
+            self._in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the counters since startup, plus the requests in flight now."""
+        with self._lock:
+            return {**self._counts, "in_flight": self._in_flight, "max_in_flight": self.max_in_flight}
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def _load_backend(path: str) -> RateLimitBackend:
+    """Builds the RateLimitBackend named by a "module:ClassName" path."""
+    module_name, _, class_name = path.partition(":")
+    backend = getattr(importlib.import_module(module_name), class_name)()
+    if not isinstance(backend, RateLimitBackend):
+        raise TypeError(f"{path} is not a RateLimitBackend.")
+    return backend
+
+
+def get_admission_controller() -> AdmissionController:
+    """Returns the process-wide admission controller, with the backend named in ADMISSION_RATE_LIMIT_BACKEND if any."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            backend = _load_backend(ADMISSION_RATE_LIMIT_BACKEND) if ADMISSION_RATE_LIMIT_BACKEND else None
+            _controller = AdmissionController(backend=backend)
+        return _controller
@@ -0,0 +1,124 @@
+"""
+Compares note insert throughput with and without write batching (group commit).
+
+Runs N concurrent writers against the database configured in `.env`:
+
+- "per-request": each writer uses its own connection and commits every insert,
+  like `DBHandler.create_note` does for each POST /notes.
+- "batched": writers submit through a shared `NoteWriteBatcher`, which
+  coalesces concurrent inserts into multi-row transactions.
+
+The notes are written for a "bench_note_inserts" user, which is deleted with
+its notes when the benchmark ends.
+
+Usage:
+    python -m benchmarks.bench_note_inserts --writers 32 --inserts 200
+"""
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database.connection import start_conn
+from database.db_config import create_tables
+from database.db_handler import DBHandler
+from database.write_batcher import NoteWriteBatcher
+
+logger = logging.getLogger(__name__)
+
+BENCH_USERNAME = "bench_note_inserts"
+
+
+def _drop_bench_user(conn):
+    # Deleting the user cascades to its notes and note statistics.
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM users WHERE username = %s;", (BENCH_USERNAME,))
+    conn.commit()
+
+
+def _bench_user_id() -> int:
+    conn = start_conn()
+    if not conn:
+        raise SystemExit("Could not connect to the database.")
+    try:
+        create_tables(conn)
+        # Left over by a run that was killed before it could clean up.
+        _drop_bench_user(conn)
+        user = DBHandler(conn).create_user(BENCH_USERNAME)
+        return user["user_id"]
+    finally:
+        conn.close()
+
+
+def _cleanup():
+    conn = start_conn()
+    if not conn:
+        logger.warning(f"Could not connect to delete the {BENCH_USERNAME} user and its notes.")
+        return
+    try:
+        _drop_bench_user(conn)
+    finally:
+        conn.close()
+
+
+def run_per_request(user_id: int, writers: int, inserts: int) -> float:
+    """Each writer commits every insert on its own connection. Returns inserts/s."""
+    barrier = threading.Barrier(writers)
+
+    def writer(i: int):
+        conn = start_conn()
+        try:
+            handler = DBHandler(conn)
+            barrier.wait()
+            for n in range(inserts):
+                handler.create_note(user_id, f"bench {i}-{n}", "per-request", None)
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as pool:
+        list(pool.map(writer, range(writers)))
+    return writers * inserts / (time.perf_counter() - start)
+
+
+def run_batched(user_id: int, writers: int, inserts: int, max_batch_size: int, max_wait_ms: float) -> float:
+    """Writers submit through one shared batcher. Returns inserts/s."""
+    batcher = NoteWriteBatcher(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    barrier = threading.Barrier(writers)
+
+    def writer(i: int):
+        barrier.wait()
+        for n in range(inserts):
+            batcher.submit(user_id, f"bench {i}-{n}", "batched", None)
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=writers) as pool:
+            list(pool.map(writer, range(writers)))
+        return writers * inserts / (time.perf_counter() - start)
+    finally:
+        batcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=32, help="Concurrent writer threads.")
+    parser.add_argument("--inserts", type=int, default=200, help="Inserts per writer.")
+    parser.add_argument("--max-batch-size", type=int, default=100)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    user_id = _bench_user_id()
+    try:
+        per_request = run_per_request(user_id, args.writers, args.inserts)
+        print(f"per-request commit: {per_request:10.0f} inserts/s")
+        batched = run_batched(user_id, args.writers, args.inserts, args.max_batch_size, args.max_wait_ms)
+        print(f"batched commit:     {batched:10.0f} inserts/s ({batched / per_request:.1f}x)")
+    finally:
+        _cleanup()
+
+
+if __name__ == "__main__":
+    main()
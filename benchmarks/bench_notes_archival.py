@@ -0,0 +1,142 @@
+"""
+Measures note listing latency and table size before and after archiving old notes.
+
+Loads synthetic notes into the schema `bench_archival` of the database
+configured in `.env`, with update times spread over the last two years, then:
+
+1. measures the default listing (hot notes only) and the table and index sizes;
+2. runs the archival job, moving the notes older than --older-than-days into
+   notes_archive;
+3. measures the default listing again, the `include_archived=true` listing,
+   and the sizes of both tables.
+
+Sizes include TOAST, so the archive's compression shows up in them. The notes
+table is compacted with VACUUM FULL after archiving so its size reflects the
+rows left; in production the freed space is reused by new notes instead.
+
+Usage:
+    python -m benchmarks.bench_notes_archival --rows 2000000 --older-than-days 180
+"""
+import argparse
+import logging
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from database.archive_notes import archive_notes
+from database.connection import start_conn
+from database.db_config import create_tables
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = "bench_archival"
+COLUMNS = "note_id, note_title, note_description, note_tags, created_at, updated_at"
+LISTING_SQL = f"SELECT {COLUMNS} FROM notes WHERE user_id = %s ORDER BY created_at DESC;"
+ARCHIVED_LISTING_SQL = (
+    f"SELECT {COLUMNS} FROM (SELECT user_id, {COLUMNS} FROM notes WHERE user_id = %s "
+    f"UNION ALL SELECT user_id, {COLUMNS} FROM notes_archive WHERE user_id = %s) AS notes ORDER BY created_at DESC;"
+)
+
+
+def _load(conn, rows: int, users: int, chunk: int = 1_000_000):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {SCHEMA};")
+        cur.execute(f"SET search_path TO {SCHEMA};")
+    conn.commit()
+    create_tables(conn)
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO users (username, user_pwd) SELECT 'bench_' || g, 'not_set' FROM generate_series(1, %s) g;",
+            (users,)
+        )
+        for start in range(0, rows, chunk):
+            cur.execute(
+                """
+                INSERT INTO notes (user_id, note_title, note_description, note_tags, created_at, updated_at)
+                SELECT user_id, 'Note ' || g, repeat('lorem ipsum ', 20), 'bench', at, at
+                FROM (
+                    SELECT g, 1 + (random() * (%s - 1))::int AS user_id, now() - random() * interval '730 days' AS at
+                    FROM generate_series(%s, %s) g
+                ) AS generated;
+                """,
+                (users, start + 1, min(start + chunk, rows))
+            )
+            conn.commit()
+            logger.warning(f"{SCHEMA}: loaded {min(start + chunk, rows)} of {rows} notes.")
+        cur.execute("ANALYZE notes;")
+    conn.commit()
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    cuts = statistics.quantiles(samples, n=100)
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def _listing(conn, sql: str, users: int, queries: int, params_per_user: int) -> Dict[str, float]:
+    rng = random.Random(42)
+    samples = []
+    with conn.cursor() as cur:
+        for _ in range(queries):
+            user_id = rng.randint(1, users)
+            start = time.perf_counter()
+            cur.execute(sql, (user_id,) * params_per_user)
+            cur.fetchall()
+            samples.append((time.perf_counter() - start) * 1000)
+    conn.commit()
+    return _percentiles(samples)
+
+
+def _size_mb(conn, table: str) -> Dict[str, float]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_table_size(%s::regclass), pg_indexes_size(%s::regclass);", (table, table))
+        table_bytes, index_bytes = cur.fetchone()
+    conn.commit()
+    return {"table": table_bytes / 2**20, "indexes": index_bytes / 2**20}
+
+
+def _report(label: str, listing: Dict[str, float], size: Dict[str, float]):
+    print(
+        f"{label:28} listing p50 {listing['p50']:7.2f} ms  p95 {listing['p95']:7.2f} ms  p99 {listing['p99']:7.2f} ms | "
+        f"table {size['table']:8.0f} MB  indexes {size['indexes']:7.0f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--older-than-days", type=float, default=180)
+    parser.add_argument("--queries", type=int, default=2000, help="Listing queries per measurement.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    conn = start_conn()
+    if not conn:
+        raise SystemExit("Could not connect to the database.")
+    try:
+        _load(conn, args.rows, args.users)
+        _report("before: notes", _listing(conn, LISTING_SQL, args.users, args.queries, 1), _size_mb(conn, "notes"))
+
+        start = time.perf_counter()
+        archived = archive_notes(conn, args.older_than_days, batch_size=10_000)
+        print(f"archived {archived} of {args.rows} notes in {time.perf_counter() - start:.1f} s")
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM (FULL, ANALYZE) notes;")
+            cur.execute("ANALYZE notes_archive;")
+        conn.autocommit = False
+
+        _report("after: notes", _listing(conn, LISTING_SQL, args.users, args.queries, 1), _size_mb(conn, "notes"))
+        _report(
+            "after: include_archived",
+            _listing(conn, ARCHIVED_LISTING_SQL, args.users, args.queries, 2),
+            _size_mb(conn, "notes_archive")
+        )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Compares note listing and insert latency on a plain vs a hash-partitioned notes table.
+
+Builds both layouts side by side in the schemas `bench_plain` and
+`bench_partitioned` of the database configured in `.env`, loads the same
+synthetic data into each and then measures:
+
+- listing: the `get_notes_by_user_id` query for random users;
+- insert: single-row inserts, each committed, like POST /notes.
+
+The plain table gets the same (user_id, created_at) index as the partitioned one,
+so the comparison isolates the effect of partitioning. Loading 10M+ rows takes a
+while and a few GB of disk; use --keep to reuse loaded schemas on later runs.
+
+Usage:
+    python -m benchmarks.bench_notes_partitioning --rows 10000000 --partitions 16
+"""
+import argparse
+import logging
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from database.connection import start_conn
+from database.db_config import create_tables
+
+logger = logging.getLogger(__name__)
+
+LISTING_SQL = "SELECT note_id, note_title, note_description, note_tags, created_at FROM notes WHERE user_id = %s ORDER BY created_at DESC;"
+
+
+def _load(conn, schema: str, partitions: int, rows: int, users: int, chunk: int = 1_000_000):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {schema};")
+        cur.execute(f"SET search_path TO {schema};")
+    conn.commit()
+    create_tables(conn, partitions=partitions)
+    with conn.cursor() as cur:
+        if partitions == 0:
+            cur.execute("CREATE INDEX notes_user_created_idx ON notes (user_id, created_at DESC);")
+        cur.execute(
+            "INSERT INTO users (username, user_pwd) SELECT 'bench_' || g, 'not_set' FROM generate_series(1, %s) g;",
+            (users,)
+        )
+        for start in range(0, rows, chunk):
+            cur.execute(
+                """
+                INSERT INTO notes (user_id, note_title, note_description, note_tags, created_at)
+                SELECT 1 + (random() * (%s - 1))::int, 'Note ' || g, repeat('lorem ipsum ', 20), 'bench',
+                       now() - random() * interval '365 days'
+                FROM generate_series(%s, %s) g;
+                """,
+                (users, start + 1, min(start + chunk, rows))
+            )
+            conn.commit()
+            logger.warning(f"{schema}: loaded {min(start + chunk, rows)} of {rows} notes.")
+        cur.execute("ANALYZE notes;")
+    conn.commit()
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    cuts = statistics.quantiles(samples, n=100)
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def _measure(conn, schema: str, users: int, queries: int, inserts: int) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(42)
+    with conn.cursor() as cur:
+        cur.execute(f"SET search_path TO {schema};")
+        listing = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            cur.execute(LISTING_SQL, (rng.randint(1, users),))
+            cur.fetchall()
+            listing.append((time.perf_counter() - start) * 1000)
+        conn.commit()
+
+        insert = []
+        for n in range(inserts):
+            start = time.perf_counter()
+            cur.execute(
+                "INSERT INTO notes (user_id, note_title, note_description) VALUES (%s, %s, %s) RETURNING note_id;",
+                (rng.randint(1, users), f"bench insert {n}", "x")
+            )
+            cur.fetchone()
+            conn.commit()
+            insert.append((time.perf_counter() - start) * 1000)
+
+        cur.execute(
+            """
+            SELECT COALESCE(sum(pg_table_size(c.oid)), 0), COALESCE(sum(pg_indexes_size(c.oid)), 0)
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relkind = 'r' AND c.relname LIKE 'notes%%';
+            """,
+            (schema,)
+        )
+        table_bytes, index_bytes = cur.fetchone()
+    conn.commit()
+    return {
+        "listing_ms": _percentiles(listing),
+        "insert_ms": _percentiles(insert),
+        "size_mb": {"table": table_bytes / 2**20, "indexes": index_bytes / 2**20},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=2000, help="Listing queries per layout.")
+    parser.add_argument("--inserts", type=int, default=2000, help="Committed inserts per layout.")
+    parser.add_argument("--keep", action="store_true", help="Reuse the schemas loaded by a previous run.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    conn = start_conn()
+    if not conn:
+        raise SystemExit("Could not connect to the database.")
+    try:
+        layouts = (("bench_plain", 0), ("bench_partitioned", args.partitions))
+        if not args.keep:
+            for schema, partitions in layouts:
+                _load(conn, schema, partitions, args.rows, args.users)
+        for schema, _ in layouts:
+            result = _measure(conn, schema, args.users, args.queries, args.inserts)
+            listing, insert, size = result["listing_ms"], result["insert_ms"], result["size_mb"]
+            print(
+                f"{schema:18} listing p50 {listing['p50']:7.2f} ms  p95 {listing['p95']:7.2f} ms  p99 {listing['p99']:7.2f} ms | "
+                f"insert p50 {insert['p50']:6.2f} ms  p95 {insert['p95']:6.2f} ms | "
+                f"table {size['table']:8.0f} MB  indexes {size['indexes']:7.0f} MB"
+            )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Replays traffic captured by TrafficCaptureMiddleware against a running API.
+
+Reads the capture-*.jsonl files (rotated ones included) of a capture
+directory, orders the requests by capture time and sends them to --target,
+keeping their original spacing divided by --speed (--speed 0 sends them as
+fast as --concurrency allows). Captured requests were authenticated with
+tokens that aren't stored; each one is re-signed for the same user id with
+the SECRET_TOKEN of this environment, which must match the target's.
+
+Reports the latency distribution per route next to the captured one, how far
+the replay fell behind its schedule, and every response whose status differs
+from the captured one (--compare-bodies also compares response digests, which
+only makes sense against a copy of the captured database). Requests whose body
+was too large to capture are skipped.
+
+Usage:
+    python -m benchmarks.replay_traffic captures --target http://localhost:8000 --speed 2 --concurrency 32
+"""
+import argparse
+import asyncio
+import base64
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import httpx
+
+from config import SECRET_TOKEN
+from middleware.capture import REDACTED
+
+logger = logging.getLogger(__name__)
+
+# How many mismatches are listed in the report; all of them are counted.
+MAX_LISTED_MISMATCHES = 20
+
+
+def load_capture(path: str) -> List[Dict[str, Any]]:
+    """Reads the replayable requests of a capture file or directory, in capture order."""
+    files = sorted(glob.glob(os.path.join(path, "capture-*.jsonl*"))) if os.path.isdir(path) else [path]
+    records = []
+    for name in files:
+        with open(name, encoding="utf-8") as capture:
+            for number, line in enumerate(capture, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A worker killed mid-write leaves a partial last line.
+                    logger.warning(f"Skipping unreadable line {number} of {name}.")
+                    continue
+                if not record.get("body_truncated"):
+                    records.append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def route_of(record: Dict[str, Any]) -> str:
+    """Groups requests by method and path, with numeric ids replaced by {id}."""
+    return f"{record['method']} {re.sub(r'/[0-9]+(?=/|$)', '/{id}', record['path'])}"
+
+
+def _request_args(record: Dict[str, Any]) -> Dict[str, Any]:
+    headers = {name: value for name, value in record.get("headers", {}).items() if value != REDACTED}
+    if record.get("user_id") is not None:
+        headers["authorization"] = f"{SECRET_TOKEN} id={record['user_id']}"
+    body = record.get("body", "")
+    content = base64.b64decode(body) if record.get("body_encoding") == "base64" else body.encode("utf-8")
+    url = record["path"] + (f"?{record['query']}" if record.get("query") else "")
+    return {"method": record["method"], "url": url, "headers": headers, "content": content}
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    return {name: ordered[min(len(ordered) - 1, int(len(ordered) * cut))] for name, cut in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+
+
+async def replay(records: List[Dict[str, Any]], client: httpx.AsyncClient, speed: float = 1.0, concurrency: int = 16,
+                 compare_bodies: bool = False) -> Dict[str, Any]:
+    """
+    Sends records through client on their captured schedule and compares the responses.
+
+    Returns:
+        dict: {"routes": {route: {"count", "replayed_ms", "captured_ms", "mismatches", "errors"}},
+               "total": {...same keys}, "lag_ms": percentiles of how late requests were sent,
+               "mismatches": [{"route", "method", "url", "expected", "got"}], "duration_s": float}
+    """
+    slots = asyncio.Semaphore(max(1, concurrency))
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    captured: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    mismatched: Dict[str, int] = defaultdict(int)
+    mismatches: List[Dict[str, Any]] = []
+    lags: List[float] = []
+
+    async def send(record: Dict[str, Any]):
+        route = route_of(record)
+        try:
+            # A malformed record counts as an error instead of ending the whole replay.
+            args = _request_args(record)
+            started = time.perf_counter()
+            response = await client.request(**args)
+            latencies[route].append((time.perf_counter() - started) * 1000)
+        except (httpx.HTTPError, KeyError, TypeError, ValueError) as exc:
+            errors[route] += 1
+            logger.warning(f"{record.get('method')} {record.get('path')} failed: {exc!r}")
+            return
+        finally:
+            slots.release()
+        captured[route].append(record["duration_ms"])
+        expected: Dict[str, Any] = {"status": record["status"]}
+        got: Dict[str, Any] = {"status": response.status_code}
+        if compare_bodies and "response_sha256" in record:
+            expected["response_sha256"] = record["response_sha256"]
+            got["response_sha256"] = hashlib.sha256(response.content).hexdigest()
+        if expected != got:
+            mismatched[route] += 1
+            mismatches.append({"route": route, "method": args["method"], "url": args["url"], "expected": expected, "got": got})
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    first_ts = records[0]["ts"] if records else 0.0
+    tasks = []
+    for record in records:
+        due = (record["ts"] - first_ts) / speed if speed > 0 else 0.0
+        delay = due - (loop.time() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await slots.acquire()
+        lags.append(max(0.0, loop.time() - start - due) * 1000)
+        tasks.append(asyncio.create_task(send(record)))
+    await asyncio.gather(*tasks)
+    duration = loop.time() - start
+
+    def summary(routes: List[str]) -> Dict[str, Any]:
+        return {
+            "count": sum(len(latencies[route]) + errors[route] for route in routes),
+            "replayed_ms": _percentiles([ms for route in routes for ms in latencies[route]]),
+            "captured_ms": _percentiles([ms for route in routes for ms in captured[route]]),
+            "mismatches": sum(mismatched[route] for route in routes),
+            "errors": sum(errors[route] for route in routes),
+        }
+
+    routes = sorted({route_of(record) for record in records})
+    return {
+        "routes": {route: summary([route]) for route in routes},
+        "total": summary(routes),
+        "lag_ms": _percentiles(lags),
+        "mismatches": mismatches,
+        "duration_s": duration,
+    }
+
+
+def _print_report(report: Dict[str, Any]):
+    print(f"{'route':36} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'captured p50':>13} {'mismatch':>9} {'errors':>7}")
+    rows = list(report["routes"].items()) + [("total", report["total"])]
+    for route, stats in rows:
+        replayed, captured = stats["replayed_ms"], stats["captured_ms"]
+        print(
+            f"{route[:36]:36} {stats['count']:6} {replayed['p50']:8.2f} {replayed['p95']:8.2f} {replayed['p99']:8.2f} "
+            f"{captured['p50']:13.2f} {stats['mismatches']:9} {stats['errors']:7}"
+        )
+    lag = report["lag_ms"]
+    print(f"replayed in {report['duration_s']:.1f} s; schedule lag p50 {lag['p50']:.1f} ms  p99 {lag['p99']:.1f} ms")
+    for mismatch in report["mismatches"][:MAX_LISTED_MISMATCHES]:
+        print(f"mismatch: {mismatch['method']} {mismatch['url']} expected {mismatch['expected']} got {mismatch['got']}")
+    if len(report["mismatches"]) > MAX_LISTED_MISMATCHES:
+        print(f"... and {len(report['mismatches']) - MAX_LISTED_MISMATCHES} more mismatches.")
+
+
+async def _run(args) -> Dict[str, Any]:
+    records = load_capture(args.capture)
+    if not records:
+        raise SystemExit(f"No replayable requests found in {args.capture}.")
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.target, timeout=args.timeout, limits=limits) as client:
+        return await replay(records, client, args.speed, args.concurrency, args.compare_bodies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="Capture directory (TRAFFIC_CAPTURE_DIR) or a single capture file.")
+    parser.add_argument("--target", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier; 0 replays as fast as possible.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum requests in flight.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for each response.")
+    parser.add_argument("--compare-bodies", action="store_true", help="Also report responses whose body differs.")
+    parser.add_argument("--fail-on-mismatch", action="store_true", help="Exit with status 1 if any response differs.")
+    args = parser.parse_args()
+    if args.speed < 0 or args.concurrency < 1:
+        raise SystemExit("--speed must be at least 0 and --concurrency at least 1.")
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(_run(args))
+    _print_report(report)
+    if args.fail_on_mismatch and (report["mismatches"] or report["total"]["errors"]):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
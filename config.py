@@ -11,12 +11,99 @@ POSTGRES_DB = os.getenv("POSTGRES_DB")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", 5432)
 
+# DSN do primário (opcional, tem precedência sobre as variáveis acima) e DSNs das réplicas de leitura,
+# separados por ";". Sem réplicas, todas as leituras vão para o primário.
+POSTGRES_PRIMARY_DSN = os.getenv("POSTGRES_PRIMARY_DSN")
+POSTGRES_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv("POSTGRES_REPLICA_DSNS", "").split(";") if dsn.strip()]
+# Janela em que as leituras de um usuário só vão para réplicas que já aplicaram a sua última escrita
+READ_YOUR_WRITES_WINDOW_SECONDS = float(os.getenv("READ_YOUR_WRITES_WINDOW_SECONDS", 10))
+# Tempo em que uma réplica com falha fica fora da seleção antes de ser tentada novamente
+REPLICA_RETRY_AFTER_SECONDS = float(os.getenv("REPLICA_RETRY_AFTER_SECONDS", 30))
+
+# Fragmentação (sharding) das notas por user_id: DSNs dos nós, separados por ";".
+# A posição de cada DSN é o índice do nó, então novos nós só podem ser adicionados ao final.
+POSTGRES_SHARD_DSNS = [dsn.strip() for dsn in os.getenv("POSTGRES_SHARD_DSNS", "").split(";") if dsn.strip()]
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", 64))
+# Os ids de notas de cada nó seguem a sequência índice + 1, índice + 1 + passo, ..., para não colidirem entre nós
+SHARD_NOTE_ID_STRIDE = int(os.getenv("SHARD_NOTE_ID_STRIDE", 1024))
+
 # Configurações do Banco de Dados de Teste (usado pelo pytest)
 TEST_POSTGRES_USER = os.getenv("TEST_POSTGRES_USER")
 TEST_POSTGRES_PASSWORD = os.getenv("TEST_POSTGRES_PASSWORD")
 TEST_POSTGRES_DB = os.getenv("TEST_POSTGRES_DB")
 TEST_POSTGRES_HOST = os.getenv("TEST_POSTGRES_HOST")
 TEST_POSTGRES_PORT = os.getenv("TEST_POSTGRES_PORT", 5433)
+# DSNs de bancos de teste usados como nós de sharding, separados por ";" (opcional)
+TEST_POSTGRES_SHARD_DSNS = [dsn.strip() for dsn in os.getenv("TEST_POSTGRES_SHARD_DSNS", "").split(";") if dsn.strip()]
 
 # Segredo da Aplicação
-SECRET_TOKEN = os.getenv("SECRET_TOKEN")
\ No newline at end of file
+SECRET_TOKEN = os.getenv("SECRET_TOKEN")
+
+# Número de partições (por hash de user_id) da tabela de notas; 0 mantém uma tabela única
+NOTES_PARTITIONS = int(os.getenv("NOTES_PARTITIONS", 0))
+
+# Agrupamento de escritas (group commit) na criação de notas
+NOTES_WRITE_BATCHING = os.getenv("NOTES_WRITE_BATCHING", "false").lower() == "true"
+NOTES_BATCH_MAX_SIZE = int(os.getenv("NOTES_BATCH_MAX_SIZE", 100))
+NOTES_BATCH_MAX_WAIT_MS = float(os.getenv("NOTES_BATCH_MAX_WAIT_MS", 5))
+
+# Sincronização incremental (GET /notes/changes): margem, em segundos, subtraída do token
+# para reenviar mudanças cuja transação confirmou logo depois de o token ser gerado
+NOTES_SYNC_OVERLAP_SECONDS = float(os.getenv("NOTES_SYNC_OVERLAP_SECONDS", 5))
+
+# Envio de mudanças em tempo real (GET /notes/stream): eventos pendentes por assinante antes de
+# descartá-los e pedir uma nova sincronização, e intervalo entre heartbeats
+NOTES_STREAM_QUEUE_SIZE = int(os.getenv("NOTES_STREAM_QUEUE_SIZE", 100))
+NOTES_STREAM_HEARTBEAT_SECONDS = float(os.getenv("NOTES_STREAM_HEARTBEAT_SECONDS", 15))
+
+# Controle de admissão: limite por usuário (requisições por segundo e rajada máxima; 0 desativa)
+ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", 50))
+ADMISSION_USER_BURST = float(os.getenv("ADMISSION_USER_BURST", 100))
+# Armazenamento compartilhado dos limites por usuário, no formato "modulo:Classe" (uma subclasse de
+# RateLimitBackend); vazio mantém os limites em memória, por processo
+ADMISSION_RATE_LIMIT_BACKEND = os.getenv("ADMISSION_RATE_LIMIT_BACKEND", "")
+# Máximo de requisições usando o banco ao mesmo tempo por processo, e quanto uma requisição
+# espera por uma vaga antes de receber 503. Deve ficar abaixo das 40 threads do threadpool,
+# senão as requisições esperam por uma thread em vez de receber 503
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 32))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", 100))
+
+# Pool de conexões de cada processo da aplicação, criado na inicialização (um pool por banco).
+# Com vários workers, o total de conexões é workers x DB_POOL_MAX_SIZE por banco.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", ADMISSION_MAX_IN_FLIGHT))
+
+# Token exigido no cabeçalho X-Metrics-Token por GET /metrics; vazio desativa a rota
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Chaves de idempotência (cabeçalho Idempotency-Key): por quanto tempo e quantas respostas
+# ficam guardadas em cada processo, e quanto uma repetição concorrente espera pela original
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 30))
+
+# Limites de tempo, em milissegundos, aplicados a cada conexão usada por uma requisição (0 desativa):
+# duração máxima de uma consulta e espera máxima por um lock
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 5000))
+DB_LOCK_TIMEOUT_MS = int(os.getenv("DB_LOCK_TIMEOUT_MS", 2000))
+# Limites por rota, no formato "MÉTODO /caminho=consulta_ms:lock_ms", separados por ";",
+# por exemplo "GET /notes=2000:500;PUT /notes/{note_id}=3000:1000"
+DB_ROUTE_TIMEOUTS = {
+    " ".join(route.split()): tuple(int(ms) for ms in limits.split(":"))
+    for route, limits in (item.split("=", 1) for item in os.getenv("DB_ROUTE_TIMEOUTS", "").split(";") if item.strip())
+}
+
+# Arquivamento: notas sem alterações há mais de NOTES_ARCHIVE_AFTER_DAYS dias são movidas para
+# a tabela notes_archive por `python -m database.archive_notes`
+NOTES_ARCHIVE_AFTER_DAYS = float(os.getenv("NOTES_ARCHIVE_AFTER_DAYS", 180))
+
+# Captura de tráfego (opcional): grava uma amostra das requisições em arquivos JSONL rotativos em
+# TRAFFIC_CAPTURE_DIR, para reproduzi-las depois com `python -m benchmarks.replay_traffic`
+TRAFFIC_CAPTURE = os.getenv("TRAFFIC_CAPTURE", "false").lower() == "true"
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", 0.01))
+TRAFFIC_CAPTURE_DIR = os.getenv("TRAFFIC_CAPTURE_DIR", "captures")
+# Cada processo grava no seu próprio arquivo, que é rotacionado ao passar de TRAFFIC_CAPTURE_MAX_FILE_MB
+TRAFFIC_CAPTURE_MAX_FILE_MB = float(os.getenv("TRAFFIC_CAPTURE_MAX_FILE_MB", 50))
+TRAFFIC_CAPTURE_BACKUPS = int(os.getenv("TRAFFIC_CAPTURE_BACKUPS", 5))
+# Corpos de requisição maiores que isso não são gravados por inteiro, e a requisição não é reproduzida
+TRAFFIC_CAPTURE_MAX_BODY_BYTES = int(os.getenv("TRAFFIC_CAPTURE_MAX_BODY_BYTES", 65536))
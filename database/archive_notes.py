@@ -0,0 +1,128 @@
+"""
+Moves notes that haven't changed for a while from `notes` to `notes_archive`.
+
+Keeps the hot notes table and its indexes small: default listings only read
+`notes`, and `include_archived=true` reads both tables. Runs on the primary and
+on every shard node in POSTGRES_SHARD_DSNS.
+
+The notes are walked in note_id order, batch_size ids at a time. Each batch is
+one short transaction that deletes the old notes of the batch from `notes` and
+inserts them into `notes_archive` in the same statement. Notes locked by a
+running request, or belonging to a user the resharding tool is moving, are
+skipped and archived on a later run. Archiving doesn't change the note
+statistics, and changing an archived note through the API moves it back.
+
+Each archived note is announced on the note event stream with op "archive",
+and delta syncs without include_archived report it as deleted, so clients
+that only keep recent notes drop it.
+
+Usage:
+    python -m database.archive_notes --older-than-days 180 --batch-size 1000
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extensions import connection as Connection
+
+from config import NOTES_ARCHIVE_AFTER_DAYS, POSTGRES_SHARD_DSNS
+from database.connection import connect_dsn, start_conn
+from database.db_handler import NOTE_COLUMNS
+from database.note_events import NOTE_EVENTS_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+
+def _archive_batch(conn: Connection, after_note_id: int, last_note_id: int, cutoff: datetime) -> int:
+    with conn.cursor() as cur:
+        # Tells the statistics triggers that these deletes and inserts are only a move.
+        cur.execute("SELECT set_config('notes.archiving', 'on', true);")
+        # The shared advisory lock is the one note writes take; the resharding tool holds it
+        # exclusively while it moves a user, and those users' notes are skipped.
+        cur.execute(
+            f"""
+            WITH batch AS (
+                SELECT user_id, note_id FROM notes
+                WHERE note_id > %s AND note_id <= %s AND updated_at < %s
+                  AND pg_try_advisory_xact_lock_shared(user_id)
+                FOR UPDATE SKIP LOCKED
+            ), moved AS (
+                DELETE FROM notes WHERE (user_id, note_id) IN (SELECT user_id, note_id FROM batch)
+                RETURNING {NOTE_COLUMNS}
+            ), archived AS (
+                INSERT INTO notes_archive ({NOTE_COLUMNS}) SELECT {NOTE_COLUMNS} FROM moved
+                RETURNING user_id, note_id
+            )
+            SELECT count(pg_notify(%s, json_build_object('user_id', user_id, 'op', 'archive', 'note_id', note_id)::text))
+            FROM archived;
+            """,
+            (after_note_id, last_note_id, cutoff, NOTE_EVENTS_CHANNEL)
+        )
+        archived = cur.fetchone()[0]
+    conn.commit()
+    return archived
+
+
+def archive_notes(conn: Connection, older_than_days: float = NOTES_ARCHIVE_AFTER_DAYS, batch_size: int = 1000,
+                  pause: float = 0.0) -> int:
+    """Archives the notes on conn's node not updated for older_than_days days. Returns how many were moved."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT clock_timestamp() - make_interval(secs => %s);", (older_than_days * 86400,))
+        cutoff = cur.fetchone()[0]
+    conn.commit()
+
+    archived = 0
+    last_note_id = 0
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT max(note_id) FROM (SELECT note_id FROM notes WHERE note_id > %s ORDER BY note_id LIMIT %s) AS page;",
+                    (last_note_id, batch_size)
+                )
+                upper = cur.fetchone()[0]
+            conn.commit()
+            if upper is None:
+                break
+            archived += _archive_batch(conn, last_note_id, upper, cutoff)
+            last_note_id = upper
+            if pause:
+                time.sleep(pause)
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    logger.info(f"Archived {archived} notes last updated before {cutoff.isoformat()}.")
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than-days", type=float, default=NOTES_ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Note ids scanned per transaction.")
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        raise SystemExit("--batch-size must be at least 1.")
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    nodes = [("primary", start_conn)] + [
+        (f"shard {index}", lambda dsn=dsn: connect_dsn(dsn)) for index, dsn in enumerate(POSTGRES_SHARD_DSNS)
+    ]
+    for name, connect in nodes:
+        conn = connect()
+        if not conn:
+            raise SystemExit(f"Could not connect to the {name} database.")
+        try:
+            logger.info(f"Archiving old notes on the {name} database.")
+            archive_notes(conn, args.older_than_days, args.batch_size, args.pause)
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
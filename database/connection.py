@@ -1,12 +1,14 @@
 import psycopg2
 import logging
 
-from config import POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DB, POSTGRES_PORT, POSTGRES_HOST
+from config import POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DB, POSTGRES_PORT, POSTGRES_HOST, POSTGRES_PRIMARY_DSN
 
 logger = logging.getLogger(__name__)
 
 def start_conn()-> psycopg2.extensions.connection:
     """Establishes and returns a self.connection to the PostgreSQL database."""
+    if POSTGRES_PRIMARY_DSN:
+        return connect_dsn(POSTGRES_PRIMARY_DSN)
     try:
         conn = psycopg2.connect(
             dbname=POSTGRES_DB,
@@ -20,7 +22,15 @@ def start_conn()-> psycopg2.extensions.connection:
         # Log the exception with traceback for detailed debugging
         logger.error("Could not self.connect to the database. Is it running?", exc_info=True)
         return None
+
+def connect_dsn(dsn: str) -> psycopg2.extensions.connection:
+    """Establishes and returns a connection to the PostgreSQL server described by a DSN, or None on failure."""
+    try:
+        return psycopg2.connect(dsn)
+    except psycopg2.OperationalError:
+        logger.error("Could not connect to the database at the configured DSN.", exc_info=True)
+        return None
     
 
     
-    
\ No newline at end of file
+    
@@ -1,12 +1,272 @@
 import logging
 import psycopg2
+from typing import List, Optional
 
-from database.connection import start_conn
+from config import NOTES_PARTITIONS, POSTGRES_SHARD_DSNS, SHARD_NOTE_ID_STRIDE
+from database.connection import start_conn, connect_dsn
 
 logger = logging.getLogger(__name__)
 
-def create_tables(conn: psycopg2.extensions.connection):
-    """Creates the users and notes tables in the database if they don't exist."""
+def notes_table_commands(table: str = "notes", partitions: int = 0) -> List[str]:
+    """
+    Returns the statements that create the notes table under the given name.
+
+    With partitions > 0 the table is hash-partitioned on user_id into that many
+    partitions named notes_p0, notes_p1, ... Its primary key must then include
+    user_id, and note ids come from the shared notes_note_id_seq sequence.
+
+    updated_at defaults to clock_timestamp() rather than the transaction start,
+    so a change is stamped close to its commit; GET /notes/changes relies on it.
+    """
+    if partitions <= 0:
+        return [
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                note_id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                note_title VARCHAR(255) NOT NULL,
+                note_description TEXT,
+                note_tags VARCHAR(255),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp(),
+                CONSTRAINT fk_user
+                    FOREIGN KEY(user_id)
+                    REFERENCES users(user_id)
+                    ON DELETE CASCADE
+            )
+            """,
+            *notes_upgrade_commands(table),
+            f"CREATE INDEX IF NOT EXISTS {table}_user_updated_idx ON {table} (user_id, updated_at)",
+        ]
+    return [
+        "CREATE SEQUENCE IF NOT EXISTS notes_note_id_seq AS INTEGER",
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            note_id INTEGER NOT NULL DEFAULT nextval('notes_note_id_seq'),
+            user_id INTEGER NOT NULL,
+            note_title VARCHAR(255) NOT NULL,
+            note_description TEXT,
+            note_tags VARCHAR(255),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp(),
+            PRIMARY KEY (user_id, note_id),
+            CONSTRAINT fk_user
+                FOREIGN KEY(user_id)
+                REFERENCES users(user_id)
+                ON DELETE CASCADE
+        ) PARTITION BY HASH (user_id)
+        """,
+        *notes_upgrade_commands(table),
+        *[
+            f"CREATE TABLE IF NOT EXISTS notes_p{remainder} PARTITION OF {table} "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+            for remainder in range(partitions)
+        ],
+        f"CREATE INDEX IF NOT EXISTS notes_user_created_idx ON {table} (user_id, created_at DESC)",
+        f"CREATE INDEX IF NOT EXISTS notes_note_id_idx ON {table} (note_id)",
+        f"CREATE INDEX IF NOT EXISTS {table}_user_updated_idx ON {table} (user_id, updated_at)",
+        *([f"ALTER SEQUENCE notes_note_id_seq OWNED BY {table}.note_id"] if table == "notes" else []),
+    ]
+
+def notes_upgrade_commands(table: str = "notes") -> List[str]:
+    """
+    Returns the statements that add columns introduced after the notes table was first created.
+
+    Adding a column with a constant default doesn't rewrite the table: existing
+    rows read the CURRENT_TIMESTAMP of the upgrade. New rows then get clock_timestamp().
+    """
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP",
+        f"ALTER TABLE {table} ALTER COLUMN updated_at SET DEFAULT clock_timestamp()",
+    ]
+
+def note_stats_table_commands(user_fk: bool = True) -> List[str]:
+    """
+    Returns the statements that create the per-user note statistics tables.
+
+    They live next to the notes they count: on the primary, where the rows
+    reference users, and on each shard node, where there is no users table.
+    """
+    user_ref = " REFERENCES users(user_id) ON DELETE CASCADE" if user_fk else ""
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS user_note_stats (
+            user_id INTEGER PRIMARY KEY{user_ref},
+            note_count INTEGER NOT NULL DEFAULT 0,
+            last_activity_at TIMESTAMP WITH TIME ZONE
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS user_tag_stats (
+            user_id INTEGER NOT NULL{user_ref},
+            tag TEXT NOT NULL,
+            note_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, tag)
+        )
+        """,
+        # Tags are stored as one comma-separated string; they are counted trimmed and lowercased.
+        """
+        CREATE OR REPLACE FUNCTION note_tag_list(tags TEXT) RETURNS SETOF TEXT AS $$
+            SELECT DISTINCT lower(btrim(tag)) FROM regexp_split_to_table(coalesce(tags, ''), ',') AS tag
+            WHERE btrim(tag) <> ''
+        $$ LANGUAGE sql IMMUTABLE
+        """,
+    ]
+
+def note_stats_trigger_commands(table: str = "notes") -> List[str]:
+    """
+    Returns the statements that keep user_note_stats and user_tag_stats up to date on writes to table.
+
+    They are installed on notes and on notes_archive, so archived notes still count.
+
+    The triggers run once per statement and aggregate its rows per user, so a
+    multi-row insert updates each user's counters once. They run in the
+    writing transaction, so the counters commit or roll back with the notes.
+    Deletes only update existing rows: when a user is deleted, the cascade
+    removes their statistics as well.
+    """
+    return [
+        """
+        CREATE OR REPLACE FUNCTION notes_maintain_stats() RETURNS trigger AS $$
+        BEGIN
+            -- The archival job only moves notes between notes and notes_archive, which changes no counter.
+            IF current_setting('notes.archiving', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO user_note_stats AS s (user_id, note_count, last_activity_at)
+                SELECT user_id, count(*), max(updated_at) FROM new_notes GROUP BY user_id ORDER BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET
+                    note_count = s.note_count + EXCLUDED.note_count,
+                    last_activity_at = greatest(s.last_activity_at, EXCLUDED.last_activity_at);
+                INSERT INTO user_tag_stats AS t (user_id, tag, note_count)
+                SELECT user_id, tag, count(*) FROM new_notes, note_tag_list(note_tags) AS tag
+                GROUP BY user_id, tag ORDER BY user_id, tag
+                ON CONFLICT (user_id, tag) DO UPDATE SET note_count = t.note_count + EXCLUDED.note_count;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO user_note_stats AS s (user_id, note_count, last_activity_at)
+                SELECT user_id, 0, max(updated_at) FROM new_notes GROUP BY user_id ORDER BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET
+                    last_activity_at = greatest(s.last_activity_at, EXCLUDED.last_activity_at);
+                INSERT INTO user_tag_stats AS t (user_id, tag, note_count)
+                SELECT user_id, tag, sum(delta) FROM (
+                    SELECT user_id, tag, 1 AS delta FROM new_notes, note_tag_list(note_tags) AS tag
+                    UNION ALL
+                    SELECT user_id, tag, -1 FROM old_notes, note_tag_list(note_tags) AS tag
+                ) AS changes
+                GROUP BY user_id, tag HAVING sum(delta) <> 0 ORDER BY user_id, tag
+                ON CONFLICT (user_id, tag) DO UPDATE SET note_count = t.note_count + EXCLUDED.note_count;
+                DELETE FROM user_tag_stats WHERE note_count <= 0 AND user_id IN (SELECT user_id FROM new_notes);
+            ELSE
+                UPDATE user_note_stats AS s
+                SET note_count = s.note_count - d.note_count, last_activity_at = clock_timestamp()
+                FROM (SELECT user_id, count(*) AS note_count FROM old_notes GROUP BY user_id) AS d
+                WHERE s.user_id = d.user_id;
+                UPDATE user_tag_stats AS t
+                SET note_count = t.note_count - d.note_count
+                FROM (
+                    SELECT user_id, tag, count(*) AS note_count FROM old_notes, note_tag_list(note_tags) AS tag
+                    GROUP BY user_id, tag
+                ) AS d
+                WHERE t.user_id = d.user_id AND t.tag = d.tag;
+                DELETE FROM user_tag_stats WHERE note_count <= 0 AND user_id IN (SELECT user_id FROM old_notes);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # A trigger with transition tables can only handle one kind of event.
+        f"DROP TRIGGER IF EXISTS notes_stats_insert ON {table}",
+        f"""
+        CREATE TRIGGER notes_stats_insert AFTER INSERT ON {table}
+        REFERENCING NEW TABLE AS new_notes
+        FOR EACH STATEMENT EXECUTE FUNCTION notes_maintain_stats()
+        """,
+        f"DROP TRIGGER IF EXISTS notes_stats_update ON {table}",
+        f"""
+        CREATE TRIGGER notes_stats_update AFTER UPDATE ON {table}
+        REFERENCING OLD TABLE AS old_notes NEW TABLE AS new_notes
+        FOR EACH STATEMENT EXECUTE FUNCTION notes_maintain_stats()
+        """,
+        f"DROP TRIGGER IF EXISTS notes_stats_delete ON {table}",
+        f"""
+        CREATE TRIGGER notes_stats_delete AFTER DELETE ON {table}
+        REFERENCING OLD TABLE AS old_notes
+        FOR EACH STATEMENT EXECUTE FUNCTION notes_maintain_stats()
+        """,
+    ]
+
+def notes_archive_commands(user_fk: bool = True) -> List[str]:
+    """
+    Returns the statements that create notes_archive, where the archival job moves old notes.
+
+    Once a row passes Postgres' fixed TOAST threshold of about 2 kB, its long
+    values are compressed and moved out of line until the row fits in 128 bytes
+    (toast_tuple_target) rather than 2 kB, so long archived notes leave the heap
+    almost entirely. Shorter rows are stored as they are.
+    """
+    user_ref = " REFERENCES users(user_id) ON DELETE CASCADE" if user_fk else ""
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS notes_archive (
+            note_id BIGINT PRIMARY KEY,
+            user_id INTEGER NOT NULL{user_ref},
+            note_title VARCHAR(255) NOT NULL,
+            note_description TEXT,
+            note_tags VARCHAR(255),
+            created_at TIMESTAMP WITH TIME ZONE,
+            updated_at TIMESTAMP WITH TIME ZONE,
+            archived_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp()
+        ) WITH (toast_tuple_target = 128)
+        """,
+        "CREATE INDEX IF NOT EXISTS notes_archive_user_updated_idx ON notes_archive (user_id, updated_at)",
+        # Delta syncs of recent notes only report the notes archived since their token as deleted.
+        "CREATE INDEX IF NOT EXISTS notes_archive_user_archived_idx ON notes_archive (user_id, archived_at)",
+        *note_stats_trigger_commands("notes_archive"),
+    ]
+
+def notes_archive_compression_commands(conn: psycopg2.extensions.connection) -> List[str]:
+    """Returns the statement that compresses archived descriptions with lz4, if the server was built with it."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT 'lz4' = ANY(enumvals) FROM pg_settings WHERE name = 'default_toast_compression';")
+        row = cur.fetchone()
+    if row and row[0]:
+        return ["ALTER TABLE notes_archive ALTER COLUMN note_description SET COMPRESSION lz4"]
+    return []
+
+def notes_table_kind(conn: psycopg2.extensions.connection, table: str = "notes") -> Optional[str]:
+    """Returns 'partitioned' or 'plain' for an existing notes table, or None if it doesn't exist."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+        row = cur.fetchone()
+    if not row:
+        return None
+    return "partitioned" if row[0] == "p" else "plain"
+
+def create_tables(conn: psycopg2.extensions.connection, partitions: int = NOTES_PARTITIONS):
+    """
+    Creates the users and notes tables in the database if they don't exist.
+
+    With partitions > 0 a new notes table is hash-partitioned on user_id. An
+    existing unpartitioned notes table is left as is; move it over with
+    `python -m database.partition_notes`.
+    """
+    if not conn:
+        # get_db_connection already logged the error, so we just exit gracefully.
+        return
+
+    notes_partitions = partitions
+    archive_compression: List[str] = []
+    try:
+        if partitions > 0 and notes_table_kind(conn) == "plain":
+            logger.warning("Table 'notes' exists and is not partitioned. Run 'python -m database.partition_notes' to migrate it.")
+            notes_partitions = 0
+        archive_compression = notes_archive_compression_commands(conn)
+        conn.rollback()
+    except psycopg2.Error:
+        logger.error("Failed to inspect the notes table.", exc_info=True)
+        conn.rollback()
+
     commands = (
         """
         CREATE TABLE IF NOT EXISTS users (
@@ -16,37 +276,101 @@ def create_tables(conn: psycopg2.extensions.connection):
             created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
         )
         """,
+        *notes_table_commands("notes", notes_partitions),
+        """
+        CREATE TABLE IF NOT EXISTS note_deletions (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            note_id BIGINT NOT NULL,
+            deleted_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp(),
+            PRIMARY KEY (user_id, note_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS note_deletions_user_deleted_idx ON note_deletions (user_id, deleted_at)",
+        *note_stats_table_commands(),
+        *note_stats_trigger_commands(),
+        *notes_archive_commands(),
+        *archive_compression,
+        """
+        CREATE TABLE IF NOT EXISTS user_shard_overrides (
+            user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            shard_index INTEGER NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+    try:
+        # The 'with conn' block creates a transaction.
+        # It automatically commits if the block succeeds, or rolls back on exception.
+        with conn:
+            with conn.cursor() as cur:
+                for command in commands:
+                    cur.execute(command)
+        logger.info("Tables 'users' and 'notes' have been successfully created/verified.")
+    except psycopg2.Error as e:
+        # The 'with conn' block will have already rolled back the transaction.
+        logger.error("Failed to create tables.", exc_info=True)
+
+def create_shard_tables(conn: psycopg2.extensions.connection, shard_index: int, stride: int = SHARD_NOTE_ID_STRIDE):
+    """
+    Creates the notes tables on a shard node if they don't exist.
+
+    Shard nodes hold notes but not users, so there is no foreign key to users.
+    Note ids follow shard_index + 1 + k * stride, so they never collide across
+    nodes and a note keeps its id when the resharding tool moves it.
+    """
+    commands = (
+        f"""
+        CREATE SEQUENCE IF NOT EXISTS notes_note_id_seq
+            AS BIGINT START WITH {shard_index + 1} INCREMENT BY {stride}
+        """,
         """
         CREATE TABLE IF NOT EXISTS notes (
-            note_id SERIAL PRIMARY KEY,
+            note_id BIGINT PRIMARY KEY DEFAULT nextval('notes_note_id_seq'),
             user_id INTEGER NOT NULL,
             note_title VARCHAR(255) NOT NULL,
             note_description TEXT,
             note_tags VARCHAR(255),
             created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-            CONSTRAINT fk_user
-                FOREIGN KEY(user_id)
-                REFERENCES users(user_id)
-                ON DELETE CASCADE
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp()
+        )
+        """,
+        *notes_upgrade_commands(),
+        "ALTER SEQUENCE notes_note_id_seq OWNED BY notes.note_id",
+        "CREATE INDEX IF NOT EXISTS idx_notes_user_id ON notes (user_id)",
+        "CREATE INDEX IF NOT EXISTS notes_user_updated_idx ON notes (user_id, updated_at)",
+        """
+        CREATE TABLE IF NOT EXISTS note_deletions (
+            user_id INTEGER NOT NULL,
+            note_id BIGINT NOT NULL,
+            deleted_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp(),
+            PRIMARY KEY (user_id, note_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS note_deletions_user_deleted_idx ON note_deletions (user_id, deleted_at)",
+        *note_stats_table_commands(user_fk=False),
+        *note_stats_trigger_commands(),
+        *notes_archive_commands(user_fk=False),
+        """
+        CREATE TABLE IF NOT EXISTS shard_moved_users (
+            user_id INTEGER PRIMARY KEY,
+            moved_to INTEGER NOT NULL,
+            moved_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
         )
         """
     )
-    
+
     if not conn:
-        # get_db_connection already logged the error, so we just exit gracefully.
         return
 
     try:
-        # The 'with conn' block creates a transaction.
-        # It automatically commits if the block succeeds, or rolls back on exception.
         with conn:
             with conn.cursor() as cur:
-                for command in commands:
+                for command in (*commands, *notes_archive_compression_commands(conn)):
                     cur.execute(command)
-        logger.info("Tables 'users' and 'notes' have been successfully created/verified.")
+        logger.info(f"Notes tables on shard {shard_index} have been successfully created/verified.")
     except psycopg2.Error as e:
-        # The 'with conn' block will have already rolled back the transaction.
-        logger.error("Failed to create tables.", exc_info=True)
+        logger.error(f"Failed to create tables on shard {shard_index}.", exc_info=True)
 
 if __name__ == '__main__':
     # When running this script directly, configure a basic logger to see output.
@@ -63,4 +387,11 @@ if __name__ == '__main__':
             create_tables(conn)
         finally:
             conn.close()
+    for shard_index, dsn in enumerate(POSTGRES_SHARD_DSNS):
+        shard_conn = connect_dsn(dsn)
+        if shard_conn:
+            try:
+                create_shard_tables(shard_conn, shard_index)
+            finally:
+                shard_conn.close()
     logger.info("Database initialization complete.")
\ No newline at end of file
@@ -1,56 +1,382 @@
+import json
 import logging
 import psycopg2
-from typing import Optional, List, Dict, Any
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
 from psycopg2.extensions import connection as Connection
+from psycopg2.extras import execute_values
+
+from database.note_events import NOTE_EVENTS_CHANNEL
+from database.replicas import ReplicaRouter, parse_lsn
+from database.sharding import ShardRouter
 
 logger = logging.getLogger(__name__)
 
+# How many times a notes operation follows a user that was moved to another shard mid-request.
+SHARD_MAX_REDIRECTS = 3
+
+# Errors raised when a query hits statement_timeout or is canceled, or a lock wait hits lock_timeout.
+# The handler's methods let them propagate instead of returning None, so the app can answer 504/503.
+TIMEOUT_ERRORS = (psycopg2.errors.QueryCanceled, psycopg2.errors.LockNotAvailable)
+
+class _CancellableCursor(psycopg2.extensions.cursor):
+    """A cursor that refuses to run queries once its handler was canceled."""
+
+    handler: "DBHandler"
+
+    def execute(self, query, vars=None):
+        if self.handler.cancelled:
+            raise psycopg2.errors.QueryCanceled("canceling statement because the request was canceled")
+        return super().execute(query, vars)
+
+# Columns a note listing may project; requested fields are checked against this before reaching SQL.
+NOTE_FIELDS = ("note_id", "note_title", "note_description", "note_tags", "created_at", "updated_at")
+
+# The columns notes and notes_archive have in common, in the order used to move rows between them.
+NOTE_COLUMNS = "note_id, user_id, note_title, note_description, note_tags, created_at, updated_at"
+
 class DBHandler:
-    def __init__(self, db_session: Connection):
+    def __init__(self, db_session: Connection, read_router: Optional[ReplicaRouter] = None, shard_router: Optional[ShardRouter] = None):
         """
         Initializes the handler with an active database connection.
 
         Args:
             db_session (Connection): An active psycopg2 connection object.
+            read_router (ReplicaRouter, optional): When given, read-only queries are
+                sent to read replicas chosen by the router instead of db_session.
+            shard_router (ShardRouter, optional): When given, notes live on the shard
+                nodes chosen by the router and db_session only holds users. Notes
+                methods must then be called with the owning user_id.
         """
         self.conn = db_session
-        
+        self.read_router = read_router
+        self.shard_router = shard_router
+        self._replica: Optional[Tuple[Connection, str]] = None
+        self._shard_conns: Dict[int, Connection] = {}
+        self._wrote = False
+        self._timeouts: Optional[Tuple[int, int]] = None
+        # Connections given this handler's timeouts, which must be reset before they go back to a pool.
+        self._timed_conns: List[Connection] = []
+        # The primary LSN of the client's latest write, as sent back by the client; replicas must have replayed it.
+        self.read_after_lsn: Optional[str] = None
+        # The primary LSN after this handler's latest write, to hand to the client.
+        self.write_lsn: Optional[str] = None
+        # Set by cancel(); every later query of the handler raises QueryCanceled without running.
+        self.cancelled = False
+
+    def close(self):
+        """
+        Releases the replica and shard connections checked out by this handler, if any.
+
+        Resets the timeouts set by set_timeouts on every connection first, the
+        primary one included, so they don't carry over to the connection's next user.
+        """
+        for conn in self._timed_conns:
+            self._reset_timeouts(conn)
+        self._timed_conns.clear()
+        if self._replica:
+            self.read_router.release(self._replica[0])
+            self._replica = None
+        for conn in self._shard_conns.values():
+            self.shard_router.release(conn)
+        self._shard_conns.clear()
+
+    def set_timeouts(self, statement_timeout_ms: int, lock_timeout_ms: int):
+        """
+        Limits how long each query may run and wait for a lock, in milliseconds (0 for no limit).
+
+        Applies to the primary connection now, and to replica and shard connections
+        as the handler checks them out, until close() resets them. A query over a
+        limit makes the handler's methods raise one of TIMEOUT_ERRORS.
+        """
+        self._timeouts = (statement_timeout_ms, lock_timeout_ms)
+        self._apply_timeouts(self.conn)
+
+    @property
+    def timeouts(self) -> Optional[Tuple[int, int]]:
+        """The (statement, lock) timeouts given to set_timeouts, or None if it wasn't called."""
+        return self._timeouts
+
+    def _apply_timeouts(self, conn: Connection):
+        # Session settings rather than SET LOCAL: methods commit as they go and replica connections
+        # run in autocommit, so a transaction-scoped setting would be gone by the next query.
+        if self._timeouts is None:
+            return
+        try:
+            with self._cursor(conn) as cur:
+                cur.execute(
+                    "SELECT set_config('statement_timeout', %s, false), set_config('lock_timeout', %s, false);",
+                    tuple(str(ms) for ms in self._timeouts)
+                )
+            conn.commit()
+            if conn not in self._timed_conns:
+                self._timed_conns.append(conn)
+        except psycopg2.Error:
+            logger.warning("Failed to set the query timeouts on a connection.", exc_info=True)
+            conn.rollback()
+
+    @staticmethod
+    def _reset_timeouts(conn: Connection):
+        if conn.closed:
+            return
+        try:
+            # An aborted transaction would refuse the RESET; whatever it held is discarded on release anyway.
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("RESET statement_timeout; RESET lock_timeout;")
+            conn.commit()
+        except psycopg2.Error:
+            logger.warning("Failed to reset the query timeouts on a connection.", exc_info=True)
+
+    def cancel(self):
+        """
+        Asks the servers to cancel whatever queries this handler is running, and refuses any later ones.
+
+        Safe to call from another thread; the interrupted method raises QueryCanceled,
+        as does any query the handler would have run afterwards, so a cancel
+        arriving between two queries still stops the request's work.
+        """
+        self.cancelled = True
+        conns = [self.conn, *([self._replica[0]] if self._replica else []), *list(self._shard_conns.values())]
+        for conn in conns:
+            try:
+                conn.cancel()
+            except psycopg2.Error:
+                logger.warning("Failed to cancel a running query.", exc_info=True)
+
+    def _cursor(self, conn: Connection) -> _CancellableCursor:
+        cur = conn.cursor(cursor_factory=_CancellableCursor)
+        cur.handler = self
+        return cur
+
+    def _shard_conn(self, index: int) -> Connection:
+        if index not in self._shard_conns:
+            self._shard_conns[index] = self.shard_router.connect(index)
+            self._apply_timeouts(self._shard_conns[index])
+        return self._shard_conns[index]
+
+    def _lock_users(self, conn: Connection, user_ids: List[int]) -> Dict[int, int]:
+        """
+        Takes shared advisory locks on user_ids in conn's transaction and returns those moved off its node.
+
+        The resharding tool takes the same locks exclusively while it moves a user,
+        so holding them keeps a write from landing on a node mid-move.
+
+        Returns:
+            dict: {user_id: new node index} for the users that no longer live on this node.
+        """
+        with self._cursor(conn) as cur:
+            for user_id in sorted(user_ids):
+                cur.execute("SELECT pg_advisory_xact_lock_shared(%s);", (user_id,))
+        moved = self.shard_router.moved_to(conn, user_ids)
+        for user_id, index in moved.items():
+            self.shard_router.relocate(user_id, index)
+        return moved
+
+    def _notes_conn_for_write(self, user_id: Optional[int]) -> Connection:
+        """
+        Returns the connection holding user_id's notes, with a transaction open for a write.
+
+        Without sharding this is the primary connection. With sharding, the user's
+        node is locked for the write and, if the user was already moved away from
+        it, the placement is refreshed and the new node is used.
+        """
+        if not self.shard_router or user_id is None:
+            return self.conn
+        for _ in range(SHARD_MAX_REDIRECTS):
+            conn = self._shard_conn(self.shard_router.shard_for(user_id, self.conn))
+            try:
+                moved = self._lock_users(conn, [user_id])
+            except psycopg2.Error:
+                conn.rollback()
+                raise
+            if not moved:
+                return conn
+            conn.rollback()
+        raise psycopg2.OperationalError(f"Could not locate the notes shard of user_id {user_id}.")
+
+    def _read_notes_shard(self, sql: str, params: tuple, user_id: int) -> Tuple[List[str], List[tuple]]:
+        """Runs a read on user_id's notes node, following the user if an empty result means they were moved."""
+        for _ in range(SHARD_MAX_REDIRECTS):
+            conn = self._shard_conn(self.shard_router.shard_for(user_id, self.conn))
+            with self._cursor(conn) as cur:
+                cur.execute(sql, params)
+                columns, rows = [desc[0] for desc in cur.description], cur.fetchall()
+            if rows:
+                return columns, rows
+            moved = self.shard_router.moved_to(conn, [user_id])
+            if not moved:
+                return columns, rows
+            self.shard_router.relocate(user_id, moved[user_id])
+        return columns, rows
+
+    def _drop_replica(self):
+        self.read_router.mark_failed(self._replica[1])
+        if self._replica[0] in self._timed_conns:
+            self._timed_conns.remove(self._replica[0])
+            self._reset_timeouts(self._replica[0])
+        self.read_router.release(self._replica[0])
+        self._replica = None
+
+    def _replica_for(self, user_id: Optional[int]) -> Optional[Connection]:
+        """
+        Returns a replica connection able to serve a read for user_id, or None to use the primary.
+
+        Reads go to the primary once this handler has written, and while the user
+        is inside their read-your-writes window unless the replica has caught up.
+        The window is known from this process's own writes and from the LSN the
+        client sent back (read_after_lsn), which covers writes served by other workers.
+        """
+        if not self.read_router or self._wrote:
+            return None
+        if self._replica is None:
+            self._replica = self.read_router.acquire()
+            if self._replica is None:
+                return None
+            self._apply_timeouts(self._replica[0])
+        lsn = self.read_router.required_lsn(user_id)
+        if self.read_after_lsn and (lsn is None or parse_lsn(self.read_after_lsn) > parse_lsn(lsn)):
+            lsn = self.read_after_lsn
+        if lsn:
+            try:
+                if not self.read_router.has_replayed(self._replica[0], lsn):
+                    return None
+            except TIMEOUT_ERRORS:
+                raise
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                logger.warning("Read replica failed its replay check.", exc_info=True)
+                self._drop_replica()
+                return None
+        return self._replica[0]
+
+    def _read(self, sql: str, params: tuple, user_id: Optional[int] = None, notes: bool = False, from_primary: bool = False) -> Tuple[List[str], List[tuple]]:
+        """
+        Runs a read-only query and returns its column names and rows.
+
+        Reads on the notes table (notes=True) run on the user's shard when sharding
+        is enabled. Otherwise the query runs on a read replica when routing is
+        enabled, failing over to the primary if the replica is unusable. Other
+        psycopg2 errors propagate to the caller, as with queries run directly on self.conn.
+        """
+        if notes and self.shard_router and user_id is not None:
+            return self._read_notes_shard(sql, params, user_id)
+        replica = None if from_primary else self._replica_for(user_id)
+        if replica is not None:
+            try:
+                with self._cursor(replica) as cur:
+                    cur.execute(sql, params)
+                    return [desc[0] for desc in cur.description], cur.fetchall()
+            except TIMEOUT_ERRORS:
+                # A slow query would be just as slow on the primary.
+                raise
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                logger.warning("Read replica query failed, retrying on the primary.", exc_info=True)
+                self._drop_replica()
+        with self._cursor(self.conn) as cur:
+            cur.execute(sql, params)
+            return [desc[0] for desc in cur.description], cur.fetchall()
+
+    @staticmethod
+    def _notes_from(where: str, include_archived: bool) -> str:
+        """
+        Returns a FROM clause over the notes matching where, also reading notes_archive if include_archived.
+
+        where is applied to each table, so its parameters must be passed twice when include_archived.
+        """
+        if not include_archived:
+            return f"notes WHERE {where}"
+        return (
+            f"(SELECT {NOTE_COLUMNS} FROM notes WHERE {where} "
+            f"UNION ALL SELECT {NOTE_COLUMNS} FROM notes_archive WHERE {where}) AS notes"
+        )
+
+    @staticmethod
+    def _restore_archived(cur, note_id: int, user_id: Optional[int]) -> bool:
+        """Moves an archived note back into notes in cur's transaction, so it can be changed. Returns whether it was archived."""
+        sql, params = "DELETE FROM notes_archive WHERE note_id = %s", (note_id,)
+        if user_id is not None:
+            sql, params = sql + " AND user_id = %s", params + (user_id,)
+        cur.execute(
+            f"WITH restored AS ({sql} RETURNING {NOTE_COLUMNS}) "
+            f"INSERT INTO notes ({NOTE_COLUMNS}) SELECT {NOTE_COLUMNS} FROM restored;",
+            params
+        )
+        return cur.rowcount > 0
+
+    @staticmethod
+    def _notify_changes(cur, changes: List[Tuple[int, str, int]]):
+        """
+        Queues a note event for each (user_id, op, note_id) in cur's transaction.
+
+        Postgres only delivers the notifications if the transaction commits, so
+        listeners never hear about a change that was rolled back.
+        """
+        if changes:
+            payloads = [json.dumps({"user_id": user_id, "op": op, "note_id": note_id}) for user_id, op, note_id in changes]
+            cur.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload;", (NOTE_EVENTS_CHANNEL, payloads))
+
+    def _track_write(self, conn: Connection, *user_ids: int):
+        """
+        Records that user_ids just committed a write on conn, for read-your-writes routing.
+
+        Only writes on the primary are tracked: replicas copy the primary, and
+        reads of sharded notes always go to the shard that was written.
+        """
+        self._wrote = True
+        if not self.read_router or conn is not self.conn:
+            return
+        try:
+            with self._cursor(self.conn) as cur:
+                cur.execute("SELECT pg_current_wal_lsn();")
+                lsn = cur.fetchone()[0]
+            self.conn.commit()
+        except psycopg2.Error:
+            logger.warning("Failed to read the primary WAL position after a write.", exc_info=True)
+            self.conn.rollback()
+            return
+        self.write_lsn = lsn
+        for user_id in user_ids:
+            self.read_router.record_write(user_id, lsn)
     
-    def get_all_usernames(self):
+    def get_all_usernames(self, user_id: Optional[int] = None):
         """
         Retrieves a list of all usernames from the database.
 
+        Args:
+            user_id (int, optional): The requesting user, for read-your-writes routing.
+
         Returns:
             list: A list of username strings, or an empty list if none are found or an error occurs.
         """
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("SELECT username FROM users ORDER BY username;")
-                usernames = [row[0] for row in cur.fetchall()]
-                logger.info(f"Successfully retrieved {len(usernames)} usernames.")
-                return usernames
+            _, rows = self._read("SELECT username FROM users ORDER BY username;", (), user_id)
+            usernames = [row[0] for row in rows]
+            logger.info(f"Successfully retrieved {len(usernames)} usernames.")
+            return usernames
+        except TIMEOUT_ERRORS:
+            raise
         except psycopg2.Error as e:
             logger.error("Failed to retrieve usernames.", exc_info=True)
             return []
             
-    def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+    def get_user_by_username(self, username: str, user_id: Optional[int] = None, from_primary: bool = False) -> Optional[Dict[str, Any]]:
+        sql = "SELECT user_id, username, created_at FROM users WHERE username = %s;"
         try:
-            with self.conn.cursor() as cur:
-                cur.execute(
-                    "SELECT user_id, username, created_at FROM users WHERE username = %s;",
-                    (username,)
-                )
-                user_data = cur.fetchone()
-                if user_data:
-                    return {"user_id": user_data[0], "username": user_data[1], "created_at": user_data[2]}
-                return None
+            _, rows = self._read(sql, (username,), user_id, from_primary=from_primary)
+            if rows:
+                user_data = rows[0]
+                return {"user_id": user_data[0], "username": user_data[1], "created_at": user_data[2]}
+            return None
+        except TIMEOUT_ERRORS:
+            raise
         except psycopg2.Error:
             logger.error(f"Failed to retrieve user {username}.", exc_info=True)
             return None
 
     def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
         try:
-            with self.conn.cursor() as cur:
+            with self._cursor(self.conn) as cur:
                 cur.execute(
                     "SELECT user_id, username, created_at FROM users WHERE user_id = %s;",
                     (user_id,)
@@ -59,6 +385,8 @@ class DBHandler:
                 if user_data:
                     return {"user_id": user_data[0], "username": user_data[1], "created_at": user_data[2]}
                 return None
+        except TIMEOUT_ERRORS:
+            raise
         except psycopg2.Error:
             logger.error(f"Failed to retrieve user with id {user_id}.", exc_info=True)
             return None
@@ -66,19 +394,23 @@ class DBHandler:
     def create_user(self, username: str) -> Optional[Dict[str, Any]]:
         placeholder_password = "not_set"
         try:
-            with self.conn.cursor() as cur:
+            with self._cursor(self.conn) as cur:
                 cur.execute(
                     "INSERT INTO users (username, user_pwd) VALUES (%s, %s) RETURNING user_id, username, created_at;",
                     (username, placeholder_password)
                 )
                 user_data = cur.fetchone()
                 self.conn.commit()
+                self._track_write(self.conn, user_data[0])
                 logger.info(f"Successfully created user: {username}")
                 return {"user_id": user_data[0], "username": user_data[1], "created_at": user_data[2]}
+        except TIMEOUT_ERRORS:
+            self.conn.rollback()
+            raise
         except psycopg2.errors.UniqueViolation:
             logger.warning(f"Attempted to create user '{username}', but they already exist.")
             self.conn.rollback()
-            return self.get_user_by_username(username)
+            return self.get_user_by_username(username, from_primary=True)
         except psycopg2.Error:
             logger.error(f"Failed to create user {username}.", exc_info=True)
             self.conn.rollback()
@@ -88,72 +420,343 @@ class DBHandler:
         sql = """
             INSERT INTO notes (user_id, note_title, note_description, note_tags)
             VALUES (%s, %s, %s, %s)
-            RETURNING note_id, note_title, note_description, note_tags, created_at;
+            RETURNING note_id, note_title, note_description, note_tags, created_at, updated_at;
         """
+        conn = self.conn
         try:
-            with self.conn.cursor() as cur:
+            conn = self._notes_conn_for_write(user_id)
+            with self._cursor(conn) as cur:
                 cur.execute(sql, (user_id, title, description, tags))
                 new_note_data = cur.fetchone()
-                self.conn.commit()
                 columns = [desc[0] for desc in cur.description]
+                self._notify_changes(cur, [(user_id, "create", new_note_data[0])])
+                conn.commit()
+                self._track_write(conn, user_id)
                 logger.info(f"Successfully created note for user_id {user_id}")
                 return dict(zip(columns, new_note_data))
+        except TIMEOUT_ERRORS:
+            conn.rollback()
+            raise
         except psycopg2.Error:
             logger.error(f"Failed to create note for user_id {user_id}.", exc_info=True)
-            self.conn.rollback()
+            conn.rollback()
             return None
 
-    def get_notes_by_user_id(self, user_id: int) -> List[Dict[str, Any]]:
-        sql = "SELECT note_id, note_title, note_description, note_tags, created_at FROM notes WHERE user_id = %s ORDER BY created_at DESC;"
+    def create_notes_bulk(self, rows: List[Tuple[int, str, Optional[str], Optional[str]]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Inserts several notes in a single transaction with one multi-row INSERT.
+
+        If the multi-row statement fails, the rows are retried one by one inside
+        the same transaction using savepoints, so a bad row only fails itself.
+        With sharding, rows are grouped into one transaction per shard node.
+
+        Args:
+            rows: A list of (user_id, title, description, tags) tuples.
+
+        Returns:
+            list: One entry per input row, in the same order: the created note as a dict,
+            None if that row could not be inserted, or the TIMEOUT_ERRORS exception
+            that stopped the transaction holding it. A timeout rolls back the whole
+            transaction, so its rows aren't retried one by one.
+        """
+        if not rows:
+            return []
+        if not self.shard_router:
+            try:
+                return self._insert_notes_bulk(self.conn, rows)
+            except TIMEOUT_ERRORS as e:
+                return [e] * len(rows)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        by_shard: Dict[int, List[int]] = defaultdict(list)
+        moved_positions: List[int] = []
         try:
-            with self.conn.cursor() as cur:
-                cur.execute(sql, (user_id,))
-                notes_data = cur.fetchall()
-                columns = [desc[0] for desc in cur.description]
-                return [dict(zip(columns, row)) for row in notes_data]
+            for position, row in enumerate(rows):
+                by_shard[self.shard_router.shard_for(row[0], self.conn)].append(position)
+        except psycopg2.Error:
+            logger.error(f"Failed to locate shards for a batch of {len(rows)} notes.", exc_info=True)
+            return results
+        for index, positions in by_shard.items():
+            try:
+                conn = self._shard_conn(index)
+                moved = self._lock_users(conn, list({rows[p][0] for p in positions}))
+            except TIMEOUT_ERRORS as e:
+                if index in self._shard_conns:
+                    self._shard_conns[index].rollback()
+                for position in positions:
+                    results[position] = e
+                continue
+            except psycopg2.Error:
+                logger.error(f"Failed to prepare shard {index} for a batch of notes.", exc_info=True)
+                if index in self._shard_conns:
+                    self._shard_conns[index].rollback()
+                continue
+            moved_positions += [p for p in positions if rows[p][0] in moved]
+            positions = [p for p in positions if rows[p][0] not in moved]
+            try:
+                created = self._insert_notes_bulk(conn, [rows[p] for p in positions])
+            except TIMEOUT_ERRORS as e:
+                created = [e] * len(positions)
+            for position, result in zip(positions, created):
+                results[position] = result
+        # Users moved off their cached shard are written one by one, which follows them to their new node.
+        for position in moved_positions:
+            try:
+                results[position] = self.create_note(*rows[position])
+            except TIMEOUT_ERRORS as e:
+                results[position] = e
+        return results
+
+    def _insert_notes_bulk(self, conn: Connection, rows: List[Tuple[int, str, Optional[str], Optional[str]]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Inserts rows on conn and commits, falling back to one savepoint per row if the batch fails.
+
+        A timeout rolls back and raises, since retrying row by row would only run out of time again.
+        """
+        sql = """
+            INSERT INTO notes (user_id, note_title, note_description, note_tags)
+            VALUES %s
+            RETURNING note_id, note_title, note_description, note_tags, created_at, updated_at;
+        """
+        single_sql = """
+            INSERT INTO notes (user_id, note_title, note_description, note_tags)
+            VALUES (%s, %s, %s, %s)
+            RETURNING note_id, note_title, note_description, note_tags, created_at, updated_at;
+        """
+        if not rows:
+            conn.commit()
+            return []
+        try:
+            with self._cursor(conn) as cur:
+                # Savepoints keep locks taken earlier in the transaction when the batch is retried.
+                cur.execute("SAVEPOINT bulk_notes;")
+                try:
+                    created = execute_values(cur, sql, rows, page_size=len(rows), fetch=True)
+                    columns = [desc[0] for desc in cur.description]
+                    results = [dict(zip(columns, row)) for row in created]
+                except TIMEOUT_ERRORS:
+                    raise
+                except psycopg2.Error:
+                    logger.warning(f"Batch insert of {len(rows)} notes failed, retrying row by row.", exc_info=True)
+                    cur.execute("ROLLBACK TO SAVEPOINT bulk_notes;")
+                    results = []
+                    for row in rows:
+                        cur.execute("SAVEPOINT bulk_note;")
+                        try:
+                            cur.execute(single_sql, row)
+                            columns = [desc[0] for desc in cur.description]
+                            results.append(dict(zip(columns, cur.fetchone())))
+                            cur.execute("RELEASE SAVEPOINT bulk_note;")
+                        except TIMEOUT_ERRORS:
+                            raise
+                        except psycopg2.Error:
+                            logger.error(f"Failed to create note for user_id {row[0]} in batch.", exc_info=True)
+                            cur.execute("ROLLBACK TO SAVEPOINT bulk_note;")
+                            results.append(None)
+                self._notify_changes(cur, [(row[0], "create", result["note_id"]) for row, result in zip(rows, results) if result])
+            conn.commit()
+            self._track_write(conn, *{row[0] for row, result in zip(rows, results) if result})
+            logger.info(f"Successfully created {sum(1 for result in results if result)} of {len(rows)} notes in one batch.")
+            return results
+        except TIMEOUT_ERRORS:
+            conn.rollback()
+            raise
+        except psycopg2.Error:
+            logger.error(f"Failed to create a batch of {len(rows)} notes.", exc_info=True)
+            conn.rollback()
+            return [None] * len(rows)
+
+    def get_notes_by_user_id(self, user_id: int, fields: Optional[List[str]] = None, preview_chars: Optional[int] = None,
+                             include_archived: bool = False) -> List[Dict[str, Any]]:
+        """
+        Retrieves a user's notes, newest first.
+
+        Only the columns in fields are read (all of NOTE_FIELDS by default), and
+        with preview_chars only the first preview_chars characters of
+        note_description are sent to the client. left() still reads and
+        decompresses the whole description, so a preview saves transfer, not
+        database reads. Archived notes are only read with include_archived.
+        """
+        projection, params = [], []
+        for field in fields or NOTE_FIELDS:
+            if field not in NOTE_FIELDS:
+                raise ValueError(f"Unknown note field: {field}")
+            if field == "note_description" and preview_chars is not None:
+                projection.append("left(note_description, %s) AS note_description")
+                params.append(preview_chars)
+            else:
+                projection.append(field)
+        sql = f"SELECT {', '.join(projection)} FROM {self._notes_from('user_id = %s', include_archived)} ORDER BY created_at DESC;"
+        params += [user_id] * (2 if include_archived else 1)
+        try:
+            columns, notes_data = self._read(sql, tuple(params), user_id, notes=True)
+            return [dict(zip(columns, row)) for row in notes_data]
+        except TIMEOUT_ERRORS:
+            raise
         except psycopg2.Error:
             logger.error(f"Failed to retrieve notes for user_id {user_id}.", exc_info=True)
             return []
 
-    def get_note_by_id(self, note_id: int) -> Optional[Dict[str, Any]]:
-        sql = "SELECT note_id, user_id, note_title, note_description, note_tags, created_at FROM notes WHERE note_id = %s;"
+    def get_note_by_id(self, note_id: int, user_id: Optional[int] = None, from_primary: bool = True,
+                       include_archived: bool = False) -> Optional[Dict[str, Any]]:
+        # Filtering on the owner as well lets a partitioned notes table scan a single partition.
+        where, params = "note_id = %s", (note_id,)
+        if user_id is not None:
+            where, params = where + " AND user_id = %s", params + (user_id,)
+        if include_archived:
+            params = params * 2
+        sql = f"SELECT {NOTE_COLUMNS} FROM {self._notes_from(where, include_archived)};"
         try:
-            with self.conn.cursor() as cur:
-                cur.execute(sql, (note_id,))
-                note_data = cur.fetchone()
-                if not note_data:
-                    return None
-                columns = [desc[0] for desc in cur.description]
-                return dict(zip(columns, note_data))
+            columns, rows = self._read(sql, params, user_id, notes=True, from_primary=from_primary)
+            if not rows:
+                return None
+            return dict(zip(columns, rows[0]))
+        except TIMEOUT_ERRORS:
+            raise
         except psycopg2.Error:
             logger.error(f"Failed to retrieve note with id {note_id}.", exc_info=True)
             return None
 
-    def update_note(self, note_id: int, update_data: dict) -> Optional[Dict[str, Any]]:
-        set_clauses = [f"{key} = %s" for key in update_data.keys()]
+    def update_note(self, note_id: int, update_data: dict, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        set_clauses = [f"{key} = %s" for key in update_data.keys()] + ["updated_at = clock_timestamp()"]
         values = list(update_data.values()) + [note_id]
-        sql = f"UPDATE notes SET {', '.join(set_clauses)} WHERE note_id = %s RETURNING note_id, user_id, note_title, note_description, note_tags, created_at;"
+        owner_clause = ""
+        if user_id is not None:
+            owner_clause = " AND user_id = %s"
+            values.append(user_id)
+        sql = f"UPDATE notes SET {', '.join(set_clauses)} WHERE note_id = %s{owner_clause} RETURNING note_id, user_id, note_title, note_description, note_tags, created_at, updated_at;"
+        conn = self.conn
         try:
-            with self.conn.cursor() as cur:
+            conn = self._notes_conn_for_write(user_id)
+            with self._cursor(conn) as cur:
                 cur.execute(sql, tuple(values))
                 updated_note_data = cur.fetchone()
-                self.conn.commit()
+                # Changing an archived note brings it back to the hot table first.
+                if updated_note_data is None and self._restore_archived(cur, note_id, user_id):
+                    cur.execute(sql, tuple(values))
+                    updated_note_data = cur.fetchone()
+                if updated_note_data is None:
+                    conn.rollback()
+                    return None
                 columns = [desc[0] for desc in cur.description]
-                return dict(zip(columns, updated_note_data))
+                updated_note = dict(zip(columns, updated_note_data))
+                self._notify_changes(cur, [(updated_note["user_id"], "update", note_id)])
+                conn.commit()
+                self._track_write(conn, updated_note["user_id"])
+                return updated_note
+        except TIMEOUT_ERRORS:
+            conn.rollback()
+            raise
         except psycopg2.Error:
             logger.error(f"Failed to update note {note_id}.", exc_info=True)
-            self.conn.rollback()
+            conn.rollback()
             return None
 
-    def delete_note(self, note_id: int) -> bool:
-        sql = "DELETE FROM notes WHERE note_id = %s;"
+    def delete_note(self, note_id: int, user_id: Optional[int] = None) -> bool:
+        where, params = "note_id = %s", (note_id,)
+        if user_id is not None:
+            where, params = where + " AND user_id = %s", params + (user_id,)
+        # The tombstone is written in the same statement, so GET /notes/changes can't miss the deletion.
+        # The note is removed from whichever of notes and notes_archive holds it.
+        sql = f"""
+            WITH deleted AS (DELETE FROM notes WHERE {where} RETURNING note_id, user_id),
+            deleted_archived AS (DELETE FROM notes_archive WHERE {where} RETURNING note_id, user_id)
+            INSERT INTO note_deletions (note_id, user_id)
+            SELECT note_id, user_id FROM deleted
+            UNION ALL
+            SELECT note_id, user_id FROM deleted_archived
+            ON CONFLICT (user_id, note_id) DO UPDATE SET deleted_at = clock_timestamp()
+            RETURNING user_id, note_id;
+        """
+        params = params * 2
+        conn = self.conn
         try:
-            with self.conn.cursor() as cur:
-                cur.execute(sql, (note_id,))
-                deleted_rows = cur.rowcount
-                self.conn.commit()
-                return deleted_rows > 0
+            conn = self._notes_conn_for_write(user_id)
+            with self._cursor(conn) as cur:
+                cur.execute(sql, params)
+                deleted = cur.fetchall()
+                self._notify_changes(cur, [(row[0], "delete", row[1]) for row in deleted])
+                conn.commit()
+                self._track_write(conn, *{row[0] for row in deleted})
+                return len(deleted) > 0
+        except TIMEOUT_ERRORS:
+            conn.rollback()
+            raise
         except psycopg2.Error:
             logger.error(f"Failed to delete note {note_id}.", exc_info=True)
-            self.conn.rollback()
-            return False
\ No newline at end of file
+            conn.rollback()
+            return False
+
+    def get_note_changes(self, user_id: int, since: Optional[datetime], include_archived: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Retrieves the notes a user created or updated, and the ids of those they deleted, after since.
+
+        Without include_archived, notes archived after since are reported as
+        deleted too, so a client that only keeps recent notes drops them.
+
+        The returned as_of is read before the changes, so passing it as since on
+        the next call can repeat a change but never skip one committed after it.
+        The reads run on the primary (or the user's shard): a lagging replica
+        could hide changes older than as_of.
+
+        Args:
+            user_id (int): The owner of the notes.
+            since (datetime, optional): Only changes after this instant; None returns every note.
+            include_archived (bool): Whether archived notes are returned too.
+
+        Returns:
+            dict: {"notes": [...], "deleted": [note ids], "as_of": datetime}, or None if an error occurs.
+        """
+        where, notes_params = "user_id = %s", (user_id,)
+        if since is not None:
+            where, notes_params = where + " AND updated_at > %s", notes_params + (since,)
+        if include_archived:
+            notes_params = notes_params * 2
+        notes_sql = f"SELECT note_id, note_title, note_description, note_tags, created_at, updated_at FROM {self._notes_from(where, include_archived)}"
+        try:
+            _, rows = self._read("SELECT clock_timestamp();", (), user_id, notes=True, from_primary=True)
+            as_of = rows[0][0]
+            columns, rows = self._read(notes_sql + " ORDER BY created_at DESC;", notes_params, user_id, notes=True, from_primary=True)
+            deleted = []
+            if since is not None:
+                deleted_sql = "SELECT note_id FROM note_deletions WHERE user_id = %s AND deleted_at > %s"
+                deleted_params = (user_id, since)
+                if not include_archived:
+                    deleted_sql += " UNION ALL SELECT note_id FROM notes_archive WHERE user_id = %s AND archived_at > %s"
+                    deleted_params *= 2
+                _, deleted_rows = self._read(deleted_sql + ";", deleted_params, user_id, notes=True, from_primary=True)
+                deleted = [row[0] for row in deleted_rows]
+            return {"notes": [dict(zip(columns, row)) for row in rows], "deleted": deleted, "as_of": as_of}
+        except TIMEOUT_ERRORS:
+            raise
+        except psycopg2.Error:
+            logger.error(f"Failed to retrieve note changes for user_id {user_id}.", exc_info=True)
+            return None
+
+    def get_note_stats(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Retrieves a user's note statistics, kept up to date by triggers on the notes table.
+
+        Returns:
+            dict: {"note_count", "last_activity_at", "tags": [{"tag", "note_count"}]}, or None if an error occurs.
+        """
+        try:
+            _, rows = self._read(
+                "SELECT note_count, last_activity_at FROM user_note_stats WHERE user_id = %s;",
+                (user_id,), user_id, notes=True
+            )
+            columns, tag_rows = self._read(
+                "SELECT tag, note_count FROM user_tag_stats WHERE user_id = %s ORDER BY note_count DESC, tag;",
+                (user_id,), user_id, notes=True
+            )
+            note_count, last_activity_at = rows[0] if rows else (0, None)
+            return {
+                "note_count": note_count,
+                "last_activity_at": last_activity_at,
+                "tags": [dict(zip(columns, row)) for row in tag_rows],
+            }
+        except TIMEOUT_ERRORS:
+            raise
+        except psycopg2.Error:
+            logger.error(f"Failed to retrieve note stats for user_id {user_id}.", exc_info=True)
+            return None
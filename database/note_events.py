@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import psycopg2
+from psycopg2.extensions import connection as Connection
+
+from config import NOTES_STREAM_QUEUE_SIZE, POSTGRES_SHARD_DSNS
+from database.connection import start_conn, connect_dsn
+
+logger = logging.getLogger(__name__)
+
+# Channel the DBHandler write methods NOTIFY on, with a JSON payload {"user_id", "op", "note_id"}.
+NOTE_EVENTS_CHANNEL = "note_changes"
+
+# Sent to a subscriber when events may have been lost, so it fetches the changes instead.
+RESYNC_EVENT = {"op": "resync"}
+
+
+class NoteSubscription:
+    """
+    One listener for a user's note events, consumed from an asyncio event loop.
+
+    Events are put on a bounded queue from the hub's thread. When a slow consumer
+    lets the queue fill up, the backlog is dropped and replaced by a single
+    resync event, so memory per subscriber stays bounded.
+    """
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, max_queue_size: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=max(2, max_queue_size))
+
+    def _put(self, event: Dict[str, Any]):
+        # Runs on the subscriber's event loop.
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_EVENT)
+
+    def push(self, event: Dict[str, Any]):
+        """Hands an event to the subscriber's loop. Safe to call from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The loop was closed; the subscriber is going away.
+            pass
+
+
+class NoteEventHub:
+    """
+    Fans out note change notifications to subscribers.
+
+    A single background thread holds one LISTEN connection per database that
+    stores notes (the primary, plus each shard node) and dispatches every
+    notification to the subscriptions of the user it belongs to. Subscribers
+    never hold a database connection. If a LISTEN connection breaks, every
+    subscriber gets a resync event once it is re-established.
+    """
+
+    def __init__(
+        self,
+        connectors: List[Callable[[], Optional[Connection]]],
+        max_queue_size: int = NOTES_STREAM_QUEUE_SIZE,
+        poll_interval: float = 1.0,
+        retry_after: float = 2.0,
+    ):
+        self._connectors = connectors
+        self.max_queue_size = max_queue_size
+        self.poll_interval = poll_interval
+        self.retry_after = retry_after
+        self._subscriptions: Dict[int, Set[NoteSubscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.listening = threading.Event()
+
+    def start(self):
+        """Starts the listening thread if it is not running yet."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="note-event-hub", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stops the listening thread and closes its connections."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        self._stopping.set()
+        if thread and thread.is_alive():
+            thread.join(timeout)
+
+    def subscribe(self, user_id: int) -> NoteSubscription:
+        """Registers a subscription for user_id. Must be called from the event loop that will consume it."""
+        self.start()
+        subscription = NoteSubscription(user_id, asyncio.get_running_loop(), self.max_queue_size)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: NoteSubscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def _dispatch(self, payload: str):
+        try:
+            event = json.loads(payload)
+            user_id = int(event.pop("user_id"))
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed note event payload: {payload!r}")
+            return
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    def _broadcast_resync(self):
+        with self._lock:
+            subscriptions = [s for subs in self._subscriptions.values() for s in subs]
+        for subscription in subscriptions:
+            subscription.push(RESYNC_EVENT)
+
+    def _connect_all(self) -> Optional[List[Connection]]:
+        conns: List[Connection] = []
+        for connect in self._connectors:
+            conn = connect()
+            if not conn:
+                self._close_all(conns)
+                return None
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTE_EVENTS_CHANNEL};")
+            except psycopg2.Error:
+                logger.error("Failed to LISTEN for note events.", exc_info=True)
+                self._close_all(conns + [conn])
+                return None
+            conns.append(conn)
+        return conns
+
+    @staticmethod
+    def _close_all(conns: List[Connection]):
+        for conn in conns:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def _run(self):
+        reconnecting = False
+        while not self._stopping.is_set():
+            conns = self._connect_all()
+            if conns is None:
+                reconnecting = True
+                self._stopping.wait(self.retry_after)
+                continue
+            self.listening.set()
+            if reconnecting:
+                # Notifications sent while we were disconnected are gone.
+                self._broadcast_resync()
+            try:
+                while not self._stopping.is_set():
+                    ready, _, _ = select.select(conns, [], [], self.poll_interval)
+                    for conn in ready:
+                        conn.poll()
+                        while conn.notifies:
+                            self._dispatch(conn.notifies.pop(0).payload)
+            except (psycopg2.Error, OSError):
+                logger.warning("Lost a note events connection; reconnecting.", exc_info=True)
+                reconnecting = True
+            finally:
+                self.listening.clear()
+                self._close_all(conns)
+
+
+_hub: Optional[NoteEventHub] = None
+_hub_lock = threading.Lock()
+
+
+def get_note_event_hub() -> NoteEventHub:
+    """Returns the process-wide hub, listening on the primary and every shard node."""
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            connectors = [start_conn] + [partial(connect_dsn, dsn) for dsn in POSTGRES_SHARD_DSNS]
+            _hub = NoteEventHub(connectors)
+        return _hub
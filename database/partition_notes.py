@@ -0,0 +1,185 @@
+"""
+Migrates an existing unpartitioned notes table to a hash-partitioned one online.
+
+1. Creates `notes_partitioned`, hash-partitioned on user_id, sharing the
+   notes_note_id_seq sequence so note ids keep increasing.
+2. Installs a trigger on `notes` that mirrors every insert, update and delete
+   into the new table while the migration runs.
+3. Copies the existing rows in note_id batches. Each batch is its own short
+   transaction and only holds share locks on the rows it copies.
+4. Swaps the tables in one short transaction: `notes` becomes
+   `notes_unpartitioned` and `notes_partitioned` becomes `notes`.
+
+The old table is kept for inspection unless --drop-old is given. Re-running the
+tool after an interruption resumes it: the copy skips rows already present.
+
+Usage:
+    python -m database.partition_notes --partitions 16 --batch-size 5000
+"""
+import argparse
+import logging
+import time
+
+import psycopg2
+from psycopg2.extensions import connection as Connection
+
+from config import NOTES_PARTITIONS
+from database.connection import start_conn
+from database.db_config import note_stats_trigger_commands, notes_table_commands, notes_table_kind
+
+logger = logging.getLogger(__name__)
+
+NEW_TABLE = "notes_partitioned"
+OLD_TABLE = "notes_unpartitioned"
+
+
+def _columns(conn: Connection) -> list:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'notes'
+            ORDER BY ordinal_position;
+            """
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def _install_mirror_trigger(conn: Connection, columns: list):
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"NEW.{column}" for column in columns)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            CREATE OR REPLACE FUNCTION notes_mirror_to_partitioned() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {NEW_TABLE} WHERE user_id = OLD.user_id AND note_id = OLD.note_id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {NEW_TABLE} ({column_list}) VALUES ({new_values}) ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """
+        )
+        cur.execute("DROP TRIGGER IF EXISTS notes_mirror_to_partitioned ON notes;")
+        cur.execute(
+            """
+            CREATE TRIGGER notes_mirror_to_partitioned
+            AFTER INSERT OR UPDATE OR DELETE ON notes
+            FOR EACH ROW EXECUTE FUNCTION notes_mirror_to_partitioned();
+            """
+        )
+    conn.commit()
+
+
+def _backfill(conn: Connection, columns: list, batch_size: int, pause: float) -> int:
+    column_list = ", ".join(columns)
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(max(note_id), 0) FROM notes;")
+        max_note_id = cur.fetchone()[0]
+    conn.commit()
+
+    copied = 0
+    last_note_id = 0
+    while last_note_id < max_note_id:
+        upper = last_note_id + batch_size
+        with conn.cursor() as cur:
+            # FOR SHARE waits for in-flight writes to these rows and skips rows deleted
+            # meanwhile, so a batch never resurrects a note the trigger already removed.
+            cur.execute(
+                f"""
+                INSERT INTO {NEW_TABLE} ({column_list})
+                SELECT {column_list} FROM notes
+                WHERE note_id > %s AND note_id <= %s
+                FOR SHARE
+                ON CONFLICT DO NOTHING;
+                """,
+                (last_note_id, upper)
+            )
+            copied += cur.rowcount
+        conn.commit()
+        last_note_id = upper
+        logger.info(f"Copied notes up to id {min(upper, max_note_id)} of {max_note_id}.")
+        if pause:
+            time.sleep(pause)
+    return copied
+
+
+def _swap(conn: Connection, drop_old: bool, lock_timeout_ms: int, attempts: int):
+    for attempt in range(1, attempts + 1):
+        try:
+            with conn.cursor() as cur:
+                # Fail fast instead of queueing every other query behind our lock request.
+                cur.execute(f"SET LOCAL lock_timeout = {int(lock_timeout_ms)};")
+                cur.execute("LOCK TABLE notes IN ACCESS EXCLUSIVE MODE;")
+                cur.execute("DROP TRIGGER notes_mirror_to_partitioned ON notes;")
+                cur.execute(f"ALTER TABLE notes RENAME TO {OLD_TABLE};")
+                cur.execute(f"ALTER TABLE {NEW_TABLE} RENAME TO notes;")
+                cur.execute("ALTER SEQUENCE notes_note_id_seq OWNED BY notes.note_id;")
+                # The statistics triggers stayed on the renamed table; the copied rows were already counted there.
+                for trigger in ("notes_stats_insert", "notes_stats_update", "notes_stats_delete"):
+                    cur.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {OLD_TABLE};")
+                for command in note_stats_trigger_commands("notes"):
+                    cur.execute(command)
+                cur.execute("DROP FUNCTION notes_mirror_to_partitioned();")
+                if drop_old:
+                    cur.execute(f"DROP TABLE {OLD_TABLE};")
+            conn.commit()
+            logger.info("Swapped in the partitioned notes table.")
+            return
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            logger.warning(f"Could not lock 'notes' for the swap (attempt {attempt}/{attempts}); retrying.")
+            time.sleep(1)
+    raise SystemExit("Gave up swapping the tables; the mirror trigger stays installed, re-run to retry.")
+
+
+def migrate(conn: Connection, partitions: int, batch_size: int = 5000, pause: float = 0.0,
+            drop_old: bool = False, lock_timeout_ms: int = 2000, attempts: int = 10):
+    """Runs the whole migration on conn. Does nothing if notes is already partitioned."""
+    kind = notes_table_kind(conn)
+    conn.rollback()
+    if kind != "plain":
+        logger.info(f"Nothing to migrate: table 'notes' is {kind or 'missing'}.")
+        return
+
+    columns = _columns(conn)
+    with conn.cursor() as cur:
+        for command in notes_table_commands(NEW_TABLE, partitions):
+            cur.execute(command)
+    conn.commit()
+    _install_mirror_trigger(conn, columns)
+    copied = _backfill(conn, columns, batch_size, pause)
+    logger.info(f"Backfill copied {copied} notes.")
+    _swap(conn, drop_old, lock_timeout_ms, attempts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partitions", type=int, default=NOTES_PARTITIONS or 16)
+    parser.add_argument("--batch-size", type=int, default=5000, help="Range of note ids copied per transaction.")
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+    parser.add_argument("--lock-timeout-ms", type=int, default=2000, help="Max wait for the swap lock per attempt.")
+    parser.add_argument("--drop-old", action="store_true", help="Drop the unpartitioned table after the swap.")
+    args = parser.parse_args()
+    if args.partitions < 1:
+        raise SystemExit("--partitions must be at least 1.")
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    conn = start_conn()
+    if not conn:
+        raise SystemExit("Could not connect to the database.")
+    try:
+        migrate(conn, args.partitions, args.batch_size, args.pause, args.drop_old, args.lock_timeout_ms)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
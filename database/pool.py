@@ -0,0 +1,138 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import psycopg2
+from psycopg2.extensions import connection as Connection
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+from config import (
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    POSTGRES_DB,
+    POSTGRES_HOST,
+    POSTGRES_PASSWORD,
+    POSTGRES_PORT,
+    POSTGRES_PRIMARY_DSN,
+    POSTGRES_REPLICA_DSNS,
+    POSTGRES_SHARD_DSNS,
+    POSTGRES_USER,
+)
+from database.connection import connect_dsn, start_conn
+
+logger = logging.getLogger(__name__)
+
+# Key of the primary's pool; other pools are keyed by their DSN.
+PRIMARY = "primary"
+
+_pools: Dict[str, ThreadedConnectionPool] = {}
+_pool_of: Dict[int, str] = {}
+_lock = threading.Lock()
+
+
+def _primary_kwargs() -> dict:
+    if POSTGRES_PRIMARY_DSN:
+        return {"dsn": POSTGRES_PRIMARY_DSN}
+    return {"dbname": POSTGRES_DB, "user": POSTGRES_USER, "password": POSTGRES_PASSWORD,
+            "host": POSTGRES_HOST, "port": POSTGRES_PORT}
+
+
+def _open_pool(key: str, minconn: int, maxconn: int) -> Optional[ThreadedConnectionPool]:
+    kwargs = _primary_kwargs() if key == PRIMARY else {"dsn": key}
+    try:
+        pool = ThreadedConnectionPool(minconn, maxconn, **kwargs)
+    except psycopg2.OperationalError:
+        logger.error(f"Could not open a connection pool for {'the primary' if key == PRIMARY else 'a configured DSN'}.", exc_info=True)
+        return None
+    # Run a query on the connections opened up front, so the first requests find them ready.
+    warm: List[Connection] = []
+    try:
+        for _ in range(minconn):
+            conn = pool.getconn()
+            warm.append(conn)
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+    except psycopg2.Error:
+        logger.warning("Failed to warm a pooled connection.", exc_info=True)
+    finally:
+        for conn in warm:
+            pool.putconn(conn, close=bool(conn.closed))
+    return pool
+
+
+def open_pools(minconn: int = DB_POOL_MIN_SIZE, maxconn: int = DB_POOL_MAX_SIZE):
+    """
+    Opens and warms this process's pools for the primary, the read replicas and the shard nodes.
+
+    Call it once per worker process, after the fork, e.g. from the app lifespan.
+    Until it is called, get_conn opens a new connection on every call.
+    """
+    maxconn = max(1, maxconn)
+    minconn = min(max(0, minconn), maxconn)
+    for key in [PRIMARY, *POSTGRES_REPLICA_DSNS, *POSTGRES_SHARD_DSNS]:
+        with _lock:
+            if key in _pools:
+                continue
+        pool = _open_pool(key, minconn, maxconn)
+        if pool:
+            with _lock:
+                _pools[key] = pool
+    logger.info(f"Opened {len(_pools)} connection pools ({minconn} to {maxconn} connections each).")
+
+
+def close_pools():
+    """Closes every pool of this process, including connections still checked out."""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+        _pool_of.clear()
+    for pool in pools:
+        pool.closeall()
+
+
+def get_conn(dsn: Optional[str] = None) -> Optional[Connection]:
+    """
+    Checks out a connection to the primary, or to the server at dsn.
+
+    Comes from the process's pool when open_pools was called, otherwise it is
+    a new connection. Either way, hand it back with put_conn. Returns None if
+    no connection could be obtained.
+    """
+    key = dsn or PRIMARY
+    with _lock:
+        pool = _pools.get(key)
+    if pool is None:
+        return connect_dsn(dsn) if dsn else start_conn()
+    try:
+        conn = pool.getconn()
+    except PoolError:
+        logger.error(f"Connection pool exhausted ({pool.maxconn} connections); raise DB_POOL_MAX_SIZE or lower ADMISSION_MAX_IN_FLIGHT.")
+        return None
+    except psycopg2.OperationalError:
+        logger.error("Could not open a pooled database connection.", exc_info=True)
+        return None
+    with _lock:
+        _pool_of[id(conn)] = key
+    return conn
+
+
+def put_conn(conn: Optional[Connection]):
+    """Returns a connection from get_conn to its pool, rolling back any open transaction, or closes it."""
+    if conn is None:
+        return
+    with _lock:
+        key = _pool_of.pop(id(conn), None)
+        pool = _pools.get(key) if key else None
+    if pool is None:
+        if not conn.closed:
+            conn.close()
+        return
+    try:
+        pool.putconn(conn, close=bool(conn.closed))
+    except (psycopg2.Error, PoolError):
+        logger.warning("Failed to return a connection to its pool; discarding it.", exc_info=True)
+        try:
+            pool.putconn(conn, close=True)
+        except PoolError:
+            pass
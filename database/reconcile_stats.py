@@ -0,0 +1,179 @@
+"""
+Rebuilds the per-user note statistics from the notes and reports any drift.
+
+user_note_stats and user_tag_stats are maintained by triggers on the notes
+and notes_archive tables. This tool recounts the notes of each user, archived
+ones included, in batches of users, on the primary and on every shard node in
+POSTGRES_SHARD_DSNS, logs every user whose stored counters differ, and
+overwrites those counters. Run it once after upgrading, since notes written
+before the triggers existed aren't counted, and then periodically as a check.
+
+Each batch locks the statistics rows of its users, so concurrent writes to
+those users wait for the batch to commit and then apply on top of the rebuilt
+counters.
+
+Usage:
+    python -m database.reconcile_stats --batch-size 500
+    python -m database.reconcile_stats --dry-run
+"""
+import argparse
+import logging
+from collections import defaultdict
+from typing import Dict, List
+
+import psycopg2
+from psycopg2.extensions import connection as Connection
+from psycopg2.extras import execute_values
+
+from config import POSTGRES_SHARD_DSNS
+from database.connection import connect_dsn, start_conn
+
+logger = logging.getLogger(__name__)
+
+
+def _next_users(conn: Connection, after: int, batch_size: int) -> List[int]:
+    """Returns the next batch_size user ids above after that have notes or statistics."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT user_id FROM (
+                (SELECT user_id FROM notes WHERE user_id > %s GROUP BY user_id ORDER BY user_id LIMIT %s)
+                UNION
+                (SELECT user_id FROM notes_archive WHERE user_id > %s GROUP BY user_id ORDER BY user_id LIMIT %s)
+                UNION
+                (SELECT user_id FROM user_note_stats WHERE user_id > %s ORDER BY user_id LIMIT %s)
+            ) AS candidates
+            ORDER BY user_id LIMIT %s;
+            """,
+            (after, batch_size, after, batch_size, after, batch_size, batch_size)
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def _reconcile_batch(conn: Connection, user_ids: List[int], dry_run: bool) -> List[int]:
+    """Recounts the notes of user_ids in one transaction and returns the users whose counters drifted."""
+    with conn.cursor() as cur:
+        # Give every user a row to lock, so a user's first note can't be counted twice.
+        execute_values(
+            cur,
+            "INSERT INTO user_note_stats (user_id) VALUES %s ON CONFLICT (user_id) DO NOTHING;",
+            [(user_id,) for user_id in user_ids]
+        )
+        cur.execute(
+            "SELECT user_id, note_count FROM user_note_stats WHERE user_id = ANY(%s) ORDER BY user_id FOR UPDATE;",
+            (user_ids,)
+        )
+        stored_counts = dict(cur.fetchall())
+        cur.execute("SELECT user_id, tag, note_count FROM user_tag_stats WHERE user_id = ANY(%s);", (user_ids,))
+        stored_tags: Dict[int, Dict[str, int]] = defaultdict(dict)
+        for user_id, tag, note_count in cur.fetchall():
+            stored_tags[user_id][tag] = note_count
+
+        # Archived notes count as well.
+        all_notes = (
+            "(SELECT user_id, note_tags, updated_at FROM notes WHERE user_id = ANY(%(users)s) "
+            "UNION ALL SELECT user_id, note_tags, updated_at FROM notes_archive WHERE user_id = ANY(%(users)s)) AS all_notes"
+        )
+        cur.execute(
+            f"SELECT user_id, count(*), max(updated_at) FROM {all_notes} GROUP BY user_id;",
+            {"users": user_ids}
+        )
+        actual = {user_id: (note_count, last_updated) for user_id, note_count, last_updated in cur.fetchall()}
+        cur.execute(
+            f"SELECT user_id, tag, count(*) FROM {all_notes}, note_tag_list(note_tags) AS tag GROUP BY user_id, tag;",
+            {"users": user_ids}
+        )
+        actual_tags: Dict[int, Dict[str, int]] = defaultdict(dict)
+        for user_id, tag, note_count in cur.fetchall():
+            actual_tags[user_id][tag] = note_count
+
+        drifted = []
+        for user_id in user_ids:
+            note_count, last_updated = actual.get(user_id, (0, None))
+            if stored_counts.get(user_id) == note_count and stored_tags[user_id] == actual_tags[user_id]:
+                continue
+            drifted.append(user_id)
+            logger.warning(
+                f"Stats drift for user_id {user_id}: {stored_counts.get(user_id)} notes stored, {note_count} counted; "
+                f"{len(stored_tags[user_id])} tags stored, {len(actual_tags[user_id])} counted."
+            )
+            if dry_run:
+                continue
+            cur.execute(
+                """
+                UPDATE user_note_stats
+                SET note_count = %s, last_activity_at = greatest(last_activity_at, %s)
+                WHERE user_id = %s;
+                """,
+                (note_count, last_updated, user_id)
+            )
+            cur.execute("DELETE FROM user_tag_stats WHERE user_id = %s;", (user_id,))
+            if actual_tags[user_id]:
+                execute_values(
+                    cur,
+                    "INSERT INTO user_tag_stats (user_id, tag, note_count) VALUES %s;",
+                    [(user_id, tag, count) for tag, count in actual_tags[user_id].items()]
+                )
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    return drifted
+
+
+def reconcile(conn: Connection, batch_size: int = 500, dry_run: bool = False) -> List[int]:
+    """
+    Rebuilds the note statistics of every user on conn's node, batch_size users per transaction.
+
+    With dry_run the drift is only reported. Returns the ids of the users whose counters drifted.
+    """
+    drifted: List[int] = []
+    checked = 0
+    last_user_id = 0
+    try:
+        while True:
+            user_ids = _next_users(conn, last_user_id, batch_size)
+            if not user_ids:
+                conn.rollback()
+                break
+            drifted += _reconcile_batch(conn, user_ids, dry_run)
+            checked += len(user_ids)
+            last_user_id = user_ids[-1]
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    logger.info(f"Checked the note stats of {checked} users; {len(drifted)} had drifted{' (not fixed: dry run)' if dry_run else ''}.")
+    return drifted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="Users recounted per transaction.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report drift, without fixing it.")
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        raise SystemExit("--batch-size must be at least 1.")
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    nodes = [("primary", start_conn)] + [
+        (f"shard {index}", lambda dsn=dsn: connect_dsn(dsn)) for index, dsn in enumerate(POSTGRES_SHARD_DSNS)
+    ]
+    drifted = 0
+    for name, connect in nodes:
+        conn = connect()
+        if not conn:
+            raise SystemExit(f"Could not connect to the {name} database.")
+        try:
+            logger.info(f"Reconciling note stats on the {name} database.")
+            drifted += len(reconcile(conn, args.batch_size, args.dry_run))
+        finally:
+            conn.close()
+    if drifted and args.dry_run:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import itertools
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection as Connection
+
+from config import POSTGRES_REPLICA_DSNS, READ_YOUR_WRITES_WINDOW_SECONDS, REPLICA_RETRY_AFTER_SECONDS
+from database.pool import get_conn, put_conn
+
+logger = logging.getLogger(__name__)
+
+_LSN = re.compile(r"[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}")
+
+
+def parse_lsn(lsn: str) -> int:
+    """Returns a WAL position written as 'X/Y' (hexadecimal) as an integer. Raises ValueError if lsn isn't one."""
+    if not _LSN.fullmatch(lsn):
+        raise ValueError(f"Not an LSN: {lsn!r}")
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+class _Replica:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.unhealthy_until = 0.0
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+
+class ReplicaRouter:
+    """
+    Picks read replicas for DBHandler reads and tracks read-your-writes state.
+
+    Replicas are tried round-robin; one that fails to connect or errors during a
+    read is skipped for `retry_after_seconds`. When no replica is usable the
+    caller falls back to the primary.
+
+    After a user writes, the primary WAL position (LSN) of that write is kept for
+    `window_seconds`. During that window the user's reads only go to a replica
+    that has already replayed that LSN. This tracking is per process; the LSN is
+    also sent to the client in a cookie (middleware.read_your_writes), so a read
+    served by another worker process waits for the same LSN.
+    """
+
+    def __init__(
+        self,
+        replica_dsns: List[str],
+        window_seconds: float = READ_YOUR_WRITES_WINDOW_SECONDS,
+        retry_after_seconds: float = REPLICA_RETRY_AFTER_SECONDS,
+        connect: Callable[[str], Optional[Connection]] = get_conn,
+    ):
+        self._replicas = [_Replica(dsn) for dsn in replica_dsns]
+        self.window_seconds = window_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self._connect = connect
+        self._turn = itertools.count()
+        self._last_writes: Dict[int, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record_write(self, user_id: int, lsn: str):
+        """Remembers the primary LSN of a user's latest committed write."""
+        with self._lock:
+            self._last_writes[user_id] = (lsn, time.monotonic() + self.window_seconds)
+
+    def required_lsn(self, user_id: Optional[int]) -> Optional[str]:
+        """Returns the LSN a replica must have replayed to serve this user, or None."""
+        if user_id is None:
+            return None
+        with self._lock:
+            entry = self._last_writes.get(user_id)
+            if entry is None:
+                return None
+            lsn, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._last_writes[user_id]
+                return None
+            return lsn
+
+    def acquire(self) -> Optional[Tuple[Connection, str]]:
+        """
+        Checks out a connection to the next healthy replica.
+
+        Returns:
+            A (connection, dsn) tuple, or None if no replica is reachable.
+        """
+        if not self._replicas:
+            return None
+        now = time.monotonic()
+        start = next(self._turn)
+        for offset in range(len(self._replicas)):
+            replica = self._replicas[(start + offset) % len(self._replicas)]
+            if not replica.is_healthy(now):
+                continue
+            conn = self._connect(replica.dsn)
+            if conn:
+                # Reads run outside explicit transactions so replica connections never sit idle in one.
+                conn.set_session(readonly=True, autocommit=True)
+                return conn, replica.dsn
+            self.mark_failed(replica.dsn)
+        return None
+
+    def mark_failed(self, dsn: str):
+        """Takes a replica out of the selection for `retry_after_seconds`."""
+        for replica in self._replicas:
+            if replica.dsn == dsn:
+                replica.unhealthy_until = time.monotonic() + self.retry_after_seconds
+                logger.warning(f"Read replica marked unhealthy for {self.retry_after_seconds}s.")
+
+    @staticmethod
+    def has_replayed(conn: Connection, lsn: str) -> bool:
+        """Checks whether the replica behind `conn` has replayed WAL up to `lsn`."""
+        with conn.cursor() as cur:
+            # pg_last_wal_replay_lsn() is NULL on a server that is not in recovery.
+            cur.execute("SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, TRUE);", (lsn,))
+            return cur.fetchone()[0]
+
+    @staticmethod
+    def release(conn: Connection):
+        try:
+            put_conn(conn)
+        except psycopg2.Error:
+            logger.warning("Failed to release read replica connection.", exc_info=True)
+
+
+_router: Optional[ReplicaRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_replica_router() -> Optional[ReplicaRouter]:
+    """Returns the process-wide router, or None when no POSTGRES_REPLICA_DSNS are configured."""
+    global _router
+    if not POSTGRES_REPLICA_DSNS:
+        return None
+    with _router_lock:
+        if _router is None:
+            _router = ReplicaRouter(POSTGRES_REPLICA_DSNS)
+        return _router
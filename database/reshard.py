@@ -0,0 +1,306 @@
+"""
+Online resharding tool for the notes shards configured in POSTGRES_SHARD_DSNS.
+
+Commands:
+    move       Moves one user's notes to another node while the app keeps serving them.
+    pin        Pins every user to the node they live on now. Run it before appending
+               a node to POSTGRES_SHARD_DSNS, so no user is re-routed by the new ring
+               before their notes have been moved.
+    rebalance  Moves every pinned user whose ring node differs from their current
+               node, then drops the pins the ring agrees with.
+
+Usage:
+    python -m database.reshard move --user-id 42 --to 2
+    python -m database.reshard pin
+    python -m database.reshard rebalance
+    python -m database.reshard --lock-timeout-ms 5000 rebalance
+"""
+import argparse
+import logging
+from typing import Dict, List, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection as Connection
+from psycopg2.extras import execute_values
+
+from config import DB_LOCK_TIMEOUT_MS, DB_STATEMENT_TIMEOUT_MS
+from database.connection import start_conn
+from database.sharding import ShardRouter, get_shard_router
+
+logger = logging.getLogger(__name__)
+
+# Tables holding a user's notes; archived notes move along with the hot ones.
+NOTE_TABLES = ("notes", "notes_archive")
+
+
+def _note_columns(conn: Connection, table: str) -> List[str]:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+            ORDER BY ordinal_position;
+            """,
+            (table,)
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def _row_hashes(conn: Connection, table: str, columns: List[str], user_id: int) -> Dict[int, str]:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT note_id, md5(ROW({', '.join(columns)})::text) FROM {table} WHERE user_id = %s;",
+            (user_id,)
+        )
+        return dict(cur.fetchall())
+
+
+def _copy_notes(source: Connection, target: Connection, table: str, columns: List[str], note_ids: List[int]):
+    """Copies the given notes of table from source to target, replacing any copy already on target."""
+    with source.cursor() as cur:
+        cur.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE note_id = ANY(%s);", (note_ids,))
+        rows = cur.fetchall()
+    with target.cursor() as cur:
+        cur.execute(f"DELETE FROM {table} WHERE note_id = ANY(%s);", (note_ids,))
+        if rows:
+            execute_values(cur, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s;", rows)
+
+
+def move_user(router: ShardRouter, directory: Connection, user_id: int, target_index: int, batch_size: int = 500,
+              timeouts: Tuple[int, int] = (DB_STATEMENT_TIMEOUT_MS, DB_LOCK_TIMEOUT_MS)) -> int:
+    """
+    Moves a user's notes, archived ones included, to the node at target_index while the app keeps running.
+
+    1. Copies the notes to the target in batches, without blocking the app.
+    2. Takes the user's advisory lock exclusively on the source, which waits for
+       in-flight writes and holds off new ones, then copies whatever changed
+       during step 1, removes notes deleted meanwhile and copies the user's
+       deletion tombstones.
+    3. Commits the target, then marks the user as moved on the source (which
+       redirects any stale app process) and deletes the source copy and note
+       statistics, then points the directory at the target.
+
+    Re-running a move that was interrupted after step 3 began only finishes it.
+
+    Each query on the shards is limited by timeouts, (statement, lock) in
+    milliseconds. If the user's lock can't be taken in time, e.g. behind a long
+    write, the move raises LockNotAvailable and can simply be run again; while
+    the move waits for the lock, new writes of the user queue behind it.
+
+    Returns:
+        int: The number of notes the user has on the target.
+    """
+    router.forget(user_id)
+    source_index = router.shard_for(user_id, directory)
+    directory.commit()
+    if source_index == target_index:
+        logger.info(f"User {user_id} already lives on shard {target_index}.")
+        return 0
+
+    source = router.connect(source_index)
+    target = router.connect(target_index)
+    try:
+        for conn in (source, target):
+            # Row hashes compare timestamps as text, so both sides must render them alike.
+            with conn.cursor() as cur:
+                cur.execute("SET TIME ZONE 'UTC';")
+                cur.execute(
+                    "SELECT set_config('statement_timeout', %s, false), set_config('lock_timeout', %s, false);",
+                    tuple(str(ms) for ms in timeouts)
+                )
+            conn.commit()
+
+        moved = router.moved_to(source, [user_id])
+        source.rollback()
+        if moved:
+            logger.info(f"User {user_id} was already moved off shard {source_index}; finishing the directory update.")
+            target_index = moved[user_id]
+        else:
+            # Per table, so notes_archive keeps its archived_at on the target.
+            columns = {}
+            for table in NOTE_TABLES:
+                target_columns = set(_note_columns(target, table))
+                columns[table] = [column for column in _note_columns(source, table) if column in target_columns]
+            source.rollback()
+            target.rollback()
+
+            # Phase 1: bulk copy while the app keeps writing to the source.
+            for table in NOTE_TABLES:
+                last_note_id = 0
+                while True:
+                    with source.cursor() as cur:
+                        cur.execute(
+                            f"SELECT note_id FROM {table} WHERE user_id = %s AND note_id > %s ORDER BY note_id LIMIT %s;",
+                            (user_id, last_note_id, batch_size)
+                        )
+                        note_ids = [row[0] for row in cur.fetchall()]
+                    if not note_ids:
+                        source.rollback()
+                        break
+                    _copy_notes(source, target, table, columns[table], note_ids)
+                    source.rollback()
+                    target.commit()
+                    last_note_id = note_ids[-1]
+
+            # Phase 2: block the user's writes on the source and copy what changed meanwhile.
+            # The archiver skips the user too, so a note archived during phase 1 is found here.
+            with source.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s);", (user_id,))
+            for table in NOTE_TABLES:
+                source_hashes = _row_hashes(source, table, columns[table], user_id)
+                target_hashes = _row_hashes(target, table, columns[table], user_id)
+                changed = [note_id for note_id, digest in source_hashes.items() if target_hashes.get(note_id) != digest]
+                with target.cursor() as cur:
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE user_id = %s AND NOT (note_id = ANY(%s));",
+                        (user_id, list(source_hashes))
+                    )
+                for start in range(0, len(changed), batch_size):
+                    _copy_notes(source, target, table, columns[table], changed[start:start + batch_size])
+            with source.cursor() as cur:
+                cur.execute("SELECT user_id, note_id, deleted_at FROM note_deletions WHERE user_id = %s;", (user_id,))
+                tombstones = cur.fetchall()
+            with target.cursor() as cur:
+                # Deletion tombstones move too, so delta syncs keep reporting notes deleted before the move.
+                if tombstones:
+                    execute_values(
+                        cur,
+                        """
+                        INSERT INTO note_deletions (user_id, note_id, deleted_at) VALUES %s
+                        ON CONFLICT (user_id, note_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+                        """,
+                        tombstones
+                    )
+                cur.execute("DELETE FROM shard_moved_users WHERE user_id = %s;", (user_id,))
+            target.commit()
+
+            # Phase 3: hand the user over. Blocked writers see the marker and follow it.
+            with source.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO shard_moved_users (user_id, moved_to) VALUES (%s, %s)
+                    ON CONFLICT (user_id) DO UPDATE SET moved_to = EXCLUDED.moved_to, moved_at = CURRENT_TIMESTAMP;
+                    """,
+                    (user_id, target_index)
+                )
+                cur.execute("DELETE FROM notes WHERE user_id = %s;", (user_id,))
+                cur.execute("DELETE FROM notes_archive WHERE user_id = %s;", (user_id,))
+                cur.execute("DELETE FROM note_deletions WHERE user_id = %s;", (user_id,))
+                # The statistics triggers counted the notes on the target as they were copied.
+                cur.execute("DELETE FROM user_tag_stats WHERE user_id = %s;", (user_id,))
+                cur.execute("DELETE FROM user_note_stats WHERE user_id = %s;", (user_id,))
+            source.commit()
+
+        with directory.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO user_shard_overrides (user_id, shard_index) VALUES (%s, %s)
+                ON CONFLICT (user_id) DO UPDATE SET shard_index = EXCLUDED.shard_index, updated_at = CURRENT_TIMESTAMP;
+                """,
+                (user_id, target_index)
+            )
+        directory.commit()
+        router.relocate(user_id, target_index)
+
+        with target.cursor() as cur:
+            cur.execute(
+                "SELECT (SELECT count(*) FROM notes WHERE user_id = %s) + (SELECT count(*) FROM notes_archive WHERE user_id = %s);",
+                (user_id, user_id)
+            )
+            note_count = cur.fetchone()[0]
+        target.rollback()
+        logger.info(f"Moved user {user_id} from shard {source_index} to shard {target_index} ({note_count} notes).")
+        return note_count
+    except psycopg2.Error:
+        for conn in (source, target, directory):
+            conn.rollback()
+        raise
+    finally:
+        source.close()
+        target.close()
+
+
+def pin_all_users(router: ShardRouter, directory: Connection) -> int:
+    """Pins every user without an override to their current ring node. Returns how many were pinned."""
+    with directory.cursor() as cur:
+        cur.execute(
+            "SELECT user_id FROM users WHERE user_id NOT IN (SELECT user_id FROM user_shard_overrides);"
+        )
+        user_ids = [row[0] for row in cur.fetchall()]
+        if user_ids:
+            execute_values(
+                cur,
+                "INSERT INTO user_shard_overrides (user_id, shard_index) VALUES %s ON CONFLICT (user_id) DO NOTHING;",
+                [(user_id, router.ring.node_for(user_id)) for user_id in user_ids]
+            )
+    directory.commit()
+    logger.info(f"Pinned {len(user_ids)} users to their current shard.")
+    return len(user_ids)
+
+
+def rebalance(router: ShardRouter, directory: Connection,
+              timeouts: Tuple[int, int] = (DB_STATEMENT_TIMEOUT_MS, DB_LOCK_TIMEOUT_MS)) -> int:
+    """Moves pinned users to their ring node and drops pins the ring agrees with. Returns how many were moved."""
+    with directory.cursor() as cur:
+        cur.execute("SELECT user_id, shard_index FROM user_shard_overrides ORDER BY user_id;")
+        overrides = cur.fetchall()
+    directory.commit()
+
+    moved = 0
+    for user_id, shard_index in overrides:
+        ring_index = router.ring.node_for(user_id)
+        if shard_index != ring_index:
+            move_user(router, directory, user_id, ring_index, timeouts=timeouts)
+            moved += 1
+    with directory.cursor() as cur:
+        for user_id, _ in overrides:
+            cur.execute(
+                "DELETE FROM user_shard_overrides WHERE user_id = %s AND shard_index = %s;",
+                (user_id, router.ring.node_for(user_id))
+            )
+    directory.commit()
+    logger.info(f"Rebalanced {moved} users.")
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser("move", help="Move one user's notes to another shard.")
+    move.add_argument("--user-id", type=int, required=True)
+    move.add_argument("--to", type=int, required=True, help="Index of the target shard in POSTGRES_SHARD_DSNS.")
+    move.add_argument("--batch-size", type=int, default=500)
+    commands.add_parser("pin", help="Pin every user to their current shard.")
+    commands.add_parser("rebalance", help="Move pinned users to their ring shard.")
+    parser.add_argument("--statement-timeout-ms", type=int, default=DB_STATEMENT_TIMEOUT_MS,
+                        help="Longest a query on a shard may run (0 for no limit).")
+    parser.add_argument("--lock-timeout-ms", type=int, default=DB_LOCK_TIMEOUT_MS,
+                        help="Longest a move waits for the user's lock (0 for no limit).")
+    args = parser.parse_args()
+    timeouts = (args.statement_timeout_ms, args.lock_timeout_ms)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    router = get_shard_router()
+    if not router:
+        raise SystemExit("POSTGRES_SHARD_DSNS is not configured.")
+    directory = start_conn()
+    if not directory:
+        raise SystemExit("Could not connect to the primary database.")
+    try:
+        if args.command == "move":
+            if not 0 <= args.to < len(router.shard_dsns):
+                raise SystemExit(f"--to must be between 0 and {len(router.shard_dsns) - 1}.")
+            move_user(router, directory, args.user_id, args.to, args.batch_size, timeouts)
+        elif args.command == "pin":
+            pin_all_users(router, directory)
+        else:
+            rebalance(router, directory, timeouts)
+    finally:
+        directory.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import bisect
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2.extensions import connection as Connection
+
+from config import POSTGRES_SHARD_DSNS, SHARD_VIRTUAL_NODES
+from database.pool import get_conn, put_conn
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping user ids to node indexes.
+
+    Each node is placed on the ring `virtual_nodes` times so keys spread evenly,
+    and adding a node only moves the keys that land on its new ring points.
+    Nodes are identified by their position in the configured list, so new nodes
+    must only ever be appended.
+    """
+
+    def __init__(self, node_count: int, virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        if node_count < 1:
+            raise ValueError("A hash ring needs at least one node.")
+        points = sorted(
+            (_hash(f"shard-{index}#{replica}"), index)
+            for index in range(node_count)
+            for replica in range(virtual_nodes)
+        )
+        self._keys = [point for point, _ in points]
+        self._nodes = [index for _, index in points]
+
+    def node_for(self, user_id: int) -> int:
+        """Returns the index of the node that owns user_id."""
+        position = bisect.bisect(self._keys, _hash(str(user_id))) % len(self._keys)
+        return self._nodes[position]
+
+
+class ShardRouter:
+    """
+    Resolves which notes node (shard) holds each user's notes.
+
+    Placement comes from the hash ring unless the directory table
+    `user_shard_overrides` on the primary pins the user to another node, which
+    is what the resharding tool writes after moving a user. Placements are
+    cached per process; a node a user was moved away from keeps a row in
+    `shard_moved_users` naming the user's new node, so a stale cache is
+    detected and corrected on use.
+    """
+
+    def __init__(
+        self,
+        shard_dsns: List[str],
+        virtual_nodes: int = SHARD_VIRTUAL_NODES,
+        connect: Callable[[str], Optional[Connection]] = get_conn,
+    ):
+        self.shard_dsns = shard_dsns
+        self.ring = HashRing(len(shard_dsns), virtual_nodes)
+        self._connect = connect
+        self._placements: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def shard_for(self, user_id: int, directory: Connection) -> int:
+        """
+        Returns the index of the node holding user_id's notes.
+
+        Args:
+            user_id: The user to locate.
+            directory: A connection to the primary, where the override table lives.
+        """
+        with self._lock:
+            if user_id in self._placements:
+                return self._placements[user_id]
+        with directory.cursor() as cur:
+            cur.execute("SELECT shard_index FROM user_shard_overrides WHERE user_id = %s;", (user_id,))
+            row = cur.fetchone()
+        index = row[0] if row else self.ring.node_for(user_id)
+        with self._lock:
+            self._placements[user_id] = index
+        return index
+
+    def forget(self, user_id: int):
+        """Drops the cached placement of user_id so the next lookup reads the directory again."""
+        with self._lock:
+            self._placements.pop(user_id, None)
+
+    def relocate(self, user_id: int, index: int):
+        """Caches that user_id now lives on the node at `index`."""
+        with self._lock:
+            self._placements[user_id] = index
+
+    def connect(self, index: int) -> Connection:
+        """Checks out a connection to the node at `index`, raising OperationalError if it is unreachable."""
+        conn = self._connect(self.shard_dsns[index])
+        if not conn:
+            raise psycopg2.OperationalError(f"Could not connect to notes shard {index}.")
+        return conn
+
+    @staticmethod
+    def release(conn: Connection):
+        try:
+            put_conn(conn)
+        except psycopg2.Error:
+            logger.warning("Failed to release notes shard connection.", exc_info=True)
+
+    @staticmethod
+    def moved_to(conn: Connection, user_ids: List[int]) -> Dict[int, int]:
+        """Returns {user_id: new node index} for the user_ids moved off the node behind `conn`."""
+        with conn.cursor() as cur:
+            cur.execute("SELECT user_id, moved_to FROM shard_moved_users WHERE user_id = ANY(%s);", (list(user_ids),))
+            return dict(cur.fetchall())
+
+
+_router: Optional[ShardRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_shard_router() -> Optional[ShardRouter]:
+    """Returns the process-wide router, or None when no POSTGRES_SHARD_DSNS are configured."""
+    global _router
+    if not POSTGRES_SHARD_DSNS:
+        return None
+    with _router_lock:
+        if _router is None:
+            _router = ShardRouter(POSTGRES_SHARD_DSNS)
+        return _router
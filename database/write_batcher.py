@@ -0,0 +1,193 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection as Connection
+
+from config import (
+    DB_LOCK_TIMEOUT_MS,
+    DB_STATEMENT_TIMEOUT_MS,
+    NOTES_BATCH_MAX_SIZE,
+    NOTES_BATCH_MAX_WAIT_MS,
+    NOTES_WRITE_BATCHING,
+)
+from database.connection import start_conn
+from database.db_handler import TIMEOUT_ERRORS, DBHandler
+from database.replicas import get_replica_router
+from database.sharding import get_shard_router
+
+logger = logging.getLogger(__name__)
+
+NoteRow = Tuple[int, str, Optional[str], Optional[str]]
+Timeouts = Tuple[int, int]
+
+# How long a batch may run when the caller's statement timeout is 0 (no limit), for bounding submit's wait.
+UNLIMITED_STATEMENT_WAIT_SECONDS = 30.0
+
+
+class WriteBatchTimeout(Exception):
+    """Raised by submit when the batch holding an insert didn't finish in time, e.g. because the flushing thread stalled."""
+
+
+class NoteWriteBatcher:
+    """
+    Coalesces concurrent note inserts into multi-row transactions (group commit).
+
+    Callers block in `submit` while a single background thread gathers pending
+    inserts for up to `max_wait_ms` or `max_batch_size` rows, whichever comes
+    first, and flushes them with `DBHandler.create_notes_bulk` on its own
+    connection. Each caller receives its own row, or None if it failed; a
+    caller whose insert ran out of time gets the timeout error raised, as a
+    direct insert would. Rows submitted with different timeouts are flushed in
+    separate transactions, each under its callers' limits. A caller waits at
+    most for the batch ahead of it and its own to run to their statement
+    timeout; past that it gets WriteBatchTimeout instead of hanging.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Optional[Connection]] = start_conn,
+        max_batch_size: int = NOTES_BATCH_MAX_SIZE,
+        max_wait_ms: float = NOTES_BATCH_MAX_WAIT_MS,
+    ):
+        self._connect = connect
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Optional[Tuple[NoteRow, Timeouts, Future]]]" = queue.Queue()
+        self._conn: Optional[Connection] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the background flushing thread if it is not running yet."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="note-write-batcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Flushes what is already queued, then stops the thread and closes its connection."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def submit(self, user_id: int, title: str, description: Optional[str], tags: Optional[str],
+               timeouts: Optional[Timeouts] = None) -> Optional[Dict[str, Any]]:
+        """
+        Queues one note insert and waits for the batch containing it to commit.
+
+        Args:
+            timeouts: The (statement, lock) timeouts in milliseconds for the insert, usually
+                the calling request's; defaults to DB_STATEMENT_TIMEOUT_MS and DB_LOCK_TIMEOUT_MS.
+
+        Returns:
+            The created note as a dict, or None if the insert failed.
+
+        Raises:
+            One of TIMEOUT_ERRORS if the batch holding the insert ran out of time.
+            WriteBatchTimeout if no result arrived in time; the insert may still commit later.
+        """
+        self.start()
+        future: Future = Future()
+        timeouts = timeouts or (DB_STATEMENT_TIMEOUT_MS, DB_LOCK_TIMEOUT_MS)
+        self._queue.put(((user_id, title, description, tags), timeouts, future))
+        try:
+            return future.result(timeout=self._result_timeout(timeouts))
+        except FutureTimeoutError:
+            logger.error(f"Note write batcher gave no result for user_id {user_id} in time.")
+            raise WriteBatchTimeout("The note write batch did not finish in time.")
+
+    def _result_timeout(self, timeouts: Timeouts) -> float:
+        # The batch being flushed when the row was queued, then the row's own batch, plus a second for connecting.
+        statement = timeouts[0] / 1000 if timeouts[0] > 0 else UNLIMITED_STATEMENT_WAIT_SECONDS
+        return self.max_wait + 2 * statement + 1.0
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stopping:
+                break
+        self._close_conn()
+
+    def _flush(self, batch: List[Tuple[NoteRow, Timeouts, Future]]):
+        groups: Dict[Timeouts, List[Tuple[NoteRow, Future]]] = {}
+        for row, timeouts, future in batch:
+            groups.setdefault(timeouts, []).append((row, future))
+        for timeouts, group in groups.items():
+            rows = [row for row, _ in group]
+            try:
+                results = self._create_notes(rows, timeouts)
+            except Exception as e:
+                logger.error(f"Note write batch of {len(rows)} rows failed.", exc_info=True)
+                for _, future in group:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(group, results):
+                if isinstance(result, TIMEOUT_ERRORS):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _create_notes(self, rows: List[NoteRow], timeouts: Timeouts) -> List[Any]:
+        if self._conn is None or self._conn.closed:
+            self._conn = self._connect()
+        if not self._conn:
+            logger.error("Note write batcher could not connect to the database.")
+            return [None] * len(rows)
+        handler = DBHandler(self._conn, read_router=get_replica_router(), shard_router=get_shard_router())
+        try:
+            handler.set_timeouts(*timeouts)
+            results = handler.create_notes_bulk(rows)
+        finally:
+            handler.close()
+        if self._conn.closed:
+            # The connection broke mid-batch; reconnect on the next flush.
+            self._conn = None
+        return results
+
+    def _close_conn(self):
+        if self._conn is not None and not self._conn.closed:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                logger.warning("Failed to close note write batcher connection.", exc_info=True)
+        self._conn = None
+
+
+_batcher: Optional[NoteWriteBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_note_write_batcher() -> Optional[NoteWriteBatcher]:
+    """Returns the process-wide batcher, or None when NOTES_WRITE_BATCHING is off."""
+    global _batcher
+    if not NOTES_WRITE_BATCHING:
+        return None
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = NoteWriteBatcher()
+        return _batcher
@@ -4,7 +4,14 @@
 # So we can directly run our setup script.
 
 echo "Running database migrations..."
-python db_config.py
+python -m database.db_config
 
-echo "Starting FastAPI server..."
-uvicorn main:app --host 0.0.0.0 --port 8000
+# SERVER_MODE=production (default) runs several worker processes under gunicorn;
+# SERVER_MODE=development runs a single uvicorn process with auto-reload.
+if [ "${SERVER_MODE:-production}" = "development" ]; then
+    echo "Starting FastAPI development server..."
+    exec uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+fi
+
+echo "Starting FastAPI server with gunicorn..."
+exec gunicorn main:app -c gunicorn.conf.py
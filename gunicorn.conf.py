@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for the production server mode:
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Runs WEB_CONCURRENCY uvicorn worker processes (one per CPU by default). The app
+is imported once in the master and the workers are forked from it; each worker
+opens its own connection pools in the app lifespan. On SIGTERM, workers stop
+accepting connections and get GRACEFUL_TIMEOUT seconds to finish in-flight requests.
+"""
+import multiprocessing
+import os
+
+from uvicorn_worker import UvicornWorker
+
+
+class NotesUvicornWorker(UvicornWorker):
+    """Uvicorn worker that closes lingering connections (e.g. note event streams) before gunicorn's graceful timeout."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Leave time for the lifespan shutdown to run before gunicorn kills the worker.
+        self.config.timeout_graceful_shutdown = max(1, self.cfg.graceful_timeout - 5)
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = NotesUvicornWorker
+# Nothing connects to the database or starts threads at import time, so it's safe to fork after loading the app.
+preload_app = True
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+keepalive = 5
+accesslog = "-"
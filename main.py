@@ -1,19 +1,84 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+from psycopg2.errors import LockNotAvailable, QueryCanceled
 
+from config import TRAFFIC_CAPTURE
+from database.note_events import get_note_event_hub
+from database.pool import close_pools, open_pools
+from database.write_batcher import WriteBatchTimeout, get_note_write_batcher
 from logging_config import setup_logging
-from routes import users, notes, auth
+from middleware.capture import TrafficCaptureMiddleware, close_traffic_recorder
+from middleware.disconnect import DisconnectCancelMiddleware
+from middleware.idempotency import idempotency_middleware
+from middleware.read_your_writes import read_your_writes_middleware
+from routes import users, notes, auth, metrics
 
 setup_logging()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates and releases the resources of one worker process.
+
+    Under gunicorn this runs in each worker after it is forked, so no connection
+    is shared between processes. Shutdown runs once the server has stopped
+    accepting connections and the in-flight requests have finished.
+    """
+    open_pools()
+    yield
+    get_note_event_hub().stop(timeout=5)
+    batcher = get_note_write_batcher()
+    if batcher:
+        batcher.stop(timeout=5)
+    close_traffic_recorder(timeout=5)
+    close_pools()
+
 app = FastAPI(
     title="Notes API",
     description="A simple API to manage users and their notes.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+app.middleware("http")(read_your_writes_middleware)
+app.middleware("http")(idempotency_middleware)
+if TRAFFIC_CAPTURE:
+    # Outside the idempotency middleware, so replayed responses are recorded as the client got them.
+    app.add_middleware(TrafficCaptureMiddleware)
+# Added last so it is the outermost middleware and sees a disconnect first.
+app.add_middleware(DisconnectCancelMiddleware)
+
+@app.exception_handler(QueryCanceled)
+async def query_canceled_handler(request: Request, exc: QueryCanceled):
+    """A query ran past its statement timeout, or was canceled because the client disconnected."""
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": "The database took too long to answer."}
+    )
+
+@app.exception_handler(WriteBatchTimeout)
+async def write_batch_timeout_handler(request: Request, exc: WriteBatchTimeout):
+    """A batched insert got no result in time; it may still be committed."""
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": "The database took too long to answer."}
+    )
+
+@app.exception_handler(LockNotAvailable)
+async def lock_not_available_handler(request: Request, exc: LockNotAvailable):
+    """A write waited past its lock timeout for a row another request is changing."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "The resource is busy. Try again shortly."},
+        headers={"Retry-After": "1"}
+    )
+
 app.include_router(users.router)
 app.include_router(notes.router)
 app.include_router(auth.router)
+app.include_router(metrics.router)
 
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
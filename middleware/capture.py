@@ -0,0 +1,243 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+from config import (
+    METRICS_TOKEN,
+    SECRET_TOKEN,
+    TRAFFIC_CAPTURE_BACKUPS,
+    TRAFFIC_CAPTURE_DIR,
+    TRAFFIC_CAPTURE_MAX_BODY_BYTES,
+    TRAFFIC_CAPTURE_MAX_FILE_MB,
+    TRAFFIC_CAPTURE_SAMPLE_RATE,
+)
+from security import verify_token
+
+logger = logging.getLogger(__name__)
+
+# Header values that are never written to a capture.
+REDACTED_HEADERS = {"authorization", "cookie", "proxy-authorization", "x-metrics-token"}
+# Headers the replay tool sets itself.
+SKIPPED_HEADERS = {"host", "content-length", "connection"}
+REDACTED = "[REDACTED]"
+
+
+class TrafficRecorder:
+    """
+    Appends captured requests, one JSON object per line, to a rotating file.
+
+    Each process writes to its own capture-<pid>.jsonl in directory, so
+    gunicorn workers never rotate each other's files. When the file passes
+    max_bytes it is renamed to .1 (and older files shifted up to .backups).
+
+    record() only queues the entry; a background thread writes it, so the event
+    loop never waits on the disk. When max_pending entries are already waiting
+    the new one is dropped rather than let the queue grow.
+    """
+
+    def __init__(self, directory: str = TRAFFIC_CAPTURE_DIR, max_bytes: int = int(TRAFFIC_CAPTURE_MAX_FILE_MB * 2**20),
+                 backups: int = TRAFFIC_CAPTURE_BACKUPS, max_pending: int = 1000):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"capture-{os.getpid()}.jsonl")
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max(1, max_pending))
+        self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+        self._thread.start()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            try:
+                self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                self._file.flush()
+                if self._file.tell() >= self.max_bytes:
+                    self._rotate()
+            except (OSError, TypeError, ValueError):
+                logger.error("Failed to write a captured request.", exc_info=True)
+        self._file.close()
+
+    def record(self, entry: Dict[str, Any]):
+        """Queues entry to be written. Never blocks."""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Traffic capture is falling behind; {self.dropped} captured requests dropped so far.")
+
+    def close(self, timeout: Optional[float] = None):
+        """Writes the entries already queued, then stops the writer thread and closes the file."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+_recorder: Optional[TrafficRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_traffic_recorder() -> TrafficRecorder:
+    """Returns this process's traffic recorder, opening its capture file on first use."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = TrafficRecorder()
+        return _recorder
+
+
+def close_traffic_recorder(timeout: Optional[float] = None):
+    """Closes this process's traffic recorder, if capturing ever started."""
+    global _recorder
+    with _recorder_lock:
+        recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close(timeout)
+
+
+def _encode_body(body: bytes) -> Dict[str, Any]:
+    try:
+        return {"body": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body": base64.b64encode(body).decode("ascii"), "body_encoding": "base64"}
+
+
+class TrafficCaptureMiddleware:
+    """
+    Records a random sample of requests for later replay by benchmarks.replay_traffic.
+
+    For each sampled request it stores the method, path, query, headers, body
+    and the id of the authenticated user, together with the response status,
+    size, a digest of the response body and how long the response took.
+    Authorization, cookie and metrics token values, and the secret and metrics
+    tokens anywhere in a request body, are replaced by "[REDACTED]"; responses that contain the secret token
+    (logins) get no digest, even when it is split across chunks. The entry is
+    handed to the recorder's writer thread, so the disk is never touched on the event loop. Responses are passed
+    through as they are produced, so streams aren't held back, and event
+    streams aren't recorded at all since they can't be replayed.
+    """
+
+    def __init__(self, app, recorder: Optional[TrafficRecorder] = None, sample_rate: float = TRAFFIC_CAPTURE_SAMPLE_RATE):
+        self.app = app
+        self._recorder = recorder
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        started = time.perf_counter()
+        body = bytearray()
+        truncated = False
+        response: Dict[str, Any] = {"bytes": 0}
+        digest = hashlib.sha256()
+        secret = SECRET_TOKEN.encode() if SECRET_TOKEN else None
+        # The end of the previous response chunk, so a secret split across two chunks is still found.
+        carry = b""
+
+        async def receive_and_keep():
+            nonlocal truncated
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                # Once a chunk is skipped the body can't be replayed, so nothing after it is kept either.
+                if truncated or len(body) + len(chunk) > TRAFFIC_CAPTURE_MAX_BODY_BYTES:
+                    truncated = True
+                else:
+                    body.extend(chunk)
+            return message
+
+        async def send_and_measure(message):
+            nonlocal carry
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in message.get("headers", [])}
+                response["content_type"] = headers.get("content-type")
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                response["bytes"] += len(chunk)
+                digest.update(chunk)
+                if secret and not response.get("redacted"):
+                    window = carry + chunk
+                    if secret in window:
+                        response["redacted"] = True
+                    carry = window[-(len(secret) - 1):] if len(secret) > 1 else b""
+                if not message.get("more_body", False):
+                    response["duration_ms"] = (time.perf_counter() - started) * 1000
+            await send(message)
+
+        try:
+            await self.app(scope, receive_and_keep, send_and_measure)
+        finally:
+            if "status" in response and not (response.get("content_type") or "").startswith("text/event-stream"):
+                try:
+                    await self._record(scope, bytes(body), truncated, started_at, response, digest.hexdigest())
+                except Exception:
+                    # Capturing must never break the request it observes.
+                    logger.error("Failed to record captured request.", exc_info=True)
+
+    async def _record(self, scope, body: bytes, truncated: bool, started_at: float, response: Dict[str, Any], body_digest: str):
+        headers: Dict[str, str] = {}
+        authorization = None
+        for key, value in scope.get("headers", []):
+            name = key.decode("latin-1").lower()
+            if name == "authorization":
+                authorization = value.decode("latin-1")
+            if name in SKIPPED_HEADERS:
+                continue
+            headers[name] = REDACTED if name in REDACTED_HEADERS else value.decode("latin-1")
+
+        user_id = None
+        if authorization:
+            try:
+                user_id = await verify_token(authorization)
+            except HTTPException:
+                pass
+
+        for token in (SECRET_TOKEN, METRICS_TOKEN):
+            if token:
+                body = body.replace(token.encode(), REDACTED.encode())
+        entry = {
+            "ts": started_at,
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "headers": headers,
+            "user_id": user_id,
+            **_encode_body(body),
+            "status": response["status"],
+            "response_bytes": response["bytes"],
+            "duration_ms": round(response.get("duration_ms", (time.time() - started_at) * 1000), 3),
+        }
+        if truncated:
+            entry["body_truncated"] = True
+        if not response.get("redacted"):
+            entry["response_sha256"] = body_digest
+        (self._recorder or get_traffic_recorder()).record(entry)
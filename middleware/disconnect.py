@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import threading
+from typing import Optional, Set
+
+from fastapi import Request
+
+from database.db_handler import DBHandler
+
+logger = logging.getLogger(__name__)
+
+# Key of the request's QueryCanceller in the ASGI scope.
+SCOPE_KEY = "query_canceller"
+
+
+class QueryCanceller:
+    """
+    Collects the database handlers of one request, to cancel their queries if its client goes away.
+
+    Once the response has started nothing is canceled any more: the queries are
+    done and the connections may already be serving other requests.
+    """
+
+    def __init__(self):
+        self._targets: Set[DBHandler] = set()
+        self._active = True
+        self._lock = threading.Lock()
+
+    def register(self, target: DBHandler):
+        with self._lock:
+            if self._active:
+                self._targets.add(target)
+
+    def unregister(self, target: DBHandler):
+        # Waits for a cancel in progress, so a connection is never canceled after it was handed back.
+        with self._lock:
+            self._targets.discard(target)
+
+    def close(self):
+        with self._lock:
+            self._active = False
+            self._targets.clear()
+
+    def cancel(self) -> int:
+        """Cancels the running queries of every registered target and returns how many there were."""
+        with self._lock:
+            if not self._active:
+                return 0
+            self._active = False
+            targets = list(self._targets)
+            for target in targets:
+                target.cancel()
+            self._targets.clear()
+        return len(targets)
+
+
+def get_query_canceller(request: Request) -> Optional[QueryCanceller]:
+    """Returns the request's QueryCanceller, or None when DisconnectCancelMiddleware isn't installed."""
+    return request.scope.get(SCOPE_KEY)
+
+
+class DisconnectCancelMiddleware:
+    """
+    Cancels a request's database queries as soon as its client disconnects.
+
+    Sync routes run in a worker thread and only notice a disconnect after their
+    queries finish, so this middleware reads the request's ASGI messages itself
+    and, on http.disconnect, cancels the queries of the handlers registered in
+    the request's QueryCanceller. The canceled query makes the handler raise
+    QueryCanceled and the connection returns to its pool right away.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        canceller = QueryCanceller()
+        scope[SCOPE_KEY] = canceller
+        messages: asyncio.Queue = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def watch():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    # cancel() opens a connection to each server, so it runs off the event loop.
+                    canceled = await asyncio.get_running_loop().run_in_executor(None, canceller.cancel)
+                    if canceled:
+                        logger.info(f"Client disconnected from {scope['method']} {scope['path']}; canceled its database queries.")
+                    return
+
+        async def receive_from_watcher():
+            if disconnected.is_set() and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        async def send_and_stop_cancelling(message):
+            if message["type"] == "http.response.start":
+                canceller.close()
+            await send(message)
+
+        watcher = asyncio.create_task(watch())
+        try:
+            await self.app(scope, receive_from_watcher, send_and_stop_cancelling)
+        finally:
+            canceller.close()
+            watcher.cancel()
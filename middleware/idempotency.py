@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
+
+from config import IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_WAIT_SECONDS
+from security import verify_token
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+MAX_KEY_LENGTH = 255
+
+Scope = Tuple[int, str]
+# Raw header list of an ASGI response, repeated names (e.g. set-cookie) included.
+RawHeaders = List[Tuple[bytes, bytes]]
+
+
+def _build_response(status_code: int, body: bytes, headers: RawHeaders) -> Response:
+    response = Response(content=body, status_code=status_code)
+    response.raw_headers = list(headers)
+    return response
+
+
+class StoredResponse:
+    def __init__(self, status_code: int, body: bytes, headers: RawHeaders):
+        self.status_code = status_code
+        self.body = body
+        self.headers = list(headers)
+
+    def to_response(self) -> Response:
+        return _build_response(self.status_code, self.body, [*self.headers, (b"idempotent-replayed", b"true")])
+
+
+class _Entry:
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.response: Optional[StoredResponse] = None
+        self.done = asyncio.Event()
+
+
+class IdempotencyStore:
+    """
+    Remembers the response to each (user_id, Idempotency-Key) for ttl_seconds.
+
+    At most max_keys finished entries are kept; the oldest are evicted first.
+    Requests still running are never evicted, so the store can exceed max_keys
+    by the number of requests in flight. Entries live in this process's memory, so a retry that reaches another worker
+    process is executed again.
+    """
+
+    def __init__(self, max_keys: int = IDEMPOTENCY_MAX_KEYS, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max(1, max_keys)
+        self.ttl = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Scope, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        # Entries are kept in creation order, so expired ones are at the front. Entries still
+        # running are skipped: dropping one would let its retries run the request again.
+        evicted = []
+        for scope, entry in self._entries.items():
+            if entry.expires_at > now and len(self._entries) - len(evicted) < self.max_keys:
+                break
+            if entry.response is not None:
+                evicted.append(scope)
+        for scope in evicted:
+            del self._entries[scope]
+
+    def begin(self, scope: Scope, fingerprint: str) -> Tuple[str, Optional[_Entry]]:
+        """
+        Looks up scope and claims it if it is new.
+
+        Returns:
+            ("execute", entry) if the caller must run the request and then call complete or abandon;
+            ("replay", entry) if entry.response holds the stored result;
+            ("wait", entry) if the same request is still running, to await entry.done and retry;
+            ("mismatch", None) if the key was used for a different request.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is not None and entry.expires_at <= now and entry.response is not None:
+                del self._entries[scope]
+                entry = None
+            if entry is None:
+                self._evict(now)
+                entry = _Entry(fingerprint, now + self.ttl)
+                self._entries[scope] = entry
+                return "execute", entry
+            if entry.fingerprint != fingerprint:
+                return "mismatch", None
+            if entry.response is None:
+                return "wait", entry
+            return "replay", entry
+
+    def complete(self, entry: _Entry, response: StoredResponse):
+        """Stores the response of a claimed request and wakes the requests waiting on it."""
+        entry.response = response
+        entry.done.set()
+
+    def abandon(self, scope: Scope, entry: _Entry):
+        """Forgets a claimed request whose response must not be replayed, and wakes its waiters to run it themselves."""
+        with self._lock:
+            if self._entries.get(scope) is entry:
+                del self._entries[scope]
+        entry.done.set()
+
+
+def _is_replayable(status_code: int) -> bool:
+    # Server errors and load shedding are transient: a retry should run again.
+    return status_code < 500 and status_code != status.HTTP_429_TOO_MANY_REQUESTS
+
+
+def _fingerprint(request: Request, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (request.method, request.url.path, request.url.query):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+_store: Optional[IdempotencyStore] = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Returns the process-wide idempotency store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = IdempotencyStore()
+        return _store
+
+
+async def idempotency_middleware(request: Request, call_next):
+    """
+    Makes mutating requests that carry an Idempotency-Key header safe to retry.
+
+    The first response per (user, key) is stored, unless it is a server error
+    or a 429, and replayed with all its headers to later requests with the
+    same key and payload without running the route again. A retry that arrives while the first
+    request is still running waits for its result. Reusing a key for a
+    different request gets 422.
+    """
+    key = request.headers.get("Idempotency-Key")
+    if key is None or request.method not in IDEMPOTENT_METHODS:
+        return await call_next(request)
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters long."}
+        )
+    try:
+        user_id = await verify_token(request.headers.get("Authorization"))
+    except HTTPException:
+        # Let the route reject the request as usual; nothing is stored.
+        return await call_next(request)
+
+    scope = (user_id, key)
+    fingerprint = _fingerprint(request, await request.body())
+    store = get_idempotency_store()
+    while True:
+        state, entry = store.begin(scope, fingerprint)
+        if state == "mismatch":
+            return JSONResponse(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                content={"detail": "Idempotency-Key was already used for a different request."}
+            )
+        if state == "replay":
+            logger.info(f"Replaying stored response for idempotency key of user_id {user_id}.")
+            return entry.response.to_response()
+        if state == "execute":
+            break
+        try:
+            await asyncio.wait_for(entry.done.wait(), timeout=IDEMPOTENCY_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            return JSONResponse(
+                status_code=status.HTTP_409_CONFLICT,
+                content={"detail": "A request with this Idempotency-Key is still being processed."}
+            )
+
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except BaseException:
+        store.abandon(scope, entry)
+        raise
+
+    if _is_replayable(response.status_code):
+        store.complete(entry, StoredResponse(response.status_code, body, response.raw_headers))
+    else:
+        store.abandon(scope, entry)
+    return _build_response(response.status_code, body, response.raw_headers)
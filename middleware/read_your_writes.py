@@ -0,0 +1,58 @@
+import logging
+import math
+from typing import Optional
+
+from fastapi import Request
+
+from config import READ_YOUR_WRITES_WINDOW_SECONDS
+from database.db_handler import DBHandler
+from database.replicas import parse_lsn
+
+logger = logging.getLogger(__name__)
+
+# Cookie carrying the primary LSN of the client's latest write, written X-Y instead of X/Y
+# since a slash would make the value a quoted string.
+COOKIE_NAME = "read_after_lsn"
+# Attribute of request.state holding the request's DBHandler.
+_STATE_KEY = "read_your_writes_handler"
+
+
+def get_read_after_lsn(request: Request) -> Optional[str]:
+    """Returns the LSN the client sent back from its latest write, or None if there is none or it is malformed."""
+    lsn = request.cookies.get(COOKIE_NAME, "").replace("-", "/")
+    if not lsn:
+        return None
+    try:
+        parse_lsn(lsn)
+    except ValueError:
+        logger.warning(f"Ignoring malformed {COOKIE_NAME} cookie.")
+        return None
+    return lsn
+
+
+def track_handler(request: Request, handler: DBHandler):
+    """Lets read_your_writes_middleware send the LSN of handler's writes to the client."""
+    setattr(request.state, _STATE_KEY, handler)
+
+
+async def read_your_writes_middleware(request: Request, call_next):
+    """
+    Keeps read-your-writes working when a client's requests reach different worker processes.
+
+    After a request writes on the primary, the primary LSN of the write is set
+    in a cookie that lasts READ_YOUR_WRITES_WINDOW_SECONDS. Requests that send
+    it back only read from replicas that have replayed that LSN, whichever
+    worker serves them. A forged cookie can at most send the client's own reads
+    to the primary.
+    """
+    response = await call_next(request)
+    handler: Optional[DBHandler] = getattr(request.state, _STATE_KEY, None)
+    if handler is not None and handler.write_lsn:
+        response.set_cookie(
+            COOKIE_NAME,
+            handler.write_lsn.replace("/", "-"),
+            max_age=max(1, math.ceil(READ_YOUR_WRITES_WINDOW_SECONDS)),
+            httponly=True,
+            samesite="strict"
+        )
+    return response
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -24,6 +24,36 @@ class Note(BaseModel):
     note_description: Optional[str] = None
     note_tags: Optional[str] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class NoteFields(BaseModel):
+    """Model for a note listed with only some of its fields; unrequested fields are left unset."""
+    note_id: int
+    note_title: Optional[str] = None
+    note_description: Optional[str] = None
+    note_tags: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class NoteChanges(BaseModel):
+    """Model for the changes to a user's notes since a sync token."""
+    notes: List[Note]
+    deleted: List[int]
+    token: str
+
+
+class TagCount(BaseModel):
+    tag: str
+    note_count: int
+
+
+class NoteStats(BaseModel):
+    """Model for a user's note statistics."""
+    note_count: int
+    last_activity_at: Optional[datetime] = None
+    tags: List[TagCount]
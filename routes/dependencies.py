@@ -1,29 +1,74 @@
 import logging
 
 from typing import Annotated
-from fastapi import  Depends, HTTPException, status
+from fastapi import  Depends, HTTPException, Request, status
 
+from admission import get_admission_controller
+from config import DB_LOCK_TIMEOUT_MS, DB_ROUTE_TIMEOUTS, DB_STATEMENT_TIMEOUT_MS
+from middleware.disconnect import get_query_canceller
+from middleware.read_your_writes import get_read_after_lsn, track_handler
 from security import verify_token
-from database.connection import start_conn
+from database.pool import get_conn, put_conn
 from database.db_handler import DBHandler
+from database.replicas import get_replica_router
+from database.sharding import get_shard_router
 
 logger = logging.getLogger(__name__)
 
-def get_db_handler():
-    conn = start_conn()
+def _route_timeouts(request: Request):
+    """Returns the (statement, lock) timeouts in milliseconds for the route serving request."""
+    route = request.scope.get("route")
+    if route is not None:
+        limits = DB_ROUTE_TIMEOUTS.get(f"{request.method} {route.path}")
+        if limits:
+            return limits
+    return DB_STATEMENT_TIMEOUT_MS, DB_LOCK_TIMEOUT_MS
+
+async def acquire_admission_slot():
+    """
+    Holds an in-flight slot for the rest of the request, or raises 503 when none frees up in time.
+
+    It is async so the wait happens on the event loop: a sync dependency would
+    already hold a threadpool thread while waiting, and with every thread
+    taken requests would queue for a thread and never reach the 503.
+    """
+    admission = get_admission_controller()
+    await admission.acquire()
+    try:
+        yield
+    finally:
+        admission.release()
+
+def get_db_handler(request: Request, _slot: Annotated[None, Depends(acquire_admission_slot)]):
+    conn = get_conn()
     if not conn:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Não foi possível conectar ao banco de dados."
-        ) 
-    
+        )
+
+    handler = DBHandler(conn, read_router=get_replica_router(), shard_router=get_shard_router())
+    handler.set_timeouts(*_route_timeouts(request))
+    handler.read_after_lsn = get_read_after_lsn(request)
+    track_handler(request, handler)
+    # Lets the disconnect middleware cancel the handler's queries if the client goes away.
+    canceller = get_query_canceller(request)
+    if canceller:
+        canceller.register(handler)
     try:
-        yield DBHandler(conn)
+        yield handler
     finally:
+        if canceller:
+            canceller.unregister(handler)
+        handler.close()
         if conn:
-            logging.info("Closing database connection.")
-            conn.close()
+            logging.info("Releasing database connection.")
+            put_conn(conn)
 
-AuthenticatedUserID = Annotated[int, Depends(verify_token)]
-DBHandlerInstance = Annotated[DBHandler, Depends(get_db_handler)]
+async def get_admitted_user_id(user_id: Annotated[int, Depends(verify_token)]) -> int:
+    """Returns the user_id from the token, or raises 429 if the user is over their rate limit."""
+    get_admission_controller().check_user(user_id)
+    return user_id
 
+AuthenticatedUserID = Annotated[int, Depends(get_admitted_user_id)]
+DBHandlerInstance = Annotated[DBHandler, Depends(get_db_handler)]
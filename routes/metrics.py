@@ -0,0 +1,29 @@
+import hmac
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from admission import get_admission_controller
+from config import METRICS_TOKEN
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+def verify_metrics_token(x_metrics_token: Optional[str] = Header(None)):
+    """Raises 404 when METRICS_TOKEN isn't set, so the route doesn't exist, and 403 when the header doesn't match it."""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_metrics_token or not hmac.compare_digest(x_metrics_token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid metrics token")
+
+@router.get("/metrics", tags=["Monitoring"], dependencies=[Depends(verify_metrics_token)])
+def get_metrics_api() -> Dict[str, Any]:
+    """
+    Returns this worker process's counters. Requires the `X-Metrics-Token`
+    header to match `METRICS_TOKEN`; the route is disabled while it is unset.
+
+    - admission: requests admitted, queued for a database slot, rejected by the
+      per-user rate limit (429) or shed because the in-flight cap was reached (503).
+    """
+    return {"admission": get_admission_controller().stats()}
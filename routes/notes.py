@@ -1,28 +1,49 @@
 import logging
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 
+from database.db_handler import NOTE_FIELDS
+from database.note_events import get_note_event_hub
 from services import notes_service
 from .dependencies import AuthenticatedUserID
 from .dependencies import DBHandlerInstance
-from models.notes_model import Note, NoteCreate, NoteUpdate
+from models.notes_model import Note, NoteChanges, NoteCreate, NoteFields, NoteStats, NoteUpdate
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-@router.get("/notes", response_model=List[Note], tags=["Notes"])
+@router.get("/notes", response_model=List[NoteFields], response_model_exclude_unset=True, tags=["Notes"])
 def get_my_notes_api(
     user_id: AuthenticatedUserID,
-    _db: DBHandlerInstance
+    _db: DBHandlerInstance,
+    fields: Optional[str] = None,
+    preview_chars: Optional[int] = Query(None, ge=1),
+    include_archived: bool = False
     ):
     """
     Retrieve all notes for the authenticated user.
+
+    - `fields`: comma-separated note fields to return, e.g. `note_title,created_at`;
+      `note_id` is always returned. Returns 400 for an unknown field.
+    - `preview_chars`: return only the first characters of `note_description`;
+      fetch the full note with `GET /notes/{note_id}`.
+    - `include_archived`: also return notes moved to the archive after a long time
+      without changes. Only recent notes are returned by default.
+
     Returns 404 if no notes are found.
     """
     logger.info(f"API: Request received for notes of user_id: {user_id}")
-    notes = notes_service.get_notes_by_user_id_service(_db, user_id)
+    notes = notes_service.get_notes_by_user_id_service(
+        _db, user_id, fields=fields, preview_chars=preview_chars, include_archived=include_archived
+    )
 
+    if notes == "invalid_fields":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid fields. Allowed fields: {', '.join(NOTE_FIELDS)}."
+        )
     if not notes:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -30,6 +51,98 @@ def get_my_notes_api(
         )
     return notes
 
+@router.get("/notes/changes", response_model=NoteChanges, tags=["Notes"])
+def get_my_note_changes_api(
+    user_id: AuthenticatedUserID,
+    _db: DBHandlerInstance,
+    since: Optional[str] = None,
+    include_archived: bool = False
+    ):
+    """
+    Retrieve the notes created or updated, and the ids of the notes deleted,
+    since the `since` token returned by a previous call.
+
+    Without `since`, every note is returned. Pass the returned `token` on the
+    next call. Returns 400 if the token is invalid; the client should then sync
+    again without one. With `include_archived`, archived notes are returned too;
+    without it, notes archived since the token are listed in `deleted`.
+    """
+    logger.info(f"API: Request received for note changes of user_id: {user_id}")
+    changes = notes_service.get_note_changes_service(_db, user_id, since, include_archived=include_archived)
+
+    if changes == "invalid_token":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid sync token."
+        )
+    if not isinstance(changes, dict):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Could not retrieve note changes due to a server error."
+        )
+    return changes
+
+@router.get("/notes/stats", response_model=NoteStats, tags=["Notes"])
+def get_my_note_stats_api(
+    user_id: AuthenticatedUserID,
+    _db: DBHandlerInstance
+    ):
+    """
+    Retrieve the authenticated user's note count, the number of notes per tag
+    and the time of their last note change.
+
+    The counters are maintained as notes are written, so this does not scan the notes.
+    """
+    logger.info(f"API: Request received for note stats of user_id: {user_id}")
+    stats = notes_service.get_note_stats_service(_db, user_id)
+
+    if stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Could not retrieve note stats due to a server error."
+        )
+    return stats
+
+@router.get("/notes/stream", tags=["Notes"])
+async def stream_my_note_events_api(
+    user_id: AuthenticatedUserID,
+    request: Request
+    ):
+    """
+    Streams create, update, delete and archive events for the authenticated
+    user's notes as Server-Sent Events.
+
+    Events only carry the op and note_id; fetch the notes themselves with
+    `GET /notes/changes`. No database connection is held while the stream is open.
+    """
+    logger.info(f"API: Note event stream requested by user_id: {user_id}")
+    return StreamingResponse(
+        notes_service.stream_note_events_service(get_note_event_hub(), user_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/notes/{note_id}", response_model=Note, tags=["Notes"])
+def get_my_note_api(
+    note_id: int,
+    user_id: AuthenticatedUserID,
+    _db: DBHandlerInstance
+    ):
+    """
+    Retrieve a single note of the authenticated user, with its full description,
+    whether or not it was archived.
+    Returns 404 if the note is not found or the user does not own it.
+    """
+    logger.info(f"API: Request received for note {note_id} of user_id: {user_id}")
+    note = notes_service.get_note_service(_db, user_id, note_id)
+
+    if note == "note_not_found":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Note with id {note_id} not found or access denied."
+        )
+    return note
+
 @router.post("/notes", response_model=Note, status_code=status.HTTP_201_CREATED, tags=["Notes"])
 def create_new_note_api(
     note_data: NoteCreate,
@@ -19,7 +19,7 @@ def get_all_users(
 ):
     """Retrieve a list of all usernames."""
     logger.info("API: Request received for all usernames.")
-    return users_service.get_all_usernames_service(_db)
+    return users_service.get_all_usernames_service(_db, _user_id)
 
 @router.get("/users/{username}", response_model=User, tags=["Users"])
 def get_user_by_username(
@@ -29,4 +29,4 @@ def get_user_by_username(
 ):
     """Retrieve a single user data by its username."""
     logger.info("API: Request received for all usernames.")
-    return users_service.get_user_by_username_service(_db,username)
\ No newline at end of file
+    return users_service.get_user_by_username_service(_db, username, _user_id)
\ No newline at end of file
@@ -1,10 +1,18 @@
+import asyncio
+import json
 import logging
-from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Dict, Any
 
-from database.db_handler import DBHandler
+from config import NOTES_STREAM_HEARTBEAT_SECONDS, NOTES_SYNC_OVERLAP_SECONDS
+from database.db_handler import NOTE_FIELDS, DBHandler
+from database.note_events import NoteEventHub
+from database.write_batcher import get_note_write_batcher
 
 logger = logging.getLogger(__name__)
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 
 def create_note_for_user_service(_db: DBHandler, user_id: int, note_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
@@ -19,7 +27,16 @@ def create_note_for_user_service(_db: DBHandler, user_id: int, note_data: Dict[s
         logger.warning(f"Service: Attempt to create note for non-existent user_id: {user_id}")
         return None
 
-    # 2. Create the note.
+    # 2. Create the note, coalescing it with concurrent inserts when batching is enabled.
+    batcher = get_note_write_batcher()
+    if batcher:
+        return batcher.submit(
+            user_id=user_id,
+            title=note_data["note_title"],
+            description=note_data.get("note_description"),
+            tags=note_data.get("note_tags"),
+            timeouts=_db.timeouts
+        )
     return _db.create_note(
         user_id=user_id,
         title=note_data["note_title"],
@@ -45,7 +62,7 @@ def update_note_service(_db: DBHandler, user_id: int, note_id: int, note_data: D
         return "user_not_found"
 
     # 2. Validate that the note exists and the user owns it.
-    note = _db.get_note_by_id(note_id)
+    note = _db.get_note_by_id(note_id, user_id=user_id, include_archived=True)
     if not note or note.get("user_id") != user_id:
         logger.warning(f"Service: Update access denied for note {note_id} by user {user_id}.")
         # Combine "not found" and "permission denied" to prevent leaking information.
@@ -57,7 +74,7 @@ def update_note_service(_db: DBHandler, user_id: int, note_id: int, note_data: D
         return note
 
     # 4. Perform the update.
-    return _db.update_note(note_id, note_data)
+    return _db.update_note(note_id, note_data, user_id=user_id)
 
 def delete_note_service(_db: DBHandler, user_id: int, note_id: int) -> str:
     """
@@ -77,14 +94,126 @@ def delete_note_service(_db: DBHandler, user_id: int, note_id: int) -> str:
         return "user_not_found"
 
     # 2. Validate that the note exists and the user owns it.
-    note = _db.get_note_by_id(note_id)
+    note = _db.get_note_by_id(note_id, user_id=user_id, include_archived=True)
     if not note or note.get("user_id") != user_id:
         logger.warning(f"Service: Delete access denied for note {note_id} by user {user_id}.")
         return "note_not_found"
 
     # 3. Perform the deletion.
-    return "success" if _db.delete_note(note_id) else "error"
+    return "success" if _db.delete_note(note_id, user_id=user_id) else "error"
+
+def get_notes_by_user_id_service(_db: DBHandler, user_id: int, fields: Optional[str] = None, preview_chars: Optional[int] = None,
+                                 include_archived: bool = False) -> Any:
+    """
+    Service to retrieve all notes for a given user ID.
+
+    fields is a comma-separated list of note fields to return; note_id is
+    always included so a truncated note can be fetched in full later.
+    Archived notes are only returned with include_archived.
+
+    Returns:
+        - A list of note dictionaries with only the requested fields.
+        - A string "invalid_fields" if fields names an unknown field.
+    """
+    selected = None
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        if any(field not in NOTE_FIELDS for field in requested):
+            logger.warning(f"Service: Invalid note fields requested by user_id {user_id}: {fields}")
+            return "invalid_fields"
+        selected = [field for field in NOTE_FIELDS if field == "note_id" or field in requested]
+    return _db.get_notes_by_user_id(user_id, fields=selected, preview_chars=preview_chars, include_archived=include_archived)
+
+def get_note_stats_service(_db: DBHandler, user_id: int) -> Optional[Dict[str, Any]]:
+    """Service to retrieve a user's note count, tag counts and last activity time."""
+    return _db.get_note_stats(user_id)
+
+def get_note_service(_db: DBHandler, user_id: int, note_id: int) -> Any:
+    """
+    Service to retrieve a single, complete note of a user.
+
+    Returns:
+        - A dictionary of the note on success.
+        - A string "note_not_found" if the note is not found or doesn't belong to the user.
+    """
+    note = _db.get_note_by_id(note_id, user_id=user_id, from_primary=False, include_archived=True)
+    if not note or note.get("user_id") != user_id:
+        return "note_not_found"
+    return note
+
+def _encode_sync_token(as_of: datetime) -> str:
+    """Encodes a point in time as an opaque sync token: microseconds since the epoch."""
+    return str((as_of - _EPOCH) // timedelta(microseconds=1))
+
+def _decode_sync_token(token: str) -> Optional[datetime]:
+    try:
+        microseconds = int(token)
+        if microseconds < 0:
+            return None
+        return _EPOCH + timedelta(microseconds=microseconds)
+    except (ValueError, OverflowError):
+        return None
+
+def get_note_changes_service(_db: DBHandler, user_id: int, since_token: Optional[str], include_archived: bool = False) -> Optional[Any]:
+    """
+    Service to retrieve the changes to a user's notes since a sync token.
 
-def get_notes_by_user_id_service(_db: DBHandler, user_id: int) -> List[Dict[str, Any]]:
-    """Service to retrieve all notes for a given user ID."""
-    return _db.get_notes_by_user_id(user_id)
\ No newline at end of file
+    Without a token every note is returned. The token is moved back by
+    NOTES_SYNC_OVERLAP_SECONDS, so a change committed just after the previous
+    token was issued is sent again rather than missed; clients apply changes idempotently.
+
+    Returns:
+        - A dictionary with "notes", "deleted" and the next "token" on success.
+        - A string "invalid_token" if since_token can't be decoded.
+        - None on database errors.
+    """
+    since = None
+    if since_token:
+        since = _decode_sync_token(since_token)
+        if since is None:
+            logger.warning(f"Service: Invalid sync token from user_id {user_id}.")
+            return "invalid_token"
+        since -= timedelta(seconds=NOTES_SYNC_OVERLAP_SECONDS)
+
+    changes = _db.get_note_changes(user_id, since, include_archived=include_archived)
+    if changes is None:
+        return None
+    return {"notes": changes["notes"], "deleted": changes["deleted"], "token": _encode_sync_token(changes["as_of"])}
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_note_events_service(
+    hub: NoteEventHub,
+    user_id: int,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    heartbeat_seconds: float = NOTES_STREAM_HEARTBEAT_SECONDS
+) -> AsyncIterator[str]:
+    """
+    Service that yields a user's note events as Server-Sent Events.
+
+    The stream opens with a "ready" event, after which the client should sync
+    its notes once. Then each change is sent as a "note" event with its op and
+    note_id, and "resync" is sent when events may have been lost. A comment is
+    sent every heartbeat_seconds of silence, to keep proxies from closing the
+    connection and to notice clients that went away.
+    """
+    subscription = hub.subscribe(user_id)
+    logger.info(f"Service: Note event stream opened for user_id {user_id} ({hub.subscriber_count()} open).")
+    try:
+        yield "retry: 3000\n\n" + _sse("ready", {})
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield ": heartbeat\n\n"
+                continue
+            if event.get("op") == "resync":
+                yield _sse("resync", {})
+            else:
+                yield _sse("note", event)
+    finally:
+        hub.unsubscribe(subscription)
+        logger.info(f"Service: Note event stream closed for user_id {user_id}.")
@@ -6,17 +6,17 @@ from database.db_handler import DBHandler
 logger = logging.getLogger(__name__)
 
 
-def get_all_usernames_service(db_handler: DBHandler) -> List[str]:
-    """Service to retrieve all usernames."""
-    return db_handler.get_all_usernames()
+def get_all_usernames_service(db_handler: DBHandler, user_id: Optional[int] = None) -> List[str]:
+    """Service to retrieve all usernames on behalf of the requesting user."""
+    return db_handler.get_all_usernames(user_id)
 
 
-def get_user_by_username_service(db_handler: DBHandler, username: str) -> Optional[Dict[str, Any]]:
+def get_user_by_username_service(db_handler: DBHandler, username: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
     """
-    Service to retrieve a single user by username.
+    Service to retrieve a single user by username on behalf of the requesting user.
     Returns user data as a dict or None if not found.
     """
-    return db_handler.get_user_by_username(username)
+    return db_handler.get_user_by_username(username, user_id)
 
 
 def login_or_create_user_service(db: DBHandler, username: str) -> Optional[Dict[str, Any]]:
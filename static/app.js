@@ -4,6 +4,15 @@ document.addEventListener('DOMContentLoaded', () => {
     // We will store the authentication token here in memory.
     // It will be lost on page refresh, which is a security trade-off for simplicity.
     let authToken = null;
+    // Local copy of the user's notes, keyed by note_id: { note, element }.
+    const noteStore = new Map();
+    // Token returned by the last call to /notes/changes, sent back to get only what changed since.
+    let syncToken = null;
+    // The sync currently running, and whether another one was requested meanwhile.
+    let syncInFlight = null;
+    let syncPending = false;
+    // Stops the note event stream of the current login, so logging in again doesn't leave it running.
+    let noteEventsController = null;
 
     // --- DOM ELEMENTS ---
     const loginForm = document.getElementById('login-form');
@@ -25,37 +34,132 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- API FUNCTIONS ---
 
     /**
-     * Fetches notes from the API and displays them on the page.
+     * Fetches the changes since the last sync and applies them to the page.
+     * Without a sync token (right after login) it fetches every note.
      */
-    const fetchAndDisplayNotes = async () => {
+    const syncNotes = async () => {
         if (!authToken) {
             console.error("Cannot fetch notes without an auth token.");
             return;
         }
 
+        // A sync started before logging in again must not apply the previous user's notes.
+        const requestToken = authToken;
+        // Only recent notes are listed; notes archived since the last sync come back as deleted.
+        const url = syncToken
+            ? `/notes/changes?since=${encodeURIComponent(syncToken)}`
+            : '/notes/changes';
         try {
-            const response = await fetch('/notes/', {
+            const response = await fetch(url, {
                 method: 'GET',
                 headers: {
                     // This is where we use the stored token!
-                    'Authorization': authToken,
+                    'Authorization': requestToken,
                 },
             });
+            if (authToken !== requestToken) {
+                return;
+            }
 
-            if (response.status === 404) {
-                notesList.innerHTML = '<p>Nenhuma nota encontrada. Crie uma!</p>';
+            if (response.status === 400 && syncToken) {
+                // The server no longer accepts our token: start over with a full sync.
+                syncToken = null;
+                await syncNotes();
                 return;
             }
+            if (!response.ok) {
+                throw new Error(`Unexpected status ${response.status}`);
+            }
 
-            const notes = await response.json();
-            renderNotes(notes);
+            const changes = await response.json();
+            if (authToken !== requestToken) {
+                return;
+            }
+            if (!syncToken) {
+                noteStore.clear();
+                notesList.innerHTML = '';
+            }
+            changes.notes.forEach(upsertNote);
+            changes.deleted.forEach(removeNote);
+            syncToken = changes.token;
+            renderEmptyState();
 
         } catch (error) {
             console.error('Failed to fetch notes:', error);
+            // Force a full sync next time, since the page no longer matches the store.
+            syncToken = null;
             notesList.innerHTML = '<p style="color: red;">Não foi possível carregar as notas.</p>';
         }
     };
 
+    /**
+     * Runs syncNotes, coalescing calls made while a sync is already running into one more sync.
+     * Every sync goes through here, so two syncs never race on syncToken and the note store.
+     */
+    const scheduleSync = () => {
+        if (syncInFlight) {
+            syncPending = true;
+            return;
+        }
+        syncInFlight = syncNotes().finally(() => {
+            syncInFlight = null;
+            if (syncPending) {
+                syncPending = false;
+                scheduleSync();
+            }
+        });
+    };
+
+    /**
+     * Listens to the note event stream and syncs the notes whenever the server reports a change,
+     * so changes made in other tabs show up without polling. EventSource can't send the
+     * Authorization header, so the stream is read with fetch. It reconnects after a pause if it drops.
+     * Calling it again, e.g. after logging in again, stops the stream it started before.
+     */
+    const listenForNoteEvents = async () => {
+        if (noteEventsController) {
+            noteEventsController.abort();
+        }
+        const controller = new AbortController();
+        noteEventsController = controller;
+        const { signal } = controller;
+
+        while (authToken && !signal.aborted) {
+            try {
+                const response = await fetch('/notes/stream', {
+                    method: 'GET',
+                    headers: { 'Authorization': authToken },
+                    signal,
+                });
+                if (!response.ok) {
+                    throw new Error(`Unexpected status ${response.status}`);
+                }
+
+                const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) {
+                        break;
+                    }
+                    buffer += value;
+                    const messages = buffer.split('\n\n');
+                    buffer = messages.pop();
+                    // "ready" and "resync" mean we may have missed events; either way, fetch the changes.
+                    if (messages.some(message => /^event: (ready|note|resync)$/m.test(message))) {
+                        scheduleSync();
+                    }
+                }
+            } catch (error) {
+                if (signal.aborted) {
+                    return;
+                }
+                console.error('Note event stream failed:', error);
+            }
+            await new Promise(resolve => setTimeout(resolve, 3000));
+        }
+    };
+
     // --- EVENT LISTENERS ---
 
     // Handle showing the create note form
@@ -80,8 +184,8 @@ document.addEventListener('DOMContentLoaded', () => {
                     });
 
                     if (response.ok) {
-                        // If deletion is successful, refresh the notes list
-                        await fetchAndDisplayNotes();
+                        // If deletion is successful, fetch what changed since the last sync
+                        scheduleSync();
                     } else {
                         const errorData = await response.json();
                         alert(`Erro ao apagar nota: ${errorData.detail}`);
@@ -131,7 +235,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 });
 
                 if (response.ok) {
-                    await fetchAndDisplayNotes(); // Refresh list on success
+                    scheduleSync(); // Apply the changes on success
                 } else {
                     const errorData = await response.json();
                     alert(`Erro ao atualizar nota: ${errorData.detail}`);
@@ -171,8 +275,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 createNoteForm.reset();
                 // Hide the form container after successful creation
                 createNoteContainer.style.display = 'none';
-                // Refresh the notes list to show the new note
-                await fetchAndDisplayNotes();
+                // Fetch what changed since the last sync, which includes the new note
+                scheduleSync();
             }
         } catch (error) {
             console.error('Failed to create note:', error);
@@ -221,7 +325,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 appSection.style.display = 'block';
 
                 // Immediately fetch and display the user's notes
-                await fetchAndDisplayNotes();
+                syncToken = null;
+                scheduleSync();
+
+                // Keep the list current with changes made elsewhere, e.g. in other tabs
+                listenForNoteEvents();
             }
         } catch (error) {
             // Handle network errors or issues with the fetch call itself
@@ -233,40 +341,88 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- RENDER FUNCTIONS ---
 
     /**
-     * Renders a list of note objects into the DOM.
-     * @param {Array<Object>} notes - The array of notes to display.
+     * Builds the DOM element for a single note.
+     * @param {Object} note - The note to display.
+     * @returns {HTMLElement} The note element.
      */
-    const renderNotes = (notes) => {
-        notesList.innerHTML = ''; // Clear current list
-        notes.forEach(note => {
-            const noteElement = document.createElement('div');
-            noteElement.className = 'note-item';
-
-            const tagsString = note.note_tags || '';
-            noteElement.innerHTML = `
-                <!-- Part 1: The content that is normally visible -->
-                <div class="note-display">
-                    <h4>${note.note_title}</h4>
-                    <p>${note.note_description || ''}</p>
-                    <small>Tags: ${tagsString || 'nenhuma'}</small>
-                    <div class="note-actions">
-                        <button class="edit-btn">Editar</button>
-                        <button class="delete-btn" data-note-id="${note.note_id}">Apagar</button>
-                    </div>
+    const buildNoteElement = (note) => {
+        const noteElement = document.createElement('div');
+        noteElement.className = 'note-item';
+        noteElement.dataset.noteId = note.note_id;
+
+        const tagsString = note.note_tags || '';
+        noteElement.innerHTML = `
+            <!-- Part 1: The content that is normally visible -->
+            <div class="note-display">
+                <h4>${note.note_title}</h4>
+                <p>${note.note_description || ''}</p>
+                <small>Tags: ${tagsString || 'nenhuma'}</small>
+                <div class="note-actions">
+                    <button class="edit-btn">Editar</button>
+                    <button class="delete-btn" data-note-id="${note.note_id}">Apagar</button>
+                </div>
+            </div>
+
+            <!-- Part 2: The hidden form for editing -->
+            <form class="note-edit-form" data-note-id="${note.note_id}" style="display: none;">
+                <input type="text" class="edit-title" value="${note.note_title}" required>
+                <textarea class="edit-description">${note.note_description || ''}</textarea>
+                <input type="text" class="edit-tags" value="${tagsString}">
+                <div class="note-actions">
+                    <button type="submit">Salvar</button>
+                    <button type="button" class="cancel-edit-btn">Cancelar</button>
                 </div>
+            </form>
+        `;
+        return noteElement;
+    };
 
-                <!-- Part 2: The hidden form for editing -->
-                <form class="note-edit-form" data-note-id="${note.note_id}" style="display: none;">
-                    <input type="text" class="edit-title" value="${note.note_title}" required>
-                    <textarea class="edit-description">${note.note_description || ''}</textarea>
-                    <input type="text" class="edit-tags" value="${tagsString}">
-                    <div class="note-actions">
-                        <button type="submit">Salvar</button>
-                        <button type="button" class="cancel-edit-btn">Cancelar</button>
-                    </div>
-                </form>
-            `;
-            notesList.appendChild(noteElement);
-        });
+    /**
+     * Adds a note to the store and the page, or replaces the one shown with the same id.
+     * New notes are placed so the list stays ordered by creation date, newest first.
+     * @param {Object} note - The created or updated note.
+     */
+    const upsertNote = (note) => {
+        const current = noteStore.get(note.note_id);
+        // Consecutive syncs can overlap; skip notes already shown at this version.
+        if (current && current.note.updated_at === note.updated_at) {
+            return;
+        }
+
+        const noteElement = buildNoteElement(note);
+        if (current) {
+            current.element.replaceWith(noteElement);
+        } else {
+            const createdAt = new Date(note.created_at);
+            const next = Array.from(noteStore.values())
+                .filter(entry => new Date(entry.note.created_at) < createdAt)
+                .sort((a, b) => new Date(b.note.created_at) - new Date(a.note.created_at))[0];
+            notesList.insertBefore(noteElement, next ? next.element : null);
+        }
+        noteStore.set(note.note_id, { note, element: noteElement });
+    };
+
+    /**
+     * Removes a deleted note from the store and the page, if it is shown.
+     * @param {number} noteId - The id of the deleted note.
+     */
+    const removeNote = (noteId) => {
+        const current = noteStore.get(noteId);
+        if (current) {
+            current.element.remove();
+            noteStore.delete(noteId);
+        }
+    };
+
+    /**
+     * Shows the "no notes" message when the store is empty, and hides it otherwise.
+     */
+    const renderEmptyState = () => {
+        const emptyMessage = notesList.querySelector('.empty-notes');
+        if (noteStore.size === 0 && !emptyMessage) {
+            notesList.insertAdjacentHTML('beforeend', '<p class="empty-notes">Nenhuma nota encontrada. Crie uma!</p>');
+        } else if (noteStore.size > 0 && emptyMessage) {
+            emptyMessage.remove();
+        }
     };
 });
\ No newline at end of file
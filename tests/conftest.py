@@ -18,16 +18,20 @@ from database.db_config import create_tables
 from database.db_handler import DBHandler
 from main import app
 
+def connect_test_db() -> connection:
+    """Abre uma nova conexão com o banco de dados de teste."""
+    return psycopg2.connect(dbname=TEST_POSTGRES_DB,
+                            user=TEST_POSTGRES_USER,
+                            password=TEST_POSTGRES_PASSWORD,
+                            host=TEST_POSTGRES_HOST,
+                            port=TEST_POSTGRES_PORT)
+
 @pytest.fixture(name="db_handler_test_instance")
 def db_handler_test_fixture():
     """
     Fixture que fornece uma conexão com o banco de dados de teste.
     """
-    conn = psycopg2.connect(dbname=TEST_POSTGRES_DB,
-                            user=TEST_POSTGRES_USER,
-                            password=TEST_POSTGRES_PASSWORD,
-                            host=TEST_POSTGRES_HOST,
-                            port=TEST_POSTGRES_PORT)
+    conn = connect_test_db()
     create_tables(conn) # Cria as tabelas antes do teste
     try:
         with conn.cursor() as cur:
@@ -39,6 +43,14 @@ def db_handler_test_fixture():
         if conn:
             conn.close()
 
+@pytest.fixture(name="db_connect")
+def db_connect_fixture():
+    """
+    Fixture que fornece uma fábrica de conexões com o banco de dados de teste,
+    para componentes que abrem suas próprias conexões.
+    """
+    return connect_test_db
+
 @pytest.fixture(name="client")
 def client_fixture(db_handler_test_instance: DBHandler):
     """
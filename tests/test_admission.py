@@ -0,0 +1,103 @@
+import asyncio
+from typing import Annotated, Any, Dict
+
+import pytest
+from fastapi import Depends, HTTPException
+from fastapi.testclient import TestClient
+
+import admission
+from admission import AdmissionController, InMemoryRateLimitBackend, RateLimitBackend, _load_backend
+from database.db_handler import DBHandler
+from main import app
+from routes import metrics
+from routes.dependencies import acquire_admission_slot, get_db_handler
+
+@pytest.fixture(name="strict_admission")
+def strict_admission_fixture(monkeypatch) -> AdmissionController:
+    """
+    Fixture que substitui o controle de admissão global por um com limites baixos.
+    """
+    controller = AdmissionController(user_rate=0.01, user_burst=2, max_in_flight=1, queue_timeout_ms=10)
+    monkeypatch.setattr(admission, "_controller", controller)
+    return controller
+
+def test_token_bucket_refills_over_time():
+    """Test that a bucket allows its burst, then refuses until a token has refilled."""
+    now = [0.0]
+    backend = InMemoryRateLimitBackend(clock=lambda: now[0])
+
+    assert [backend.take("k", rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert backend.take("k", rate=2, burst=3) == pytest.approx(0.5)
+    now[0] += 0.5
+    assert backend.take("k", rate=2, burst=3) == 0
+
+def test_user_over_rate_limit_gets_429(client: TestClient, authenticated_user: Dict[str, Any], strict_admission: AdmissionController):
+    """Test that requests over a user's burst are rejected with 429 and Retry-After."""
+    headers = authenticated_user["auth_headers"]
+
+    statuses = [client.get("/notes", headers=headers).status_code for _ in range(3)]
+    rejected = client.get("/notes", headers=headers)
+
+    assert statuses[:2] == [404, 404]
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert client.get("/metrics").status_code == 404
+
+def test_metrics_requires_token(client: TestClient, monkeypatch):
+    """Test that /metrics only answers requests carrying METRICS_TOKEN."""
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "s3cret")
+
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"X-Metrics-Token": "wrong"}).status_code == 403
+    response = client.get("/metrics", headers={"X-Metrics-Token": "s3cret"})
+    assert response.status_code == 200
+    assert "admitted" in response.json()["admission"]
+
+def test_in_flight_cap_sheds_load(strict_admission: AdmissionController):
+    """Test that a request finding every slot taken is shed with 503 instead of waiting."""
+    async def run():
+        await strict_admission.acquire()
+        try:
+            with pytest.raises(HTTPException) as rejected:
+                await strict_admission.acquire()
+        finally:
+            strict_admission.release()
+        await strict_admission.acquire()
+        strict_admission.release()
+        return rejected.value
+
+    rejected = asyncio.run(run())
+
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    assert strict_admission.stats() == {
+        "admitted": 2, "queued": 1, "rate_limited": 0, "shed": 1, "in_flight": 0, "max_in_flight": 1
+    }
+
+def test_busy_server_answers_503(client: TestClient, authenticated_user: Dict[str, Any], db_handler_test_instance: DBHandler,
+                                 strict_admission: AdmissionController):
+    """Test that the 503 reaches the client when every slot is held, before the request takes a thread."""
+    # Mantém a etapa de admissão de get_db_handler, trocando só a conexão pela de teste.
+    def override_get_db_handler(_slot: Annotated[None, Depends(acquire_admission_slot)]):
+        yield db_handler_test_instance
+
+    app.dependency_overrides[get_db_handler] = override_get_db_handler
+    headers = authenticated_user["auth_headers"]
+    asyncio.run(strict_admission.acquire())
+    try:
+        busy = client.get("/notes", headers=headers)
+    finally:
+        strict_admission.release()
+
+    assert busy.status_code == 503
+    assert busy.headers["Retry-After"] == "1"
+    assert client.get("/notes", headers=headers).status_code == 404
+    assert strict_admission.stats()["in_flight"] == 0
+
+def test_backend_is_pluggable():
+    """Test that ADMISSION_RATE_LIMIT_BACKEND names a RateLimitBackend subclass, which must implement take."""
+    assert isinstance(_load_backend("admission:InMemoryRateLimitBackend"), InMemoryRateLimitBackend)
+    with pytest.raises(TypeError):
+        _load_backend("admission:AdmissionController")
+    with pytest.raises(TypeError):
+        RateLimitBackend()
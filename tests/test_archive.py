@@ -0,0 +1,99 @@
+import json
+from typing import Any, Dict
+
+from fastapi.testclient import TestClient
+
+from database.archive_notes import archive_notes
+from database.db_handler import DBHandler
+from database.note_events import NOTE_EVENTS_CHANNEL
+
+def _age_notes(db_handler: DBHandler, *note_ids: int):
+    """Faz as notas parecerem sem alterações há um ano."""
+    conn = db_handler.conn
+    with conn.cursor() as cur:
+        cur.execute("UPDATE notes SET updated_at = now() - interval '1 year' WHERE note_id = ANY(%s);", (list(note_ids),))
+    conn.commit()
+
+def test_archived_notes_stay_reachable(client: TestClient, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that archived notes leave the default listing but can still be read, listed and synced."""
+    user_id = authenticated_user["user_id"]
+    headers = authenticated_user["auth_headers"]
+    old = db_handler_test_instance.create_note(user_id, "Old", "Long forgotten", "work")
+    recent = db_handler_test_instance.create_note(user_id, "Recent", None, "work")
+    _age_notes(db_handler_test_instance, old["note_id"])
+
+    assert archive_notes(db_handler_test_instance.conn, older_than_days=30, batch_size=1) == 1
+
+    listed = client.get("/notes", headers=headers).json()
+    assert [note["note_id"] for note in listed] == [recent["note_id"]]
+    listed = client.get("/notes", params={"include_archived": "true"}, headers=headers).json()
+    assert sorted(note["note_id"] for note in listed) == [old["note_id"], recent["note_id"]]
+    changes = client.get("/notes/changes", params={"include_archived": "true"}, headers=headers).json()
+    assert old["note_id"] in [note["note_id"] for note in changes["notes"]]
+
+    response = client.get(f"/notes/{old['note_id']}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["note_description"] == "Long forgotten"
+
+    stats = client.get("/notes/stats", headers=headers).json()
+    assert stats["note_count"] == 2
+    assert stats["tags"] == [{"tag": "work", "note_count": 2}]
+
+def test_writes_to_archived_notes(client: TestClient, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that updating an archived note brings it back and deleting one removes it from the archive."""
+    user_id = authenticated_user["user_id"]
+    headers = authenticated_user["auth_headers"]
+    kept = db_handler_test_instance.create_note(user_id, "Kept", None, "a")
+    dropped = db_handler_test_instance.create_note(user_id, "Dropped", None, "b")
+    _age_notes(db_handler_test_instance, kept["note_id"], dropped["note_id"])
+    archive_notes(db_handler_test_instance.conn, older_than_days=30)
+    token = client.get("/notes/changes", params={"include_archived": "true"}, headers=headers).json()["token"]
+
+    response = client.put(f"/notes/{kept['note_id']}", json={"note_title": "Kept again"}, headers=headers)
+    assert response.status_code == 200
+    response = client.delete(f"/notes/{dropped['note_id']}", headers=headers)
+    assert response.status_code == 204
+
+    listed = client.get("/notes", headers=headers).json()
+    assert [(note["note_id"], note["note_title"]) for note in listed] == [(kept["note_id"], "Kept again")]
+    assert client.get("/notes", params={"include_archived": "true"}, headers=headers).json() == listed
+    changes = client.get("/notes/changes", params={"include_archived": "true", "since": token}, headers=headers).json()
+    assert [note["note_id"] for note in changes["notes"]] == [kept["note_id"]]
+    assert changes["deleted"] == [dropped["note_id"]]
+    stats = client.get("/notes/stats", headers=headers).json()
+    assert stats["note_count"] == 1
+    assert stats["tags"] == [{"tag": "a", "note_count": 1}]
+
+def test_archiving_is_announced_to_clients(client: TestClient, db_connect, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that archived notes are sent as archive events and as deletions to syncs of recent notes only."""
+    user_id = authenticated_user["user_id"]
+    headers = authenticated_user["auth_headers"]
+    old = db_handler_test_instance.create_note(user_id, "Old", None, None)
+    recent = db_handler_test_instance.create_note(user_id, "Recent", None, None)
+    _age_notes(db_handler_test_instance, old["note_id"])
+    token = client.get("/notes/changes", headers=headers).json()["token"]
+    listener = db_connect()
+    listener.autocommit = True
+    try:
+        with listener.cursor() as cur:
+            cur.execute(f"LISTEN {NOTE_EVENTS_CHANNEL};")
+
+        assert archive_notes(db_handler_test_instance.conn, older_than_days=30) == 1
+
+        listener.poll()
+        events = [json.loads(notify.payload) for notify in listener.notifies]
+    finally:
+        listener.close()
+    assert events == [{"user_id": user_id, "op": "archive", "note_id": old["note_id"]}]
+    hot = client.get("/notes/changes", params={"since": token}, headers=headers).json()
+    assert hot["deleted"] == [old["note_id"]]
+    assert [note["note_id"] for note in hot["notes"]] == [recent["note_id"]]
+    everything = client.get("/notes/changes", params={"since": token, "include_archived": "true"}, headers=headers).json()
+    assert everything["deleted"] == []
+
+def test_updating_a_missing_note_returns_none(db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that updating a note found in neither table returns None and leaves the connection usable."""
+    user_id = authenticated_user["user_id"]
+
+    assert db_handler_test_instance.update_note(999999, {"note_title": "Nowhere"}, user_id) is None
+    assert db_handler_test_instance.create_note(user_id, "Still works", None, None) is not None
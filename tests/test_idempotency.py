@@ -0,0 +1,86 @@
+import asyncio
+from typing import Any, Dict
+
+import pytest
+from fastapi.testclient import TestClient
+
+from database.db_handler import DBHandler
+from middleware import idempotency
+from middleware.idempotency import IdempotencyStore, StoredResponse
+
+@pytest.fixture(autouse=True)
+def fresh_store(monkeypatch):
+    """
+    Fixture que isola o armazenamento de chaves de idempotência de cada teste.
+    """
+    monkeypatch.setattr(idempotency, "_store", IdempotencyStore())
+
+def test_retried_post_replays_the_first_note(client: TestClient, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that a retry with the same key returns the stored note without creating another one."""
+    headers = {**authenticated_user["auth_headers"], "Idempotency-Key": "create-1"}
+    note_data = {"note_title": "Only once"}
+
+    first = client.post("/notes", json=note_data, headers=headers)
+    retry = client.post("/notes", json=note_data, headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(db_handler_test_instance.get_notes_by_user_id(authenticated_user["user_id"])) == 1
+
+def test_key_reused_for_another_request_is_rejected(client: TestClient, authenticated_user: Dict[str, Any]):
+    """Test that reusing a key with a different payload gets 422 instead of the stored result."""
+    headers = {**authenticated_user["auth_headers"], "Idempotency-Key": "create-2"}
+
+    client.post("/notes", json={"note_title": "First"}, headers=headers)
+    reused = client.post("/notes", json={"note_title": "Second"}, headers=headers)
+
+    assert reused.status_code == 422
+
+def test_concurrent_duplicate_waits_for_the_first():
+    """Test that a duplicate arriving mid-flight waits and then gets the first result."""
+    store = IdempotencyStore(max_keys=10, ttl_seconds=60)
+
+    async def scenario():
+        state, entry = store.begin((1, "k"), "fp")
+        assert state == "execute"
+        duplicate_state, duplicate_entry = store.begin((1, "k"), "fp")
+        assert duplicate_state == "wait"
+
+        async def finish():
+            await asyncio.sleep(0.01)
+            store.complete(entry, StoredResponse(201, b"{}", [(b"content-type", b"application/json")]))
+
+        await asyncio.gather(duplicate_entry.done.wait(), finish())
+        return store.begin((1, "k"), "fp")
+
+    state, entry = asyncio.run(scenario())
+
+    assert state == "replay"
+    assert entry.response.status_code == 201
+
+def test_running_requests_are_never_evicted():
+    """Test that a full store evicts finished entries only, so a retry of a running request still waits for it."""
+    store = IdempotencyStore(max_keys=2, ttl_seconds=60)
+
+    async def scenario():
+        _, running = store.begin((1, "running"), "fp")
+        _, finished = store.begin((1, "finished"), "fp")
+        store.complete(finished, StoredResponse(201, b"{}", []))
+        store.begin((1, "new"), "fp")
+        return store.begin((1, "running"), "fp")[0], store.begin((1, "finished"), "fp")[0]
+
+    assert asyncio.run(scenario()) == ("wait", "execute")
+
+def test_replay_keeps_every_header():
+    """Test that a replayed response carries all the stored headers, repeated ones included."""
+    headers = [
+        (b"content-type", b"application/json"), (b"content-length", b"2"), (b"location", b"/notes/1"),
+        (b"set-cookie", b"a=1"), (b"set-cookie", b"b=2"),
+    ]
+
+    replayed = StoredResponse(201, b"{}", headers).to_response()
+
+    assert replayed.status_code == 201
+    assert replayed.body == b"{}"
+    assert replayed.raw_headers == [*headers, (b"idempotent-replayed", b"true")]
@@ -0,0 +1,84 @@
+import asyncio
+import json
+from typing import Any, Dict
+
+from database.db_handler import DBHandler
+from database.note_events import RESYNC_EVENT, NoteEventHub
+from services.notes_service import stream_note_events_service
+
+def test_note_writes_are_pushed_to_the_owners_subscribers(db_connect, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that create, update and delete notify the owner's subscribers and no one else."""
+    user_id = authenticated_user["user_id"]
+    other_user = db_handler_test_instance.create_user("otheruser")
+    hub = NoteEventHub([db_connect])
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        mine = hub.subscribe(user_id)
+        theirs = hub.subscribe(other_user["user_id"])
+        assert await loop.run_in_executor(None, hub.listening.wait, 5)
+
+        def write():
+            note = db_handler_test_instance.create_note(user_id, "Live", None, None)
+            db_handler_test_instance.update_note(note["note_id"], {"note_title": "Live 2"}, user_id=user_id)
+            db_handler_test_instance.delete_note(note["note_id"], user_id=user_id)
+            return note["note_id"]
+
+        note_id = await loop.run_in_executor(None, write)
+        events = [await asyncio.wait_for(mine.queue.get(), timeout=5) for _ in range(3)]
+        return note_id, events, theirs.queue.qsize()
+
+    try:
+        note_id, events, other_count = asyncio.run(scenario())
+    finally:
+        hub.stop(timeout=5)
+
+    assert events == [
+        {"op": "create", "note_id": note_id},
+        {"op": "update", "note_id": note_id},
+        {"op": "delete", "note_id": note_id},
+    ]
+    assert other_count == 0
+
+def test_slow_subscriber_gets_a_resync_instead_of_a_backlog():
+    """Test that a full subscriber queue is replaced by a single resync event."""
+    hub = NoteEventHub([], max_queue_size=2)
+
+    async def scenario():
+        subscription = hub.subscribe(1)
+        for note_id in range(5):
+            hub._dispatch(json.dumps({"user_id": 1, "op": "create", "note_id": note_id}))
+        await asyncio.sleep(0.05)
+        return [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+
+    try:
+        queued = asyncio.run(scenario())
+    finally:
+        hub.stop(timeout=5)
+
+    assert queued == [RESYNC_EVENT]
+
+def test_event_stream_sends_heartbeats_and_events():
+    """Test the SSE framing of the stream and that closing it unsubscribes."""
+    hub = NoteEventHub([])
+
+    async def not_disconnected():
+        return False
+
+    async def scenario():
+        stream = stream_note_events_service(hub, 1, not_disconnected, heartbeat_seconds=0.05)
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        hub._dispatch(json.dumps({"user_id": 1, "op": "update", "note_id": 7}))
+        chunks.append(await stream.__anext__())
+        await stream.aclose()
+        return chunks
+
+    try:
+        chunks = asyncio.run(scenario())
+    finally:
+        hub.stop(timeout=5)
+
+    assert "event: ready" in chunks[0]
+    assert chunks[1] == ": heartbeat\n\n"
+    assert chunks[2] == 'event: note\ndata: {"op": "update", "note_id": 7}\n\n'
+    assert hub.subscriber_count() == 0
@@ -0,0 +1,42 @@
+from typing import Any, Dict
+
+from fastapi.testclient import TestClient
+
+from database.db_handler import DBHandler
+from database.reconcile_stats import reconcile
+
+def test_stats_follow_note_writes(client: TestClient, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that creating, updating and deleting notes keeps the counters in step."""
+    user_id = authenticated_user["user_id"]
+    headers = authenticated_user["auth_headers"]
+    first = db_handler_test_instance.create_note(user_id, "One", None, "work, Ideas")
+    db_handler_test_instance.create_notes_bulk([(user_id, "Two", None, "work"), (user_id, "Three", None, None)])
+    db_handler_test_instance.update_note(first["note_id"], {"note_tags": "ideas,home"}, user_id=user_id)
+    db_handler_test_instance.delete_note(first["note_id"], user_id=user_id)
+
+    response = client.get("/notes/stats", headers=headers)
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["note_count"] == 2
+    assert stats["tags"] == [{"tag": "work", "note_count": 1}]
+    assert stats["last_activity_at"] is not None
+
+def test_reconcile_repairs_drift(db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that the reconciliation job reports and fixes counters that drifted from the notes."""
+    user_id = authenticated_user["user_id"]
+    db_handler_test_instance.create_note(user_id, "One", None, "a,b")
+    db_handler_test_instance.create_note(user_id, "Two", None, "a")
+    conn = db_handler_test_instance.conn
+    with conn.cursor() as cur:
+        cur.execute("UPDATE user_note_stats SET note_count = 7 WHERE user_id = %s;", (user_id,))
+        cur.execute("DELETE FROM user_tag_stats WHERE user_id = %s AND tag = 'b';", (user_id,))
+    conn.commit()
+
+    assert reconcile(conn, batch_size=1, dry_run=True) == [user_id]
+    assert reconcile(conn, batch_size=1) == [user_id]
+    assert reconcile(conn, batch_size=1) == []
+
+    stats = db_handler_test_instance.get_note_stats(user_id)
+    assert stats["note_count"] == 2
+    assert stats["tags"] == [{"tag": "a", "note_count": 2}, {"tag": "b", "note_count": 1}]
@@ -110,3 +110,63 @@ def test_delete_note_not_found(client: TestClient, authenticated_user: Dict[str,
     """Test deleting a note that does not exist."""
     response = client.delete("/notes/99999", headers=authenticated_user["auth_headers"])
     assert response.status_code == 404
+
+def test_note_changes_returns_only_what_changed(client: TestClient, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any], monkeypatch):
+    """Test that a delta sync returns the notes changed and the ids deleted since the token."""
+    # Sem margem de sobreposição, para que o delta contenha apenas as mudanças posteriores ao token
+    monkeypatch.setattr("services.notes_service.NOTES_SYNC_OVERLAP_SECONDS", 0)
+    user_id = authenticated_user["user_id"]
+    auth_headers = authenticated_user["auth_headers"]
+
+    kept = db_handler_test_instance.create_note(user_id, "Kept", "...", None)
+    updated = db_handler_test_instance.create_note(user_id, "Before", "...", None)
+    deleted = db_handler_test_instance.create_note(user_id, "Deleted", "...", None)
+
+    full = client.get("/notes/changes", headers=auth_headers)
+    assert full.status_code == 200
+    assert {n["note_id"] for n in full.json()["notes"]} == {kept["note_id"], updated["note_id"], deleted["note_id"]}
+    assert full.json()["deleted"] == []
+
+    client.put(f"/notes/{updated['note_id']}", json={"note_title": "After"}, headers=auth_headers)
+    client.delete(f"/notes/{deleted['note_id']}", headers=auth_headers)
+    created = client.post("/notes", json={"note_title": "New"}, headers=auth_headers).json()
+
+    delta = client.get("/notes/changes", params={"since": full.json()["token"]}, headers=auth_headers)
+
+    assert delta.status_code == 200
+    data = delta.json()
+    assert {n["note_id"]: n["note_title"] for n in data["notes"]} == {updated["note_id"]: "After", created["note_id"]: "New"}
+    assert data["deleted"] == [deleted["note_id"]]
+    assert int(data["token"]) > int(full.json()["token"])
+
+def test_note_changes_invalid_token(client: TestClient, authenticated_user: Dict[str, Any]):
+    """Test that an unreadable sync token is rejected with 400."""
+    response = client.get("/notes/changes", params={"since": "not-a-token"}, headers=authenticated_user["auth_headers"])
+    assert response.status_code == 400
+
+def test_get_notes_with_fields_and_preview(client: TestClient, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that a listing returns only the requested fields and truncated descriptions."""
+    db_handler_test_instance.create_note(authenticated_user["user_id"], "Long", "abcdefghij", "tag")
+
+    response = client.get("/notes?fields=note_title,note_description&preview_chars=4", headers=authenticated_user["auth_headers"])
+
+    assert response.status_code == 200
+    note = response.json()[0]
+    assert set(note) == {"note_id", "note_title", "note_description"}
+    assert note["note_description"] == "abcd"
+
+    invalid = client.get("/notes?fields=note_title,user_id", headers=authenticated_user["auth_headers"])
+    assert invalid.status_code == 400
+
+def test_get_single_note(client: TestClient, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test fetching one full note, and that another user's note is not found."""
+    note = db_handler_test_instance.create_note(authenticated_user["user_id"], "Full", "abcdefghij", None)
+    other_user = db_handler_test_instance.create_user("other_user")
+    other_note = db_handler_test_instance.create_note(other_user["user_id"], "Hidden", None, None)
+
+    response = client.get(f"/notes/{note['note_id']}", headers=authenticated_user["auth_headers"])
+    hidden = client.get(f"/notes/{other_note['note_id']}", headers=authenticated_user["auth_headers"])
+
+    assert response.status_code == 200
+    assert response.json()["note_description"] == "abcdefghij"
+    assert hidden.status_code == 404
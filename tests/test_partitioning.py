@@ -0,0 +1,82 @@
+import pytest
+
+from database import partition_notes
+from database.db_config import create_tables, notes_table_commands, notes_table_kind
+from database.db_handler import DBHandler
+from database.partition_notes import migrate
+
+@pytest.fixture(name="schema_conn")
+def schema_conn_fixture(db_connect):
+    """
+    Fixture que fornece uma conexão cujo search_path aponta para um schema vazio,
+    para testar layouts da tabela de notas sem afetar os demais testes.
+    """
+    conn = db_connect()
+    with conn.cursor() as cur:
+        cur.execute("DROP SCHEMA IF EXISTS partition_test CASCADE;")
+        cur.execute("CREATE SCHEMA partition_test;")
+        cur.execute("SET search_path TO partition_test;")
+    conn.commit()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("DROP SCHEMA partition_test CASCADE;")
+        conn.commit()
+        conn.close()
+
+def test_create_tables_with_hash_partitions(schema_conn):
+    """Test that the notes table is created hash-partitioned and still serves the handler."""
+    create_tables(schema_conn, partitions=4)
+    handler = DBHandler(schema_conn)
+    user = handler.create_user("partitioned")
+
+    note = handler.create_note(user["user_id"], "In a partition", None, None)
+
+    assert notes_table_kind(schema_conn) == "partitioned"
+    assert handler.get_note_by_id(note["note_id"], user_id=user["user_id"])["note_title"] == "In a partition"
+    with schema_conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = 'notes'::regclass;")
+        assert cur.fetchone()[0] == 4
+
+def test_migrate_existing_table_to_partitions(schema_conn):
+    """Test that the online migration copies every note and swaps the partitioned table in."""
+    create_tables(schema_conn, partitions=0)
+    handler = DBHandler(schema_conn)
+    users = [handler.create_user(f"user{i}")["user_id"] for i in range(3)]
+    created = [handler.create_note(user_id, f"Note {n}", "...", None) for n in range(5) for user_id in users]
+    handler.delete_note(created[0]["note_id"])
+
+    migrate(schema_conn, partitions=4, batch_size=4)
+
+    assert notes_table_kind(schema_conn) == "partitioned"
+    assert notes_table_kind(schema_conn, "notes_unpartitioned") == "plain"
+    assert sum(len(handler.get_notes_by_user_id(user_id)) for user_id in users) == len(created) - 1
+    new_note = handler.create_note(users[0], "After migration", None, None)
+    assert new_note["note_id"] > max(note["note_id"] for note in created)
+    assert handler.get_note_stats(users[0])["note_count"] == 5
+
+def test_writes_during_migration_are_mirrored(schema_conn):
+    """Test that writes made between the trigger install and the swap end up in the partitioned table."""
+    create_tables(schema_conn, partitions=0)
+    handler = DBHandler(schema_conn)
+    user_id = handler.create_user("busy")["user_id"]
+    kept = handler.create_note(user_id, "Kept", None, None)
+    removed = handler.create_note(user_id, "Removed", None, None)
+    columns = partition_notes._columns(schema_conn)
+    with schema_conn.cursor() as cur:
+        for command in notes_table_commands(partition_notes.NEW_TABLE, 4):
+            cur.execute(command)
+    schema_conn.commit()
+    partition_notes._install_mirror_trigger(schema_conn, columns)
+
+    handler.update_note(kept["note_id"], {"note_title": "Kept and edited"})
+    handler.delete_note(removed["note_id"])
+    handler.create_note(user_id, "Added", None, None)
+    partition_notes._backfill(schema_conn, columns, batch_size=1, pause=0)
+    partition_notes._swap(schema_conn, drop_old=True, lock_timeout_ms=1000, attempts=1)
+
+    titles = sorted(note["note_title"] for note in handler.get_notes_by_user_id(user_id))
+    assert titles == ["Added", "Kept and edited"]
+    assert notes_table_kind(schema_conn, "notes_unpartitioned") is None
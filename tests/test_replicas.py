@@ -0,0 +1,87 @@
+from typing import Any, Dict
+
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+from database.db_handler import DBHandler
+from database.replicas import ReplicaRouter, parse_lsn
+from main import app
+from middleware.read_your_writes import COOKIE_NAME, get_read_after_lsn, track_handler
+from routes.dependencies import get_db_handler
+
+def test_reads_are_routed_to_replica(db_connect, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that user-scoped reads run on the replica connection picked by the router."""
+    user_id = authenticated_user["user_id"]
+    db_handler_test_instance.create_note(user_id, "Replicated", None, None)
+    router = ReplicaRouter(["replica-1"], connect=lambda dsn: db_connect())
+    handler = DBHandler(db_handler_test_instance.conn, read_router=router)
+
+    try:
+        notes = handler.get_notes_by_user_id(user_id)
+        assert handler._replica is not None
+    finally:
+        handler.close()
+
+    assert [note["note_title"] for note in notes] == ["Replicated"]
+
+def test_unreachable_replica_fails_over_to_primary(db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that a replica that cannot be reached is marked unhealthy and the primary serves the read."""
+    user_id = authenticated_user["user_id"]
+    db_handler_test_instance.create_note(user_id, "From primary", None, None)
+    router = ReplicaRouter(["replica-down"], retry_after_seconds=60, connect=lambda dsn: None)
+    handler = DBHandler(db_handler_test_instance.conn, read_router=router)
+
+    notes = handler.get_notes_by_user_id(user_id)
+
+    assert [note["note_title"] for note in notes] == ["From primary"]
+    assert router.acquire() is None # Still inside the retry window
+
+def test_write_records_lsn_for_read_your_writes(db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that a write remembers the user's LSN only for the configured window."""
+    user_id = authenticated_user["user_id"]
+    router = ReplicaRouter(["replica-1"], window_seconds=60, connect=lambda dsn: None)
+    handler = DBHandler(db_handler_test_instance.conn, read_router=router)
+
+    handler.create_note(user_id, "Fresh", None, None)
+
+    assert router.required_lsn(user_id) is not None
+    assert router.required_lsn(user_id + 1) is None
+
+    router.window_seconds = 0
+    router.record_write(user_id, "0/0")
+    assert router.required_lsn(user_id) is None
+
+def test_write_lsn_cookie_reaches_other_workers(db_connect, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any], monkeypatch):
+    """Test that a write hands its LSN to the client and a worker that didn't see the write waits for it."""
+    user_id = authenticated_user["user_id"]
+    writer = ReplicaRouter(["replica-1"], connect=lambda dsn: db_connect())
+    # Outro processo: não sabe nada da escrita além do cookie enviado pelo cliente
+    reader = ReplicaRouter(["replica-1"], connect=lambda dsn: db_connect())
+    routers = [writer, reader]
+    checked = []
+    monkeypatch.setattr(reader, "has_replayed", lambda conn, lsn: checked.append(lsn) or False)
+
+    def override_get_db_handler(request: Request):
+        handler = DBHandler(db_handler_test_instance.conn, read_router=routers.pop(0))
+        handler.read_after_lsn = get_read_after_lsn(request)
+        track_handler(request, handler)
+        try:
+            yield handler
+        finally:
+            handler.close()
+
+    app.dependency_overrides[get_db_handler] = override_get_db_handler
+    try:
+        with TestClient(app) as client:
+            created = client.post("/notes", json={"note_title": "Fresh"}, headers=authenticated_user["auth_headers"])
+            lsn = created.cookies[COOKIE_NAME].replace("-", "/")
+            listed = client.get("/notes", headers=authenticated_user["auth_headers"])
+    finally:
+        app.dependency_overrides.clear()
+
+    assert created.status_code == 201
+    assert parse_lsn(lsn) > 0
+    assert checked == [lsn]
+    assert reader.required_lsn(user_id) is None
+    # The replica hadn't replayed the write, so the read went to the primary and saw it.
+    assert [note["note_title"] for note in listed.json()] == ["Fresh"]
@@ -0,0 +1,107 @@
+from collections import Counter
+from typing import Any, Dict
+
+import psycopg2
+import pytest
+
+from config import TEST_POSTGRES_SHARD_DSNS
+from database.archive_notes import archive_notes
+from database.db_config import create_shard_tables
+from database.db_handler import DBHandler
+from database.replicas import ReplicaRouter
+from database.reshard import move_user
+from database.sharding import HashRing, ShardRouter
+
+@pytest.fixture(name="shard_router")
+def shard_router_fixture():
+    """
+    Fixture que prepara os bancos de teste usados como nós de sharding.
+    Os testes que a usam são ignorados se TEST_POSTGRES_SHARD_DSNS não estiver configurado.
+    """
+    if len(TEST_POSTGRES_SHARD_DSNS) < 2:
+        pytest.skip("TEST_POSTGRES_SHARD_DSNS needs at least two databases.")
+    for index, dsn in enumerate(TEST_POSTGRES_SHARD_DSNS):
+        conn = psycopg2.connect(dsn)
+        try:
+            create_shard_tables(conn, index)
+            with conn.cursor() as cur:
+                cur.execute("TRUNCATE TABLE notes, notes_archive, note_deletions, shard_moved_users, user_note_stats, user_tag_stats RESTART IDENTITY;")
+            conn.commit()
+        finally:
+            conn.close()
+    return ShardRouter(TEST_POSTGRES_SHARD_DSNS)
+
+def _shard_titles(dsn: str, user_id: int):
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT note_title FROM notes WHERE user_id = %s ORDER BY note_id;", (user_id,))
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+def test_hash_ring_spreads_users_and_moves_few_on_growth():
+    """Test that the ring balances users and that adding a node only moves users onto that node."""
+    three = HashRing(3)
+    four = HashRing(4)
+    placements = {user_id: three.node_for(user_id) for user_id in range(1, 10001)}
+
+    counts = Counter(placements.values())
+    assert all(2500 < count < 4200 for count in counts.values())
+
+    moved = [user_id for user_id, index in placements.items() if four.node_for(user_id) != index]
+    assert all(four.node_for(user_id) == 3 for user_id in moved)
+    assert len(moved) < 3500
+
+def test_notes_are_stored_on_the_users_shard(shard_router: ShardRouter, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that note operations for a user are routed to the node the ring assigns them."""
+    user_id = authenticated_user["user_id"]
+    read_router = ReplicaRouter(["replica-1"], connect=lambda dsn: None)
+    handler = DBHandler(db_handler_test_instance.conn, read_router=read_router, shard_router=shard_router)
+    home = shard_router.shard_for(user_id, handler.conn)
+
+    try:
+        note = handler.create_note(user_id, "Sharded", None, None)
+        handler.update_note(note["note_id"], {"note_tags": "a"}, user_id=user_id)
+        notes = handler.get_notes_by_user_id(user_id)
+    finally:
+        handler.close()
+
+    assert [n["note_title"] for n in notes] == ["Sharded"]
+    # The write went to a shard, which replicas of the primary don't copy.
+    assert read_router.required_lsn(user_id) is None
+    assert _shard_titles(TEST_POSTGRES_SHARD_DSNS[home], user_id) == ["Sharded"]
+    assert _shard_titles(TEST_POSTGRES_SHARD_DSNS[1 - home], user_id) == []
+
+def test_move_user_between_shards(shard_router: ShardRouter, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that a moved user's notes, archived ones included, keep their ids and that a stale router follows the move."""
+    user_id = authenticated_user["user_id"]
+    stale_router = ShardRouter(TEST_POSTGRES_SHARD_DSNS)
+    handler = DBHandler(db_handler_test_instance.conn, shard_router=stale_router)
+    home = stale_router.shard_for(user_id, handler.conn)
+    created = [handler.create_note(user_id, f"Note {i}", "...", None) for i in range(5)]
+    handler.close()
+    conn = psycopg2.connect(TEST_POSTGRES_SHARD_DSNS[home])
+    try:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE notes SET updated_at = now() - interval '1 year' WHERE note_id = %s;", (created[0]["note_id"],))
+        conn.commit()
+        assert archive_notes(conn, older_than_days=30) == 1
+    finally:
+        conn.close()
+
+    moved_count = move_user(shard_router, db_handler_test_instance.conn, user_id, 1 - home, batch_size=2)
+
+    assert moved_count == 5
+    assert _shard_titles(TEST_POSTGRES_SHARD_DSNS[home], user_id) == []
+    # The stale router still points at the old node and must follow the user to the new one.
+    try:
+        notes = handler.get_notes_by_user_id(user_id, include_archived=True)
+        new_note = handler.create_note(user_id, "After move", None, None)
+        stats = handler.get_note_stats(user_id)
+    finally:
+        handler.close()
+    assert sorted(n["note_id"] for n in notes) == sorted(n["note_id"] for n in created)
+    assert new_note is not None
+    assert "After move" in _shard_titles(TEST_POSTGRES_SHARD_DSNS[1 - home], user_id)
+    assert stats["note_count"] == 6
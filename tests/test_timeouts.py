@@ -0,0 +1,156 @@
+import asyncio
+import importlib
+import time
+from typing import Any, Dict
+
+import psycopg2
+import pytest
+from fastapi.testclient import TestClient
+
+import config
+from database.db_handler import DBHandler
+from main import app
+from routes import dependencies
+from services import notes_service
+from middleware.disconnect import SCOPE_KEY, DisconnectCancelMiddleware, QueryCanceller
+
+@pytest.fixture(name="locker")
+def locker_fixture(db_connect):
+    """
+    Fixture que fornece uma segunda conexão para segurar locks durante o teste.
+    """
+    conn = db_connect()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+def test_lock_wait_past_lock_timeout_returns_503(client: TestClient, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any], locker):
+    """Test that an update stuck behind another transaction's row lock gives up with 503."""
+    note = db_handler_test_instance.create_note(authenticated_user["user_id"], "Locked", None, None)
+    with locker.cursor() as cur:
+        cur.execute("SELECT 1 FROM notes WHERE note_id = %s FOR UPDATE;", (note["note_id"],))
+    db_handler_test_instance.set_timeouts(5000, 100)
+
+    response = client.put(f"/notes/{note['note_id']}", json={"note_title": "Changed"}, headers=authenticated_user["auth_headers"])
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_query_past_statement_timeout_returns_504(client: TestClient, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any], locker):
+    """Test that a listing running past the statement timeout is canceled with 504."""
+    with locker.cursor() as cur:
+        cur.execute("LOCK TABLE notes IN ACCESS EXCLUSIVE MODE;")
+    db_handler_test_instance.set_timeouts(200, 0)
+
+    response = client.get("/notes", headers=authenticated_user["auth_headers"])
+
+    assert response.status_code == 504
+
+def test_disconnect_cancels_running_query(db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any], locker):
+    """Test that a client disconnect cancels the query its request is waiting on."""
+    with locker.cursor() as cur:
+        cur.execute("LOCK TABLE notes IN ACCESS EXCLUSIVE MODE;")
+    db_handler_test_instance.set_timeouts(0, 0)
+    outcome = {}
+
+    async def app(scope, receive, send):
+        canceller = scope[SCOPE_KEY]
+        canceller.register(db_handler_test_instance)
+        started = time.monotonic()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, db_handler_test_instance.get_notes_by_user_id, authenticated_user["user_id"])
+        except psycopg2.errors.QueryCanceled:
+            outcome["canceled_after"] = time.monotonic() - started
+        finally:
+            canceller.unregister(db_handler_test_instance)
+
+    async def receive():
+        await asyncio.sleep(0.2)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    asyncio.run(DisconnectCancelMiddleware(app)({"type": "http", "method": "GET", "path": "/notes"}, receive, send))
+    db_handler_test_instance.conn.rollback()
+
+    assert outcome["canceled_after"] < 5
+
+def test_close_resets_timeouts(db_handler_test_instance: DBHandler):
+    """Test that the timeouts of a request don't stay on its connection once the handler releases it."""
+    conn = db_handler_test_instance.conn
+    db_handler_test_instance.set_timeouts(1234, 567)
+
+    def settings():
+        with conn.cursor() as cur:
+            cur.execute("SELECT current_setting('statement_timeout'), current_setting('lock_timeout');")
+            values = cur.fetchone()
+        conn.rollback()
+        return values
+
+    during = settings()
+    db_handler_test_instance.close()
+
+    assert during == ("1234ms", "567ms")
+    assert settings() == ("0", "0")
+
+def test_cancel_between_queries_stops_later_ones(db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that a cancel arriving while no query runs makes the handler's later queries fail without running."""
+    user_id = authenticated_user["user_id"]
+    canceller = QueryCanceller()
+    canceller.register(db_handler_test_instance)
+
+    assert canceller.cancel() == 1
+    with pytest.raises(psycopg2.errors.QueryCanceled):
+        db_handler_test_instance.create_note(user_id, "Too late", None, None)
+    with pytest.raises(psycopg2.errors.QueryCanceled):
+        db_handler_test_instance.get_notes_by_user_id(user_id)
+
+    with db_handler_test_instance.conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM notes;")
+        assert cur.fetchone()[0] == 0
+
+@pytest.fixture(name="route_timeouts")
+def route_timeouts_fixture(monkeypatch):
+    """
+    Fixture que define DB_ROUTE_TIMEOUTS pelo ambiente e recarrega config, como na inicialização da aplicação.
+    """
+    monkeypatch.setenv("DB_ROUTE_TIMEOUTS", " GET  /notes = 1234:567 ;PUT /notes/{note_id}=3000:1000")
+    try:
+        importlib.reload(config)
+        monkeypatch.setattr(dependencies, "DB_ROUTE_TIMEOUTS", config.DB_ROUTE_TIMEOUTS)
+        yield config.DB_ROUTE_TIMEOUTS
+    finally:
+        monkeypatch.delenv("DB_ROUTE_TIMEOUTS")
+        importlib.reload(config)
+
+def test_route_timeouts_apply_to_their_route_and_are_reset(authenticated_user: Dict[str, Any], route_timeouts, monkeypatch):
+    """Test that a request gets its route's timeouts from DB_ROUTE_TIMEOUTS and its connection is reset on release."""
+    assert route_timeouts == {"GET /notes": (1234, 567), "PUT /notes/{note_id}": (3000, 1000)}
+    seen = {}
+
+    def settings(conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT current_setting('statement_timeout'), current_setting('lock_timeout');")
+            return cur.fetchone()
+
+    list_notes = notes_service.get_notes_by_user_id_service
+    def spy_list_notes(_db, *args, **kwargs):
+        seen["during"] = settings(_db.conn)
+        return list_notes(_db, *args, **kwargs)
+
+    put_conn = dependencies.put_conn
+    def spy_put_conn(conn):
+        seen["released"] = settings(conn)
+        put_conn(conn)
+
+    monkeypatch.setattr(notes_service, "get_notes_by_user_id_service", spy_list_notes)
+    monkeypatch.setattr(dependencies, "put_conn", spy_put_conn)
+    # Sem a fixture client, get_db_handler roda de verdade, com uma conexão do pool.
+    with TestClient(app) as client:
+        response = client.get("/notes", headers=authenticated_user["auth_headers"])
+
+    assert response.status_code == 404
+    assert seen == {"during": ("1234ms", "567ms"), "released": ("0", "0")}
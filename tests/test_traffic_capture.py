@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from benchmarks.replay_traffic import load_capture, replay
+from config import SECRET_TOKEN
+from main import app
+from middleware import capture
+from middleware.capture import TrafficCaptureMiddleware, TrafficRecorder
+from routes import metrics
+
+def _echo_app(recorder: TrafficRecorder, sample_rate: float) -> FastAPI:
+    """Cria uma aplicação mínima que devolve o corpo recebido, com a captura instalada."""
+    echo = FastAPI()
+    echo.add_middleware(TrafficCaptureMiddleware, recorder=recorder, sample_rate=sample_rate)
+
+    @echo.post("/echo")
+    async def echo_route(request: Request):
+        return {"received": (await request.json())["text"], "token": f"{SECRET_TOKEN} id=1"}
+
+    return echo
+
+def test_capture_redacts_tokens_and_rotates(tmp_path):
+    """Test that sampled requests are written with the token redacted and that the capture file rotates."""
+    recorder = TrafficRecorder(str(tmp_path), max_bytes=1, backups=2)
+    with TestClient(_echo_app(recorder, 1.0)) as client:
+        for n in range(3):
+            response = client.post("/echo?n=1", json={"text": f"hello {n}"}, headers={"Authorization": f"{SECRET_TOKEN} id=7"})
+            assert response.status_code == 200
+    recorder.close()
+
+    name = os.path.basename(recorder.path)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [name, f"{name}.1", f"{name}.2"]
+    records = load_capture(str(tmp_path))
+    assert [json.loads(record["body"])["text"] for record in records] == ["hello 1", "hello 2"]
+    record = records[0]
+    assert record["method"] == "POST" and record["path"] == "/echo" and record["query"] == "n=1"
+    assert record["headers"]["authorization"] == "[REDACTED]"
+    assert record["user_id"] == 7
+    assert record["status"] == 200
+    # The response carries the secret token, so not even its digest is kept.
+    assert "response_sha256" not in record
+    assert all(SECRET_TOKEN not in path.read_text() for path in tmp_path.iterdir())
+
+def test_capture_redacts_secrets_split_across_chunks(tmp_path):
+    """Test that a response whose secret token is split across two body chunks gets no digest."""
+    recorder = TrafficRecorder(str(tmp_path))
+    half = len(SECRET_TOKEN) // 2
+
+    async def split_app(scope, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": f"token {SECRET_TOKEN[:half]}".encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": f"{SECRET_TOKEN[half:]} id=1".encode()})
+
+    # Sem o bloco "with", o TestClient não envia os eventos de lifespan, que split_app não trata.
+    client = TestClient(TrafficCaptureMiddleware(split_app, recorder=recorder, sample_rate=1.0))
+    response = client.post("/login", content=f"secret={SECRET_TOKEN}")
+    recorder.close()
+
+    assert response.text == f"token {SECRET_TOKEN} id=1"
+    [record] = load_capture(str(tmp_path))
+    assert "response_sha256" not in record
+    assert record["body"] == "secret=[REDACTED]"
+
+def test_capture_redacts_metrics_token(tmp_path, monkeypatch):
+    """Test that the metrics token is redacted from the headers and body of a captured /metrics request."""
+    token = "super-secret-metrics"
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", token)
+    monkeypatch.setattr(capture, "METRICS_TOKEN", token)
+    recorder = TrafficRecorder(str(tmp_path))
+    monitored = _echo_app(recorder, 1.0)
+    monitored.include_router(metrics.router)
+
+    with TestClient(monitored) as client:
+        response = client.get("/metrics", headers={"X-Metrics-Token": token})
+        client.post("/echo", json={"text": token})
+    recorder.close()
+
+    assert response.status_code == 200
+    scraped, echoed = load_capture(str(tmp_path))
+    assert scraped["path"] == "/metrics"
+    assert scraped["headers"]["x-metrics-token"] == "[REDACTED]"
+    assert json.loads(echoed["body"]) == {"text": "[REDACTED]"}
+    assert all(token not in path.read_text() for path in tmp_path.iterdir())
+
+def test_capture_stops_keeping_the_body_once_truncated(tmp_path, monkeypatch):
+    """Test that chunks arriving after one that passed the body cap are not spliced into the stored body."""
+    monkeypatch.setattr(capture, "TRAFFIC_CAPTURE_MAX_BODY_BYTES", 8)
+    recorder = TrafficRecorder(str(tmp_path))
+    chunks = [
+        {"type": "http.request", "body": b"abc", "more_body": True},
+        {"type": "http.request", "body": b"0123456789", "more_body": True},
+        {"type": "http.request", "body": b"xyz", "more_body": False},
+    ]
+
+    async def reading_app(scope, receive, send):
+        while (await receive()).get("more_body"):
+            pass
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return chunks.pop(0)
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "POST", "path": "/upload", "query_string": b"", "headers": []}
+    asyncio.run(TrafficCaptureMiddleware(reading_app, recorder=recorder, sample_rate=1.0)(scope, receive, send))
+    recorder.close()
+
+    [line] = open(recorder.path, encoding="utf-8").read().splitlines()
+    record = json.loads(line)
+    assert record["body_truncated"] is True
+    assert record["body"] == "abc"
+    # A truncated request can't be replayed.
+    assert load_capture(str(tmp_path)) == []
+
+def test_capture_samples(tmp_path):
+    """Test that requests outside the sample are not recorded."""
+    recorder = TrafficRecorder(str(tmp_path))
+    with TestClient(_echo_app(recorder, 0.0)) as client:
+        client.post("/echo", json={"text": "skipped"})
+    recorder.close()
+
+    assert load_capture(str(tmp_path)) == []
+
+def test_replay_reports_latency_and_mismatches(client: TestClient, authenticated_user: Dict[str, Any]):
+    """Test that a replay re-signs requests for the captured user and reports status mismatches."""
+    user_id = authenticated_user["user_id"]
+    base = {"query": "", "headers": {"authorization": "[REDACTED]", "content-type": "application/json"}, "user_id": user_id,
+            "response_bytes": 0, "duration_ms": 1.0}
+    records = [
+        {**base, "ts": 100.0, "method": "POST", "path": "/notes", "body": json.dumps({"note_title": "Replayed"}), "status": 201},
+        {**base, "ts": 100.01, "method": "GET", "path": "/notes", "body": "", "status": 200},
+        {**base, "ts": 100.02, "method": "GET", "path": "/notes/999999", "body": "", "status": 200},
+    ]
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver") as replay_client:
+            return await replay(records, replay_client, speed=10, concurrency=1)
+
+    report = asyncio.run(run())
+
+    assert report["total"]["count"] == 3
+    assert report["total"]["errors"] == 0
+    assert report["routes"]["GET /notes"]["count"] == 1
+    assert report["routes"]["GET /notes/{id}"]["mismatches"] == 1
+    assert report["mismatches"] == [{
+        "route": "GET /notes/{id}", "method": "GET", "url": "/notes/999999",
+        "expected": {"status": 200}, "got": {"status": 404},
+    }]
+    assert [note["note_title"] for note in client.get("/notes", headers=authenticated_user["auth_headers"]).json()] == ["Replayed"]
+
+def test_replay_counts_malformed_records_as_errors(tmp_path):
+    """Test that a record whose body can't be decoded is counted as an error and the replay goes on."""
+    base = {"query": "", "headers": {}, "user_id": None, "response_bytes": 0, "duration_ms": 1.0, "status": 200}
+    records = [
+        {**base, "ts": 1.0, "method": "POST", "path": "/echo", "body": "not base64!", "body_encoding": "base64"},
+        {**base, "ts": 1.0, "method": "POST", "path": "/echo", "body": json.dumps({"text": "fine"})},
+    ]
+
+    recorder = TrafficRecorder(str(tmp_path))
+
+    async def run():
+        transport = httpx.ASGITransport(app=_echo_app(recorder, 0.0))
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as replay_client:
+            return await replay(records, replay_client, speed=0, concurrency=1)
+
+    report = asyncio.run(run())
+    recorder.close()
+
+    assert report["total"]["count"] == 2
+    assert report["total"]["errors"] == 1
+    assert report["mismatches"] == []
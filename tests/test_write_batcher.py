@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+import pytest
+from psycopg2.errors import LockNotAvailable
+
+import database.db_handler
+from database.db_handler import DBHandler
+from database.write_batcher import NoteWriteBatcher, WriteBatchTimeout
+
+def test_bulk_insert_returns_rows_in_order(db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that a multi-row insert returns one created note per input row, in order."""
+    user_id = authenticated_user["user_id"]
+    rows = [(user_id, f"Note {i}", f"Desc {i}", None) for i in range(5)]
+
+    created = db_handler_test_instance.create_notes_bulk(rows)
+
+    assert [note["note_title"] for note in created] == [f"Note {i}" for i in range(5)]
+    assert len(db_handler_test_instance.get_notes_by_user_id(user_id)) == 5
+
+def test_bulk_insert_isolates_failing_rows(db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any]):
+    """Test that one invalid row fails alone while the rest of the batch is committed."""
+    user_id = authenticated_user["user_id"]
+    rows = [
+        (user_id, "Good 1", None, None),
+        (user_id, "x" * 300, None, None), # Too long for VARCHAR(255)
+        (user_id, "Good 2", None, None),
+    ]
+
+    created = db_handler_test_instance.create_notes_bulk(rows)
+
+    assert created[0]["note_title"] == "Good 1"
+    assert created[1] is None
+    assert created[2]["note_title"] == "Good 2"
+    assert len(db_handler_test_instance.get_notes_by_user_id(user_id)) == 2
+
+def test_batcher_coalesces_concurrent_submits(db_connect, db_handler_test_instance: DBHandler, authenticated_user: Dict[str, Any], monkeypatch):
+    """Test that concurrent callers share multi-row INSERTs and each get their own row back from the batcher."""
+    user_id = authenticated_user["user_id"]
+    # Conta as execuções do INSERT de várias linhas; cada uma é uma ida ao banco
+    batch_sizes = []
+    execute_values = database.db_handler.execute_values
+    def counting_execute_values(cur, sql, rows, *args, **kwargs):
+        batch_sizes.append(len(rows))
+        return execute_values(cur, sql, rows, *args, **kwargs)
+    monkeypatch.setattr(database.db_handler, "execute_values", counting_execute_values)
+    batcher = NoteWriteBatcher(connect=db_connect, max_batch_size=8, max_wait_ms=20)
+    titles = [f"Concurrent {i}" for i in range(20)] + ["y" * 300]
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(titles)) as pool:
+            results = list(pool.map(lambda title: batcher.submit(user_id, title, None, None), titles))
+    finally:
+        batcher.stop()
+
+    assert [note["note_title"] for note in results[:-1]] == titles[:-1]
+    assert results[-1] is None
+    assert len(db_handler_test_instance.get_notes_by_user_id(user_id)) == 20
+    assert sum(batch_sizes) == len(titles)
+    assert len(batch_sizes) < len(titles)
+
+def test_batcher_raises_timeouts_to_callers(db_connect, authenticated_user: Dict[str, Any]):
+    """Test that a batched insert gives up at the caller's lock timeout and the caller gets the error."""
+    locker = db_connect()
+    batcher = NoteWriteBatcher(connect=db_connect, max_wait_ms=1)
+    try:
+        with locker.cursor() as cur:
+            cur.execute("LOCK TABLE notes IN ACCESS EXCLUSIVE MODE;")
+        with pytest.raises(LockNotAvailable):
+            batcher.submit(authenticated_user["user_id"], "Blocked", None, None, timeouts=(5000, 100))
+        locker.rollback()
+        assert batcher.submit(authenticated_user["user_id"], "Unblocked", None, None, timeouts=(5000, 100))["note_title"] == "Unblocked"
+    finally:
+        batcher.stop()
+        locker.rollback()
+        locker.close()
+
+def test_stalled_batcher_doesnt_hang_callers(db_connect, monkeypatch):
+    """Test that a caller whose batch never finishes gets WriteBatchTimeout instead of waiting forever."""
+    batcher = NoteWriteBatcher(connect=db_connect, max_wait_ms=1)
+    release = threading.Event()
+
+    def stalled_create_notes(rows, timeouts):
+        release.wait()
+        return [None] * len(rows)
+
+    monkeypatch.setattr(batcher, "_create_notes", stalled_create_notes)
+    try:
+        with pytest.raises(WriteBatchTimeout):
+            batcher.submit(1, "Stuck", None, None, timeouts=(100, 0))
+    finally:
+        release.set()
+        batcher.stop(timeout=5)